@@ -3,6 +3,7 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
 from app.config import config
+from multiprocessing import current_process
 import os
 from datetime import timedelta
 
@@ -17,6 +18,7 @@ def create_app(config_name='default'):
     
     # Load configuration
     app.config.from_object(config[config_name])
+    app.config['CONFIG_NAME'] = config_name
     config[config_name].init_app(app)
     
     # Security configurations
@@ -53,6 +55,22 @@ def create_app(config_name='default'):
             app.logger.error(f"Error creating database tables: {str(e)}")
             raise
     
+    # Memory-map the persisted similarity index
+    from app.services.similarity_index import SimilarityIndex
+    SimilarityIndex().init_app(app)
+    
+    # Bind the notification delivery workers and stream broadcaster to this application
+    from app.services.notification_queue import NotificationQueue
+    from app.services.notification_broadcaster import NotificationBroadcaster
+    NotificationQueue().init_app(app)
+    NotificationBroadcaster().init_app(app)
+    
+    # Start the scheduled jobs when enabled, but never in tests or in multiprocessing
+    # workers: spawned workers re-import the entry module and call create_app() again
+    if app.config.get('SCHEDULER_ENABLED') and not app.testing and current_process().name == 'MainProcess':
+        from app.utils.scheduler import start_scheduler
+        start_scheduler(app)
+    
     return app
 
 # Import models after db is defined
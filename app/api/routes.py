@@ -3,8 +3,10 @@ from flask_login import login_required, current_user
 import requests
 import os
 from . import api
-from ..models import db, Movie, Book, MovieAdaptation, Review, WatchHistory, ReadHistory
+from ..models import db, Movie, Book, MovieAdaptation, Review, ReadHistory
 from ..services.adaptation_service import AdaptationService
+from ..services.activity_timeline import ActivityTimeline, DEFAULT_LIMIT
+from ..services.tmdb_service import genre_names
 
 # Initialize the adaptation service
 adaptation_service = AdaptationService()
@@ -58,7 +60,8 @@ def log_movie():
                 tmdb_id=data['movieID'],
                 title=movie_details.get('title'),
                 releaseDate=movie_details.get('release_date'),
-                overview=movie_details.get('overview')
+                overview=movie_details.get('overview'),
+                genres=genre_names(movie_details)
             )
             db.session.add(movie)
             db.session.commit()
@@ -167,21 +170,16 @@ def leave_adaptation_feedback():
 def get_user_history():
     """
     Process Viewpoint - View History workflow:
-    1. Fetch user's watch and read history
-    2. Return formatted history
+    1. Fetch one page of the user's activity timeline (limit, cursor)
+    2. Return the items and the cursor of the next page
     """
-    watch_history = WatchHistory.query.filter_by(userID=current_user.userID).all()
-    read_history = ReadHistory.query.filter_by(userID=current_user.userID).all()
-
-    history = {
-        'watched_movies': [{
-            'title': Movie.query.get(entry.movieID).title,
-            'date': entry.watched_date.isoformat()
-        } for entry in watch_history],
-        'read_books': [{
-            'title': Book.query.get(entry.bookID).title,
-            'date': entry.read_date.isoformat()
-        } for entry in read_history]
-    }
+    try:
+        history = ActivityTimeline().page(
+            current_user.UserId,
+            limit=request.args.get('limit', DEFAULT_LIMIT, type=int),
+            cursor=request.args.get('cursor')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
     return jsonify(history), 200
@@ -50,6 +50,27 @@ class Config:
         'pool_recycle': 1800,
     }
 
+    # Recommendation cache: seconds between background sweeps for stale entries
+    RECOMMENDATION_CACHE_POLL_SECONDS = int(os.getenv('RECOMMENDATION_CACHE_POLL_SECONDS', 30))
+
+    # Notification delivery: worker threads, and the most jobs / longest wait (ms) per batch
+    NOTIFICATION_WORKERS = int(os.getenv('NOTIFICATION_WORKERS', 2))
+    NOTIFICATION_BATCH_SIZE = int(os.getenv('NOTIFICATION_BATCH_SIZE', 200))
+    NOTIFICATION_BATCH_MS = int(os.getenv('NOTIFICATION_BATCH_MS', 250))
+    # Seconds within which unread notifications about the same subject are merged; 0 disables
+    NOTIFICATION_COALESCE_SECONDS = float(os.getenv('NOTIFICATION_COALESCE_SECONDS', 300))
+    # Notification stream: seconds between broadcaster polls and between idle heartbeats
+    NOTIFICATION_STREAM_POLL_SECONDS = float(os.getenv('NOTIFICATION_STREAM_POLL_SECONDS', 2))
+    NOTIFICATION_STREAM_HEARTBEAT_SECONDS = float(os.getenv('NOTIFICATION_STREAM_HEARTBEAT_SECONDS', 15))
+
+    # Scheduled jobs (retention, refreshes, precompute): run by one process per host when enabled
+    SCHEDULER_ENABLED = os.getenv('SCHEDULER_ENABLED', 'false').lower() == 'true'
+    # Nightly database backup to Azure blob storage; needs azure-storage-blob installed
+    BACKUP_ENABLED = os.getenv('BACKUP_ENABLED', 'false').lower() == 'true'
+
+    # Similarity index: directory holding the memory-mapped TF-IDF segment
+    SIMILARITY_INDEX_PATH = os.getenv('SIMILARITY_INDEX_PATH')
+
 class DevelopmentConfig(Config):
     """Development configuration."""
     DEBUG = True
@@ -68,11 +89,16 @@ class ProductionConfig(Config):
     DEVELOPMENT = False
     SQLALCHEMY_DATABASE_URI = os.getenv('SQLALCHEMY_DATABASE_URI')
 
+class BenchmarkConfig(Config):
+    """Offline benchmark configuration; its database is dropped and regenerated on every run."""
+    SQLALCHEMY_DATABASE_URI = os.getenv('BENCHMARK_DATABASE_URI', 'sqlite:///benchmark.db')
+
 # Dictionary to map environment names to config objects
 config = {
     'development': DevelopmentConfig,
     'testing': TestingConfig,
     'production': ProductionConfig,
+    'benchmark': BenchmarkConfig,
     'default': DevelopmentConfig
 }
 
@@ -3,14 +3,25 @@ Main routes for the Film Adaptation Tracker application.
 This module handles all the main API endpoints for the application.
 """
 
-from flask import render_template, request, jsonify, current_app
+from flask import render_template, request, jsonify, current_app, stream_with_context
 from flask_login import login_required, current_user
 from . import main
 from ..models import Movie, Book, MovieAdaptation, Review, Watchlist, db
 from ..services.adaptation_service import AdaptationService
-from ..services.recommendation_service import RecommendationService
+from ..services.recommendation_cache import RecommendationCache
+from ..services.similarity_index import SimilarityIndex
+from ..services.cross_media_service import CrossMediaService
+from ..services.trending_service import TrendingService
+from ..services.report_engine import last_days
 from ..services.analytics_service import AnalyticsService
-from ..services.notification_service import NotificationService
+from ..services.analytics_cache import AnalyticsCache, etag_for
+from ..services.analytics_rollup import AnalyticsRollup
+from ..services.activity_timeline import ActivityTimeline, DEFAULT_LIMIT
+from ..services.activity_sketches import ActivitySketches
+from ..utils.user_export import CONTENT_TYPES, iter_user_export, export_filename
+from ..services.notification_service import NotificationService, DEFAULT_PAGE_SIZE as NOTIFICATION_PAGE_SIZE
+from ..services.notification_queue import NotificationQueue
+from ..services.notification_broadcaster import NotificationBroadcaster
 from datetime import datetime
 from sqlalchemy.exc import SQLAlchemyError
 
@@ -89,6 +100,59 @@ def filter_movies():
         current_app.logger.error(f"Error filtering movies: {str(e)}")
         return jsonify({'error': 'Failed to filter movies'}), 500
 
+@main.route('/api/movies/<int:movie_id>/similar')
+def get_similar_movies(movie_id):
+    """Get movies and adaptations with similar overviews from the local index."""
+    limit = request.args.get('limit', 10, type=int)
+    try:
+        results = SimilarityIndex().more_like_this('movie', movie_id, k=limit,
+                                                   kinds=['movie', 'adaptation'])
+        return jsonify({'similar': _with_titles(results)}), 200
+    except Exception as e:
+        current_app.logger.error(f"Error getting similar movies for {movie_id}: {str(e)}")
+        return jsonify({'error': 'Failed to get similar movies'}), 500
+
+@main.route('/api/books/<int:book_id>/similar')
+def get_similar_books(book_id):
+    """Get books with similar descriptions from the local index."""
+    limit = request.args.get('limit', 10, type=int)
+    try:
+        results = SimilarityIndex().more_like_this('book', book_id, k=limit, kinds=['book'])
+        return jsonify({'similar': _with_titles(results)}), 200
+    except Exception as e:
+        current_app.logger.error(f"Error getting similar books for {book_id}: {str(e)}")
+        return jsonify({'error': 'Failed to get similar books'}), 500
+
+@main.route('/api/trending')
+def get_trending():
+    """Get what is trending on AJTracker for a kind ('movie', 'book', 'adaptation') and window."""
+    kind = request.args.get('kind', 'movie')
+    window = request.args.get('window', 'day')
+    limit = request.args.get('limit', 10, type=int)
+    try:
+        results = TrendingService().top(kind, window, limit)
+        return jsonify({'kind': kind, 'window': window, 'trending': _with_titles(results)}), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"Error getting trending {kind}: {str(e)}")
+        return jsonify({'error': 'Failed to get trending items'}), 500
+
+def _with_titles(results):
+    """Attach titles to similarity results with one query per kind."""
+    sources = {
+        'movie': (Movie.movieID, Movie.title),
+        'book': (Book.BookId, Book.Title),
+        'adaptation': (MovieAdaptation.MovieAdaptationId, MovieAdaptation.Title)
+    }
+    titles = {}
+    for kind, (id_column, title_column) in sources.items():
+        ids = [r['id'] for r in results if r['kind'] == kind]
+        if ids:
+            rows = db.session.execute(db.select(id_column, title_column).where(id_column.in_(ids)))
+            titles.update({(kind, ref_id): title for ref_id, title in rows})
+    return [dict(r, title=titles.get((r['kind'], r['id']))) for r in results]
+
 @main.route('/api/watchlist', methods=['GET', 'POST', 'DELETE'])
 @login_required
 def manage_watchlist():
@@ -129,6 +193,8 @@ def manage_watchlist():
                 userID=current_user.userID,
                 movieID=movie_id
             ).delete()
+            # Bulk deletes bypass mapper events, so invalidate explicitly
+            RecommendationCache().invalidate(current_user.UserId)
             db.session.commit()
             return jsonify({'message': 'Removed from watchlist'}), 200
     except SQLAlchemyError as e:
@@ -144,41 +210,227 @@ def manage_watchlist():
 def get_recommendations():
     """Get personalized movie recommendations based on user preferences and history."""
     try:
-        service = RecommendationService()
-        recommendations = service.get_recommendations(current_user)
-        return jsonify({'recommendations': recommendations}), 200
+        cached = RecommendationCache().get(current_user.UserId)
+        return jsonify({
+            'recommendations': cached['recommendations'],
+            'stale': cached['stale'],
+            'computed_at': cached['computed_at']
+        }), 200
     except Exception as e:
         current_app.logger.error(f"Error getting recommendations: {str(e)}")
         return jsonify({'error': 'Failed to get recommendations'}), 500
 
+@main.route('/api/recommendations/cross-media')
+@login_required
+def get_cross_media_recommendations():
+    """Get "watch the adaptation" and "read the source" suggestions."""
+    try:
+        result = CrossMediaService().get(current_user.UserId)
+        return jsonify(result), 200
+    except Exception as e:
+        current_app.logger.error(f"Error getting cross-media recommendations: {str(e)}")
+        return jsonify({'error': 'Failed to get cross-media recommendations'}), 500
+
+@main.route('/api/recommendations/metrics')
+@login_required
+def get_recommendation_metrics():
+    """Get hit-rate and staleness metrics for the recommendation cache."""
+    return jsonify(RecommendationCache().get_metrics()), 200
+
 @main.route('/api/analytics')
 @login_required
 def get_analytics():
-    """Get user's viewing habits analytics (R2)."""
+    """Get user's viewing habits analytics (R2); answers 304 while the user's activity is unchanged."""
     try:
+        cache = AnalyticsCache()
+        version = cache.version(current_user.UserId)
+        if etag_for(current_user.UserId, version) in request.if_none_match:
+            cache.record_not_modified()
+            response = current_app.response_class(status=304)
+            response.set_etag(etag_for(current_user.UserId, version))
+            return response
+
         service = AnalyticsService()
-        analytics = service.get_user_analytics(current_user)
-        return jsonify({
+        etag, analytics = service.get_cached_user_analytics(current_user, version)
+        response = jsonify({
             'viewing_habits': analytics.get('viewing_habits'),
             'genre_preferences': analytics.get('genre_preferences'),
             'rating_distribution': analytics.get('rating_distribution')
-        }), 200
+        })
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response, 200
     except Exception as e:
         current_app.logger.error(f"Error getting analytics: {str(e)}")
         return jsonify({'error': 'Failed to get analytics'}), 500
 
+@main.route('/api/analytics/report')
+@login_required
+def get_analytics_report():
+    """Get the site activity report for a [start, end) window of days (default: the last 7)."""
+    start = request.args.get('start')
+    end = request.args.get('end')
+    try:
+        if not start or not end:
+            start, end = last_days(request.args.get('days', 7, type=int))
+        return jsonify(AnalyticsService().generate_report(start, end)), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"Error generating report for {start}..{end}: {str(e)}")
+        return jsonify({'error': 'Failed to generate report'}), 500
+
+@main.route('/api/analytics/heatmap')
+@login_required
+def get_activity_heatmap():
+    """Get the weekday x hour watch/read heatmap for the user (scope=me) or everyone (scope=global)."""
+    scope = request.args.get('scope', 'me')
+    tz = request.args.get('tz', 'UTC')
+    try:
+        if scope not in ('me', 'global'):
+            raise ValueError(f"Unknown heatmap scope: {scope}")
+        start, end = last_days(request.args.get('days', 90, type=int))
+        heatmap = AnalyticsRollup().heatmap(
+            user_id=current_user.UserId if scope == 'me' else None, start=start, end=end, tz=tz
+        )
+        return jsonify(dict(heatmap, scope=scope, start=start.isoformat(), end=end.isoformat())), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"Error building {scope} activity heatmap: {str(e)}")
+        return jsonify({'error': 'Failed to build heatmap'}), 500
+
+@main.route('/api/analytics/active-users')
+@login_required
+def get_active_users():
+    """Estimated distinct active users for a [start, end) window of days (default: the last 30)."""
+    start = request.args.get('start')
+    end = request.args.get('end')
+    try:
+        if not start or not end:
+            start, end = last_days(request.args.get('days', 30, type=int))
+        return jsonify({
+            'start': str(start),
+            'end': str(end),
+            'active_users': ActivitySketches().active_users(start, end)
+        }), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"Error estimating active users for {start}..{end}: {str(e)}")
+        return jsonify({'error': 'Failed to estimate active users'}), 500
+
+@main.route('/api/movies/<int:movie_id>/viewers')
+def get_unique_viewers(movie_id):
+    """Estimated distinct viewers of a movie over the last `days` days (default 30)."""
+    try:
+        start, end = last_days(request.args.get('days', 30, type=int))
+        return jsonify({
+            'movie_id': movie_id,
+            'days': (end - start).days,
+            'unique_viewers': ActivitySketches().unique_viewers(movie_id, start, end)
+        }), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"Error estimating viewers for movie {movie_id}: {str(e)}")
+        return jsonify({'error': 'Failed to estimate viewers'}), 500
+
+@main.route('/api/activity')
+@login_required
+def get_activity():
+    """Get a page of the user's activity timeline; pass next_cursor back as cursor for the next page."""
+    try:
+        page = ActivityTimeline().page(
+            current_user.UserId,
+            limit=request.args.get('limit', DEFAULT_LIMIT, type=int),
+            cursor=request.args.get('cursor')
+        )
+        return jsonify(page), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"Error getting activity timeline: {str(e)}")
+        return jsonify({'error': 'Failed to get activity'}), 500
+
+@main.route('/api/user/export')
+@login_required
+def export_user_data():
+    """Download the user's history, reviews and lists as a streamed CSV or JSONL file (gzip=1 to compress)."""
+    fmt = request.args.get('format', 'csv')
+    gzip = request.args.get('gzip', '0').lower() in ('1', 'true', 'yes')
+    try:
+        stream = iter_user_export(current_user.UserId, fmt, gzip=gzip)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    response = current_app.response_class(
+        stream_with_context(stream),
+        mimetype='application/gzip' if gzip else CONTENT_TYPES[fmt]
+    )
+    response.headers['Content-Disposition'] = \
+        f'attachment; filename="{export_filename(current_user.UserId, fmt, gzip)}"'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @main.route('/api/notifications')
 @login_required
 def get_notifications():
-    """Get user's notifications for watchlist updates and new adaptations."""
+    """Get one page of the user's notifications, newest first, with the unread count."""
     try:
-        service = NotificationService()
-        notifications = service.get_user_notifications(current_user)
-        return jsonify({'notifications': notifications}), 200
+        page = NotificationService().get_user_notifications(
+            current_user,
+            limit=request.args.get('limit', NOTIFICATION_PAGE_SIZE, type=int),
+            cursor=request.args.get('cursor')
+        )
+        return jsonify(page), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         current_app.logger.error(f"Error getting notifications: {str(e)}")
         return jsonify({'error': 'Failed to get notifications'}), 500
 
+@main.route('/api/notifications/read', methods=['POST'])
+@login_required
+def mark_notifications_read():
+    """Mark the listed notifications (or all of them when no ids are given) as read."""
+    try:
+        data = request.get_json(silent=True) or {}
+        ids = data.get('ids')
+        if ids is not None and (not isinstance(ids, list) or not all(isinstance(i, int) for i in ids)):
+            raise ValueError("ids must be a list of notification ids")
+        service = NotificationService()
+        marked = service.mark_read(current_user.UserId, ids)
+        return jsonify({'marked': marked, 'unread_count': service.unread_count(current_user.UserId)}), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"Error marking notifications read: {str(e)}")
+        return jsonify({'error': 'Failed to mark notifications read'}), 500
+
+@main.route('/api/notifications/stream')
+@login_required
+def stream_notifications():
+    """Push new and merged notifications as Server-Sent Events, resuming after Last-Event-ID (or ?last_event_id=)."""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({'error': f"Invalid Last-Event-ID: {last_event_id}"}), 400
+    response = current_app.response_class(
+        stream_with_context(NotificationBroadcaster().stream(current_user.UserId, last_event_id)),
+        mimetype='text/event-stream'
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@main.route('/api/notifications/metrics')
+@login_required
+def get_notification_metrics():
+    """Get queue-depth, batching, coalescing and streaming metrics for notification delivery."""
+    return jsonify(dict(NotificationQueue().get_metrics(), writes=NotificationService().get_metrics(),
+                        stream=NotificationBroadcaster().get_metrics())), 200
+
 @main.route('/api/reviews', methods=['POST'])
 @login_required
 def create_review():
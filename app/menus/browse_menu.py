@@ -11,7 +11,8 @@
 
 from app import db
 from app.models import Movie, Book, MovieAdaptation, ReadingList
-from app.services.tmdb_service import get_popular_movies, search_movies, create_movie_from_tmdb_data
+from app.services.trending_service import TrendingService
+from app.services.tmdb_service import get_popular_movies, search_movies, create_movie_from_tmdb_data, genre_names
 from app.services.google_books_service import get_popular_books, search_books, create_book_from_google_data
 from .utils import clear_screen, display_movie_details, display_book_details, get_yes_no_input
 from . import lists_menu, review_menu
@@ -33,7 +34,8 @@ def browse_menu(current_user=None):
         print("2. Browse Popular Books")
         print("3. Filter Movies")
         print("4. Search")
-        print("5. Go Back")
+        print("5. Trending on AJTracker")
+        print("6. Go Back")
         
         choice = input("\nEnter your choice: ")
         if choice == "1":
@@ -45,6 +47,8 @@ def browse_menu(current_user=None):
         elif choice == "4":
             search(current_user)
         elif choice == "5":
+            browse_trending()
+        elif choice == "6":
             break
         else:
             print("Invalid choice")
@@ -532,7 +536,8 @@ def find_potential_adaptations(book_title=None, current_user=None, book=None):
                             Overview=movie.get('overview'),
                             ReleaseDate=datetime.strptime(movie['release_date'], '%Y-%m-%d') if movie.get('release_date') else None,
                             TmdbId=str(movie['id']),
-                            PosterPath=movie.get('poster_path')
+                            PosterPath=movie.get('poster_path'),
+                            genres=genre_names(movie)
                         )
                         db.session.add(adaptation)
                         try:
@@ -582,6 +587,31 @@ def add_to_reading_list(book, current_user):
         print(f"\nError adding to reading list: {e}")
         db.session.rollback()
 
+# Process Viewpoint: Local Popularity
+# Shows what AJTracker users have been watching, reading and saving today
+def browse_trending(limit=10):
+    """Show today's trending movies, books and adaptations on AJTracker."""
+    clear_screen()
+    print("\n=== Trending on AJTracker ===")
+    sections = (
+        ('movie', 'Movies', Movie, Movie.movieID, 'title'),
+        ('book', 'Books', Book, Book.BookId, 'Title'),
+        ('adaptation', 'Adaptations', MovieAdaptation, MovieAdaptation.MovieAdaptationId, 'Title')
+    )
+    service = TrendingService()
+    for kind, heading, model, id_column, title_attr in sections:
+        print(f"\n{heading}:")
+        trending = service.top(kind, 'day', limit)
+        if not trending:
+            print("  Nothing trending yet.")
+            continue
+        items = {getattr(item, id_column.key): item
+                 for item in model.query.filter(id_column.in_([t['id'] for t in trending])).all()}
+        for i, entry in enumerate(trending, 1):
+            item = items.get(entry['id'])
+            if item is not None:
+                print(f"  {i}. {getattr(item, title_attr)}")
+
 # Process Viewpoint: Content Search
 # Implements the workflow for searching movies and books
 def search(current_user=None):
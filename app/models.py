@@ -9,38 +9,29 @@ from datetime import datetime
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from app import db
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm.attributes import get_history, set_committed_value
 import requests
 import os
 import json
 from concurrent.futures import ThreadPoolExecutor
-from typing import List
+from typing import List, Tuple
 from datetime import timezone
 
 # Observer Pattern Implementation
+# Subjects are tables rather than loaded instances: the change-capture bus
+# (app/services/change_capture.py) collects each transaction's inserts, updates and
+# deletes and, once it commits, passes every observer the records for the tables it
+# watches. Nothing is attached per row, so observers see every persisted change.
 class Observer:
     """Base Observer class for implementing the Observer pattern."""
-    def update(self, subject):
-        """Called when the subject's state changes."""
-        pass
-
-class Subject:
-    """Base Subject class for implementing the Observer pattern."""
-    def __init__(self):
-        self._observers: List[Observer] = []
-
-    def attach(self, observer: Observer):
-        """Attach an observer to the subject."""
-        if observer not in self._observers:
-            self._observers.append(observer)
+    # Names of the tables whose committed changes are passed to observe()
+    observed_tables: Tuple[str, ...] = ()
 
-    def detach(self, observer: Observer):
-        """Detach an observer from the subject."""
-        self._observers.remove(observer)
-
-    def notify(self):
-        """Notify all observers about state changes."""
-        for observer in self._observers:
-            observer.update(self)
+    @classmethod
+    def observe(cls, changes: List[dict]):
+        """Called after each commit with its change records for observed_tables."""
+        pass
 
 # Key Viewpoints: Development Viewpoint
 # This class represents the User entity in the system, managing user data and interactions.
@@ -54,6 +45,10 @@ class User(UserMixin, db.Model):
     Email = db.Column(db.String)
     password_hash = db.Column(db.String(512))
     _preferences = db.Column('preferences', db.String)  # Store JSON as string
+    # Bumped on every write to the user's history, reviews or lists; keys the analytics cache
+    ActivityVersion = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Denormalized count of unread rows in notifications, maintained by NotificationService
+    UnreadNotifications = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     reviews = db.relationship('Review', backref='user', lazy='dynamic')
 
     def set_password(self, password):
@@ -81,7 +76,7 @@ class User(UserMixin, db.Model):
 # Logical Viewpoint: Sequence Diagram
 # This class interacts with the TMDb API to fetch movie details.
 # It represents the sequence of operations for retrieving movie data.
-class Movie(db.Model, Subject):
+class Movie(db.Model):
     """Movie model for storing movie information."""
     __tablename__ = 'movies'
     movieID = db.Column(db.Integer, primary_key=True)
@@ -90,21 +85,23 @@ class Movie(db.Model, Subject):
     releaseDate = db.Column(db.Date)
     overview = db.Column(db.Text)
     average_rating = db.Column(db.Float)
+    _genres = db.Column('genres', db.String)  # JSON list of TMDb genre names
     reviews = db.relationship('Review', backref='movie', lazy=True)
 
-    def __init__(self, *args, **kwargs):
-        super(Movie, self).__init__(*args, **kwargs)
-        Subject.__init__(self)
+    @property
+    def genres(self) -> List[str]:
+        """Genre names, empty when unknown."""
+        return json.loads(self._genres) if self._genres else []
+
+    @genres.setter
+    def genres(self, value):
+        self._genres = json.dumps(list(value)) if value else None
 
     def update_details(self, **kwargs):
-        """Update movie details and notify observers."""
-        changed = False
+        """Update movie details; observers are notified when the change is committed."""
         for key, value in kwargs.items():
             if hasattr(self, key) and getattr(self, key) != value:
                 setattr(self, key, value)
-                changed = True
-        if changed:
-            self.notify()
 
     def __repr__(self):
         return f'<Movie {self.title}>'
@@ -112,7 +109,7 @@ class Movie(db.Model, Subject):
 # Key Viewpoints: Development Viewpoint
 # This class contains information about books, including attributes like bookID, title, author, and publicationDate.
 # Methods like getDetails() are conceptualized here.
-class Book(db.Model, Subject):
+class Book(db.Model):
     """Book model representing literary works in the database."""
     __tablename__ = 'Books'
     BookId = db.Column(db.Integer, primary_key=True)
@@ -126,21 +123,18 @@ class Book(db.Model, Subject):
     PageCount = db.Column(db.Integer)
     Rating = db.Column(db.Integer)
     Review = db.Column(db.String)
+    # Maintained by the MovieAdaptation mapper hooks below, so "has it been adapted, and
+    # by what most recently" is an attribute read. No FK: it would make the two tables
+    # depend on each other.
+    LatestAdaptationId = db.Column(db.Integer)
+    AdaptationCount = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     movie_adaptations = db.relationship('MovieAdaptation', backref='book', lazy='dynamic')
 
-    def __init__(self, *args, **kwargs):
-        super(Book, self).__init__(*args, **kwargs)
-        Subject.__init__(self)
-
     def update_details(self, **kwargs):
-        """Update book details and notify observers."""
-        changed = False
+        """Update book details; observers are notified when the change is committed."""
         for key, value in kwargs.items():
             if hasattr(self, key) and getattr(self, key) != value:
                 setattr(self, key, value)
-                changed = True
-        if changed:
-            self.notify()
 
     @staticmethod
     def getDetails(book_id):
@@ -155,6 +149,11 @@ class Book(db.Model, Subject):
 class Review(db.Model):
     """Review model for book and movie reviews and ratings."""
     __tablename__ = 'Reviews'
+    __table_args__ = (
+        db.Index('ix_Reviews_UserId_CreatedAt', 'UserId', 'CreatedAt'),
+        # A user's top-rated reviews are the last few entries of their index range
+        db.Index('ix_Reviews_UserId_Rating_CreatedAt', 'UserId', 'Rating', 'CreatedAt'),
+    )
     ReviewId = db.Column(db.Integer, primary_key=True)
     UserId = db.Column(db.Integer, db.ForeignKey('Users.UserId'))
     MovieAdaptationId = db.Column(db.Integer, db.ForeignKey('MovieAdaptations.MovieAdaptationId'), nullable=True)
@@ -185,14 +184,93 @@ class MovieAdaptation(db.Model):
     ReleaseDate = db.Column(db.DateTime)
     TmdbId = db.Column(db.String)
     PosterPath = db.Column(db.String)
+    _genres = db.Column('Genres', db.String)  # JSON list of TMDb genre names
     reviews = db.relationship('Review', backref='movie_adaptation', lazy='dynamic')
 
+    @property
+    def genres(self) -> List[str]:
+        """Genre names, empty when unknown."""
+        return json.loads(self._genres) if self._genres else []
+
+    @genres.setter
+    def genres(self, value):
+        self._genres = json.dumps(list(value)) if value else None
+
+
+def _refresh_loaded_book(connection, target, book_id) -> None:
+    """Copy a book's new counters onto its loaded instance, if the session holds one."""
+    session = inspect(target).session
+    book = session.identity_map.get(session.identity_key(Book, book_id)) if session is not None else None
+    if book is not None:
+        books = Book.__table__
+        latest, count = connection.execute(
+            db.select(books.c.LatestAdaptationId, books.c.AdaptationCount).where(books.c.BookId == book_id)
+        ).one()
+        set_committed_value(book, 'LatestAdaptationId', latest)
+        set_committed_value(book, 'AdaptationCount', count)
+
+
+def _recount_adaptations(connection, target, book_id) -> None:
+    """Recompute a book's counters from its remaining adaptations in one UPDATE."""
+    books, adaptations = Book.__table__, MovieAdaptation.__table__
+    of_book = adaptations.c.BookId == book_id
+    connection.execute(
+        books.update()
+        .where(books.c.BookId == book_id)
+        .values(
+            AdaptationCount=db.select(func.count()).where(of_book).scalar_subquery(),
+            LatestAdaptationId=db.select(func.max(adaptations.c.MovieAdaptationId)).where(of_book).scalar_subquery()
+        )
+    )
+    _refresh_loaded_book(connection, target, book_id)
+
+
+def _adaptation_inserted(mapper, connection, target) -> None:
+    """Mapper hook: count the new adaptation and make it the book's latest."""
+    if target.BookId is None:
+        return
+    books = Book.__table__
+    connection.execute(
+        books.update()
+        .where(books.c.BookId == target.BookId)
+        .values(
+            AdaptationCount=books.c.AdaptationCount + 1,
+            LatestAdaptationId=db.case(
+                (books.c.LatestAdaptationId > target.MovieAdaptationId, books.c.LatestAdaptationId),
+                else_=target.MovieAdaptationId
+            )
+        )
+    )
+    _refresh_loaded_book(connection, target, target.BookId)
+
+
+def _adaptation_updated(mapper, connection, target) -> None:
+    """Mapper hook: recount both books when an adaptation moves to another book."""
+    history = get_history(target, 'BookId')
+    if not history.added and not history.deleted:
+        return
+    for book_id in set(history.added) | set(history.deleted):
+        if book_id is not None:
+            _recount_adaptations(connection, target, book_id)
+
+
+def _adaptation_deleted(mapper, connection, target) -> None:
+    """Mapper hook: recount the book once the adaptation row is gone."""
+    if target.BookId is not None:
+        _recount_adaptations(connection, target, target.BookId)
+
+
+event.listen(MovieAdaptation, 'after_insert', _adaptation_inserted)
+event.listen(MovieAdaptation, 'after_update', _adaptation_updated)
+event.listen(MovieAdaptation, 'after_delete', _adaptation_deleted)
+
 # Process Viewpoint: Activity Diagram
 # This class is part of the workflow for logging movies and books.
 # It demonstrates the steps involved in saving and confirming data entries.
 class WatchHistory(db.Model):
     """WatchHistory model for tracking watched movies."""
     __tablename__ = 'watch_history'
+    __table_args__ = (db.Index('ix_watch_history_userID_watched_date', 'userID', 'watched_date'),)
     id = db.Column(db.Integer, primary_key=True)
     userID = db.Column(db.Integer, db.ForeignKey('Users.UserId'), nullable=False)
     movieID = db.Column(db.Integer, db.ForeignKey('movies.movieID'), nullable=False)
@@ -206,6 +284,10 @@ class WatchHistory(db.Model):
 class ReadHistory(db.Model):
     """ReadHistory model for tracking read books."""
     __tablename__ = 'read_history'
+    __table_args__ = (
+        db.Index('ix_read_history_userID_read_date', 'userID', 'read_date'),
+        db.Index('ix_read_history_bookID', 'bookID'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     userID = db.Column(db.Integer, db.ForeignKey('Users.UserId'), nullable=False)
     bookID = db.Column(db.Integer, db.ForeignKey('Books.BookId'), nullable=False)
@@ -220,6 +302,8 @@ class ReadHistory(db.Model):
 class Watchlist(db.Model, Observer):
     """Watchlist model for tracking movies users want to watch."""
     __tablename__ = 'watchlist'
+    __table_args__ = (db.Index('ix_watchlist_userID_added_date', 'userID', 'added_date'),
+                      db.Index('ix_watchlist_movieID_userID', 'movieID', 'userID'))
     id = db.Column(db.Integer, primary_key=True)
     userID = db.Column(db.Integer, db.ForeignKey('Users.UserId'), nullable=False)
     movieID = db.Column(db.Integer, db.ForeignKey('movies.movieID'), nullable=False)
@@ -227,17 +311,17 @@ class Watchlist(db.Model, Observer):
     _notification_preferences = db.Column('notification_preferences', db.String)
     movie = db.relationship('Movie', backref='watchlist_items', lazy=True)
 
-    def __init__(self, *args, **kwargs):
-        super(Watchlist, self).__init__(*args, **kwargs)
-        if 'movie' in kwargs:
-            kwargs['movie'].attach(self)
+    observed_tables = ('movies',)
 
-    def update(self, subject):
-        """Called when the movie's details are updated."""
-        from app.services.notification_service import NotificationService
-        if isinstance(subject, Movie) and subject.movieID == self.movieID:
-            notification_service = NotificationService()
-            notification_service.notify_watchlist_updates(subject)
+    @classmethod
+    def observe(cls, changes):
+        """Queue the watcher fan-out for every movie whose details were updated."""
+        from app.services.notification_service import watchlist_update_job
+        from app.services.notification_queue import NotificationQueue
+        for change in changes:
+            if change['op'] == 'update':
+                NotificationQueue().enqueue(watchlist_update_job(change['pk'], columns=change['columns'],
+                                                                  digest=change['digest']))
 
     def __repr__(self):
         return f'<Watchlist {self.id}>'
@@ -248,6 +332,7 @@ class Watchlist(db.Model, Observer):
 class ReadingList(db.Model, Observer):
     """ReadingList model for tracking books users want to read."""
     __tablename__ = 'readinglist'
+    __table_args__ = (db.Index('ix_readinglist_userID_added_date', 'userID', 'added_date'),)
     id = db.Column(db.Integer, primary_key=True)
     userID = db.Column(db.Integer, db.ForeignKey('Users.UserId'), nullable=False)
     bookID = db.Column(db.Integer, db.ForeignKey('Books.BookId'), nullable=False)
@@ -255,18 +340,192 @@ class ReadingList(db.Model, Observer):
     user = db.relationship('User', backref=db.backref('reading_list_items', lazy=True))
     book = db.relationship('Book', backref=db.backref('reading_list_entries', lazy=True))
 
-    def __init__(self, *args, **kwargs):
-        super(ReadingList, self).__init__(*args, **kwargs)
-        if 'book' in kwargs:
-            kwargs['book'].attach(self)
+    observed_tables = ('Books',)
 
-    def update(self, subject):
-        """Called when the book's details are updated."""
-        from app.services.notification_service import NotificationService
-        if isinstance(subject, Book) and subject.BookId == self.bookID:
-            notification_service = NotificationService()
-            if hasattr(subject, 'movie_adaptations') and subject.movie_adaptations.count() > 0:
-                notification_service.notify_new_adaptation(subject.Title, subject.movie_adaptations[-1])
+    @classmethod
+    def observe(cls, changes):
+        """Queue the new-adaptation fan-out for every book whose details were updated."""
+        from app.services.notification_service import book_adaptation_job
+        from app.services.notification_queue import NotificationQueue
+        for change in changes:
+            if change['op'] == 'update':
+                NotificationQueue().enqueue(book_adaptation_job(change['pk']))
 
     def __repr__(self):
         return f'<ReadingList {self.id}>'
+
+# Process Viewpoint: Recommendation Caching
+# This class stores the last computed recommendation list for each user.
+# Version is bumped whenever the user's history changes; ComputedVersion records
+# which version the stored list was built from, so a mismatch marks the entry stale.
+class UserRecommendation(db.Model):
+    """Cached recommendation list for a single user."""
+    __tablename__ = 'user_recommendations'
+    UserId = db.Column(db.Integer, db.ForeignKey('Users.UserId'), primary_key=True)
+    Version = db.Column(db.Integer, nullable=False, default=0)
+    ComputedVersion = db.Column(db.Integer, nullable=False, default=0)
+    _recommendations = db.Column('recommendations', db.Text)  # Store JSON as string
+    ComputedAt = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    @property
+    def recommendations(self):
+        """Get the cached recommendations as a Python list."""
+        return json.loads(self._recommendations) if self._recommendations else []
+
+    @recommendations.setter
+    def recommendations(self, value):
+        """Store recommendations by converting them to a JSON string."""
+        self._recommendations = json.dumps(value, default=str) if value is not None else None
+
+    @property
+    def is_stale(self):
+        """True when the user's history changed after this list was computed."""
+        return self.ComputedVersion < self.Version
+
+    def __repr__(self):
+        return f'<UserRecommendation {self.UserId} v{self.ComputedVersion}/{self.Version}>'
+
+# Process Viewpoint: Cross-Media Recommendations
+# This class materializes "watch the adaptation" / "read the source" suggestions
+# per user, using the same Version/ComputedVersion staleness scheme as
+# UserRecommendation.
+class CrossMediaRecommendation(db.Model):
+    """Materialized cross-media suggestions for a single user."""
+    __tablename__ = 'cross_media_recommendations'
+    UserId = db.Column(db.Integer, db.ForeignKey('Users.UserId'), primary_key=True)
+    Version = db.Column(db.Integer, nullable=False, default=0)
+    ComputedVersion = db.Column(db.Integer, nullable=False, default=0)
+    # Version (build time in ms) of the cross-media graph the suggestions came from
+    GraphVersion = db.Column(db.BigInteger, nullable=False, default=0)
+    _suggestions = db.Column('suggestions', db.Text)  # Store JSON as string
+    ComputedAt = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    @property
+    def suggestions(self):
+        """Get the materialized suggestions as a Python dict."""
+        return json.loads(self._suggestions) if self._suggestions else {'movies': [], 'books': []}
+
+    @suggestions.setter
+    def suggestions(self, value):
+        """Store suggestions by converting them to a JSON string."""
+        self._suggestions = json.dumps(value, default=str) if value is not None else None
+
+    @property
+    def is_stale(self):
+        """True when the user's history changed after these suggestions were computed."""
+        return self.ComputedVersion < self.Version
+
+    def __repr__(self):
+        return f'<CrossMediaRecommendation {self.UserId} v{self.ComputedVersion}/{self.Version}>'
+
+# Physical Viewpoint: Trending Checkpoints
+# This class persists the in-memory trending counters so they survive restarts
+# and can be merged across worker processes. Score is the decayed value at UpdatedAt.
+class TrendingCounter(db.Model):
+    """Checkpointed, exponentially decayed popularity score for one item and window."""
+    __tablename__ = 'trending_counters'
+    Kind = db.Column(db.String(20), primary_key=True)
+    ItemId = db.Column(db.Integer, primary_key=True)
+    Window = db.Column(db.String(10), primary_key=True)
+    Score = db.Column(db.Float, nullable=False, default=0.0)
+    UpdatedAt = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f'<TrendingCounter {self.Kind}:{self.ItemId} {self.Window}={self.Score:.3f}>'
+
+# Process Viewpoint: Analytics Rollups
+# These classes hold per-user, per-day activity totals maintained incrementally as
+# history and reviews are written, so analytics read O(days) rows instead of raw history.
+class UserDailyActivity(db.Model):
+    """Per-user activity totals for one calendar day (UTC)."""
+    __tablename__ = 'user_daily_activity'
+    UserId = db.Column(db.Integer, db.ForeignKey('Users.UserId'), primary_key=True)
+    Day = db.Column(db.Date, primary_key=True, index=True)
+    Watches = db.Column(db.Integer, nullable=False, default=0)
+    Reads = db.Column(db.Integer, nullable=False, default=0)
+    Reviews = db.Column(db.Integer, nullable=False, default=0)
+    RatedReviews = db.Column(db.Integer, nullable=False, default=0)
+    RatingSum = db.Column(db.Float, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return f'<UserDailyActivity {self.UserId} {self.Day}>'
+
+class UserHourlyActivity(db.Model):
+    """Hour-of-day watch and read histogram for one user and day."""
+    __tablename__ = 'user_hourly_activity'
+    UserId = db.Column(db.Integer, db.ForeignKey('Users.UserId'), primary_key=True)
+    Day = db.Column(db.Date, primary_key=True, index=True)
+    Hour = db.Column(db.Integer, primary_key=True)
+    Watches = db.Column(db.Integer, nullable=False, default=0)
+    Reads = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<UserHourlyActivity {self.UserId} {self.Day} {self.Hour}:00>'
+
+class UserRatingCount(db.Model):
+    """Number of a user's reviews given one rating value."""
+    __tablename__ = 'user_rating_counts'
+    UserId = db.Column(db.Integer, db.ForeignKey('Users.UserId'), primary_key=True)
+    Rating = db.Column(db.Float, primary_key=True)
+    Reviews = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<UserRatingCount {self.UserId} {self.Rating}={self.Reviews}>'
+
+# Process Viewpoint: Distinct-Count Sketches
+# This class stores one HyperLogLog sketch per (kind, key, day): the users active that
+# day, or the users who watched/read one title. Windows are counted by merging days.
+class ActivitySketch(db.Model):
+    """Serialized HyperLogLog sketch of distinct users for one series and day."""
+    __tablename__ = 'activity_sketches'
+    Kind = db.Column(db.String(10), primary_key=True)
+    Key = db.Column(db.Integer, primary_key=True)
+    Day = db.Column(db.Date, primary_key=True)
+    Registers = db.Column(db.LargeBinary, nullable=False)
+    UpdatedAt = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f'<ActivitySketch {self.Kind}:{self.Key} {self.Day}>'
+
+# Process Viewpoint: Notification Subscriptions
+# This class is an inverted index from a genre or a book to the users interested in it,
+# maintained from preferred_genres and reading lists, so new-adaptation fan-out only
+# reads the matching users.
+class NotificationSubscription(db.Model):
+    """One user's interest in a genre ('genre', name) or a book ('book', BookId)."""
+    __tablename__ = 'notification_subscriptions'
+    Kind = db.Column(db.String(10), primary_key=True)
+    Key = db.Column(db.String(100), primary_key=True)
+    UserId = db.Column(db.Integer, db.ForeignKey('Users.UserId'), primary_key=True, index=True)
+
+    def __repr__(self):
+        return f'<NotificationSubscription {self.Kind}:{self.Key} -> {self.UserId}>'
+
+# Physical Viewpoint: Notification Store
+# This class persists user notifications so they survive restarts and are shared by all
+# workers. Pages are read newest first through the (UserId, CreatedAt) index; the unread
+# total is kept on Users.UnreadNotifications.
+class Notification(db.Model):
+    """A notification delivered to one user."""
+    __tablename__ = 'notifications'
+    __table_args__ = (
+        db.Index('ix_notifications_UserId_CreatedAt', 'UserId', 'CreatedAt'),
+        db.Index('ix_notifications_SubjectKey_CreatedAt', 'SubjectKey', 'CreatedAt'),
+        db.Index('ix_notifications_UpdatedAt', 'UpdatedAt'),
+    )
+    NotificationId = db.Column(db.Integer, primary_key=True)
+    UserId = db.Column(db.Integer, db.ForeignKey('Users.UserId'), nullable=False)
+    Kind = db.Column(db.String(30), nullable=False)
+    Title = db.Column(db.String(200), nullable=False)
+    Message = db.Column(db.Text)
+    Read = db.Column(db.Boolean, nullable=False, default=False)
+    CreatedAt = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    # What the notification is about, e.g. 'movie:42'; unread ones on the same subject are merged
+    SubjectKey = db.Column(db.String(50))
+    ChangeCount = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    Fingerprint = db.Column(db.String(16))
+    # Set when later changes are merged into the row, so streams can push the new content
+    UpdatedAt = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<Notification {self.NotificationId} -> {self.UserId}>'
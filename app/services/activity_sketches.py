@@ -0,0 +1,378 @@
+"""
+Activity Sketches: Approximate distinct counts of active users and unique viewers.
+
+Every day gets a HyperLogLog sketch of the users active that day (any watch, read
+or review) and, per movie and per book, of the users who watched or read it.
+HyperLogLog sketches merge by taking register-wise maxima, so the distinct count
+for any window is the estimate of the merged daily sketches. A window query
+therefore reads one small row per day and never scans raw history. With
+PRECISION = 14 (16384 registers) the standard error is about 0.8%.
+
+Committed inserts are added to in-memory sketches. They are merged into
+activity_sketches by the scheduled flush, and also by a background flush as soon as
+MAX_PENDING_SKETCHES are held or the oldest is FLUSH_INTERVAL_SECONDS old. Memory
+stays bounded, and restarts and other workers see the same counts. The merge locks
+the stored rows it rewrites. A concurrent first insert of the same row makes it retry,
+so two processes flushing one sketch can't overwrite each other. A
+sketch can't forget a user, so deletes are not reflected; backfill() rebuilds
+the sketches from raw history.
+"""
+import hashlib
+import math
+import threading
+import time
+import zlib
+from collections import defaultdict
+from datetime import date, datetime, timezone
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+from flask import current_app, has_app_context
+from sqlalchemy import bindparam, event, func, delete, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, object_session
+
+from ..models import db, User, WatchHistory, ReadHistory, Review, ActivitySketch
+from ..utils.sql_dates import day_of, as_date
+from .report_engine import DateLike, to_day
+
+PRECISION = 14
+# Sketch kinds: 'active' has one sketch per day (key 0); 'movie'/'book' one per title and day
+KINDS = ('active', 'movie', 'book')
+ACTIVE_KEY = 0
+DEFAULT_BATCH_SIZE = 1000
+# Flush early once this many sketches (16 KiB each when dense) or this much time is pending
+MAX_PENDING_SKETCHES = 256
+FLUSH_INTERVAL_SECONDS = 300
+MERGE_ATTEMPTS = 3
+
+_SESSION_KEY = 'activity_sketch_pending_events'
+
+
+class HyperLogLog:
+    """Mergeable distinct-count sketch with 2**precision one-byte registers."""
+
+    def __init__(self, precision: int = PRECISION, registers: Optional[bytearray] = None):
+        self.p = precision
+        self.m = 1 << precision
+        self.registers = registers if registers is not None else bytearray(self.m)
+
+    def add(self, value: Any) -> None:
+        """Add one value; adding it again changes nothing."""
+        h = int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), 'big')
+        index = h >> (64 - self.p)
+        rest = h & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        """Fold another sketch of the same precision into this one (set union)."""
+        if other.p != self.p:
+            raise ValueError(f"Cannot merge sketches of precision {self.p} and {other.p}")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self) -> int:
+        """Estimated number of distinct values added."""
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.m and zeros:
+            # Linear counting is more accurate while many registers are still empty
+            estimate = self.m * math.log(self.m / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        """
+        Compact encoding: sparse (3 bytes per non-empty register) while fewer than a
+        third of the registers are set, otherwise zlib-compressed dense registers.
+        """
+        filled = [(index, rank) for index, rank in enumerate(self.registers) if rank]
+        if len(filled) * 3 < self.m:
+            body = b''.join(((index << 6) | rank).to_bytes(3, 'big') for index, rank in filled)
+            return b'S' + bytes([self.p]) + body
+        return b'D' + bytes([self.p]) + zlib.compress(bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'HyperLogLog':
+        """Decode a sketch written by to_bytes."""
+        encoding, precision, body = data[:1], data[1], data[2:]
+        sketch = cls(precision)
+        if encoding == b'S':
+            for offset in range(0, len(body), 3):
+                packed = int.from_bytes(body[offset:offset + 3], 'big')
+                sketch.registers[packed >> 6] = packed & 0x3F
+        elif encoding == b'D':
+            sketch.registers = bytearray(zlib.decompress(body))
+        else:
+            raise ValueError(f"Unknown sketch encoding: {encoding!r}")
+        return sketch
+
+
+class ActivitySketches:
+    """
+    Singleton pattern implementation for distinct-count sketches
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super(ActivitySketches, cls).__new__(cls)
+                    cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        """Start with no unsaved sketches."""
+        self._pending: Dict[Tuple[str, int, date], HyperLogLog] = {}
+        self._pending_since: Optional[float] = None
+        self._write_lock = threading.Lock()
+        self._flusher: Optional[threading.Thread] = None
+
+    def record(self, kind: str, key: int, day: date, user_id: int) -> None:
+        """Add a user to the (kind, key, day) sketch."""
+        with self._write_lock:
+            if self._pending_since is None:
+                self._pending_since = time.monotonic()
+            sketch = self._pending.get((kind, key, day))
+            if sketch is None:
+                sketch = self._pending[(kind, key, day)] = HyperLogLog()
+            sketch.add(user_id)
+
+    def record_event(self, user_id: int, timestamp: datetime, movie_id: Optional[int] = None,
+                     book_id: Optional[int] = None) -> None:
+        """Count a watch, read or review as activity, and watches/reads as title viewers."""
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone(timezone.utc)
+        day = timestamp.date()
+        self.record('active', ACTIVE_KEY, day, user_id)
+        if movie_id is not None:
+            self.record('movie', movie_id, day, user_id)
+        if book_id is not None:
+            self.record('book', book_id, day, user_id)
+
+    def distinct(self, kind: str, key: int, start: DateLike, end: DateLike) -> int:
+        """
+        Estimated distinct users in one sketch series over [start, end).
+
+        Raises:
+            ValueError: If the kind is unknown or the window is empty
+        """
+        if kind not in KINDS:
+            raise ValueError(f"Unknown sketch kind: {kind}")
+        start, end = to_day(start), to_day(end)
+        if start >= end:
+            raise ValueError(f"Window must end after it starts: [{start}, {end})")
+
+        merged = HyperLogLog()
+        for registers in db.session.execute(
+            db.select(ActivitySketch.Registers)
+            .where(ActivitySketch.Kind == kind, ActivitySketch.Key == key,
+                   ActivitySketch.Day >= start, ActivitySketch.Day < end)
+        ).scalars():
+            merged.merge(HyperLogLog.from_bytes(registers))
+        with self._write_lock:
+            for (pending_kind, pending_key, day), sketch in self._pending.items():
+                if pending_kind == kind and pending_key == key and start <= day < end:
+                    merged.merge(sketch)
+        return merged.count()
+
+    def active_users(self, start: DateLike, end: DateLike) -> int:
+        """Estimated users with any watch, read or review in [start, end)."""
+        return self.distinct('active', ACTIVE_KEY, start, end)
+
+    def unique_viewers(self, movie_id: int, start: DateLike, end: DateLike) -> int:
+        """Estimated users who watched a movie in [start, end)."""
+        return self.distinct('movie', movie_id, start, end)
+
+    def flush(self) -> int:
+        """
+        Merge this process's unsaved sketches into activity_sketches.
+
+        Returns:
+            Number of sketch rows written
+        """
+        with self._write_lock:
+            pending, self._pending = self._pending, {}
+            pending_since, self._pending_since = self._pending_since, None
+        if not pending:
+            return 0
+        try:
+            return self._merge_into_table(pending)
+        except Exception:
+            # Keep the sketches for the next flush; re-adding is harmless
+            with self._write_lock:
+                for sketch_key, sketch in pending.items():
+                    current = self._pending.get(sketch_key)
+                    self._pending[sketch_key] = sketch.merge(current) if current else sketch
+                self._pending_since = pending_since
+            raise
+
+    def flush_due(self) -> bool:
+        """Whether enough sketches, or old enough ones, are pending to flush now."""
+        with self._write_lock:
+            return bool(self._pending) and (
+                len(self._pending) >= MAX_PENDING_SKETCHES
+                or time.monotonic() - self._pending_since >= FLUSH_INTERVAL_SECONDS
+            )
+
+    def flush_in_background(self, app) -> Optional[threading.Thread]:
+        """Flush on a background thread unless one is already running; returns that thread."""
+        with self._lock:
+            if self._flusher is not None and self._flusher.is_alive():
+                return None
+            self._flusher = threading.Thread(target=self._background_flush, args=(app,),
+                                             name='activity-sketch-flush', daemon=True)
+            self._flusher.start()
+            return self._flusher
+
+    def _background_flush(self, app) -> None:
+        with app.app_context():
+            try:
+                self.flush()
+            except Exception as e:
+                app.logger.error(f"Error flushing activity sketches: {str(e)}")
+            finally:
+                db.session.remove()
+
+    def backfill(self, batch_size: int = DEFAULT_BATCH_SIZE) -> Dict[str, int]:
+        """
+        Rebuild every sketch from raw history, a batch of users at a time.
+
+        Returns:
+            Number of users processed and sketch rows written
+        """
+        with self._write_lock:
+            self._pending = {}
+        db.session.execute(delete(ActivitySketch))
+        db.session.commit()
+
+        user_ids = db.session.execute(db.select(User.UserId).order_by(User.UserId)).scalars().all()
+        report = {'users': len(user_ids), 'rows': 0}
+        for i in range(0, len(user_ids), batch_size):
+            batch: Dict[Tuple[str, int, date], HyperLogLog] = defaultdict(HyperLogLog)
+            for kind, key, day, user_id in self._distinct_events(user_ids[i:i + batch_size]):
+                batch[(kind, key, day)].add(user_id)
+            if batch:
+                self._merge_into_table(batch)
+        report['rows'] = db.session.execute(db.select(func.count()).select_from(ActivitySketch)).scalar()
+        return report
+
+    @staticmethod
+    def _distinct_events(user_ids: List[int]) -> Iterable[Tuple[str, int, date, int]]:
+        """Distinct (kind, key, day, user) tuples for a batch of users, deduplicated in SQL."""
+        sources = (
+            (WatchHistory, WatchHistory.userID, WatchHistory.watched_date, WatchHistory.movieID, 'movie'),
+            (ReadHistory, ReadHistory.userID, ReadHistory.read_date, ReadHistory.bookID, 'book'),
+            (Review, Review.UserId, Review.CreatedAt, None, None),
+        )
+        for model, user_col, ts, title_col, kind in sources:
+            day = day_of(ts)
+            columns = [user_col, day] + ([title_col] if title_col is not None else [])
+            rows = db.session.execute(
+                db.select(*columns).distinct()
+                .where(user_col.in_(user_ids), ts.isnot(None))
+            )
+            for row in rows:
+                user_id, bucket = row[0], as_date(row[1])
+                yield 'active', ACTIVE_KEY, bucket, user_id
+                if title_col is not None and row[2] is not None:
+                    yield kind, row[2], bucket, user_id
+
+    @staticmethod
+    def _merge_into_table(sketches: Dict[Tuple[str, int, date], HyperLogLog]) -> int:
+        """Merge sketches into the stored rows, retrying when another writer inserted one first."""
+        for attempt in range(1, MERGE_ATTEMPTS + 1):
+            try:
+                return ActivitySketches._merge_once(sketches)
+            except IntegrityError:
+                db.session.rollback()
+                if attempt == MERGE_ATTEMPTS:
+                    raise
+        return 0
+
+    @staticmethod
+    def _merge_once(sketches: Dict[Tuple[str, int, date], HyperLogLog]) -> int:
+        """One transaction: lock the stored rows, update them with the merged sketches, insert the rest."""
+        grouped: Dict[Tuple[str, date], Dict[int, HyperLogLog]] = defaultdict(dict)
+        for (kind, key, day), sketch in sketches.items():
+            grouped[(kind, day)][key] = sketch
+
+        table = ActivitySketch.__table__
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        written = 0
+        for (kind, day), by_key in grouped.items():
+            stored = dict(db.session.execute(
+                db.select(table.c.Key, table.c.Registers)
+                .where(table.c.Kind == kind, table.c.Day == day, table.c.Key.in_(list(by_key)))
+                .with_for_update()
+            ).all())
+            updates, inserts = [], []
+            for key, sketch in by_key.items():
+                if key in stored:
+                    merged = HyperLogLog.from_bytes(stored[key]).merge(sketch)
+                    updates.append({'b_key': key, 'b_registers': merged.to_bytes()})
+                else:
+                    inserts.append({'Kind': kind, 'Key': key, 'Day': day,
+                                    'Registers': sketch.to_bytes(), 'UpdatedAt': now})
+            if updates:
+                db.session.execute(
+                    table.update()
+                    .where(table.c.Kind == kind, table.c.Day == day, table.c.Key == bindparam('b_key'))
+                    .values(Registers=bindparam('b_registers'), UpdatedAt=now),
+                    updates
+                )
+            if inserts:
+                db.session.execute(insert(table), inserts)
+            written += len(by_key)
+        db.session.commit()
+        return written
+
+
+def _event_for(target) -> Optional[Dict[str, Any]]:
+    """Translate an inserted row into a sketch event."""
+    if isinstance(target, WatchHistory):
+        event_args = {'user_id': target.userID, 'timestamp': target.watched_date, 'movie_id': target.movieID}
+    elif isinstance(target, ReadHistory):
+        event_args = {'user_id': target.userID, 'timestamp': target.read_date, 'book_id': target.bookID}
+    else:
+        event_args = {'user_id': target.UserId, 'timestamp': target.CreatedAt}
+    if event_args['user_id'] is None or event_args['timestamp'] is None:
+        return None
+    return event_args
+
+
+def _on_insert(mapper, connection, target) -> None:
+    """Mapper hook: hold events until the transaction commits."""
+    session = object_session(target)
+    event_args = _event_for(target)
+    if session is not None and event_args is not None:
+        session.info.setdefault(_SESSION_KEY, []).append(event_args)
+
+
+for _model in (WatchHistory, ReadHistory, Review):
+    event.listen(_model, 'after_insert', _on_insert)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_pending_events(session: Session) -> None:
+    """Feed committed inserts into the sketches."""
+    pending = session.info.pop(_SESSION_KEY, None)
+    if not pending:
+        return
+    sketches = ActivitySketches()
+    for item in pending:
+        try:
+            sketches.record_event(**item)
+        except Exception as e:
+            current_app.logger.error(f"Error recording sketch event: {str(e)}")
+    # The committing session can't run the flush here; hand it to a thread
+    if has_app_context() and sketches.flush_due():
+        sketches.flush_in_background(current_app._get_current_object())
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending_events(session: Session) -> None:
+    session.info.pop(_SESSION_KEY, None)
@@ -0,0 +1,184 @@
+"""
+Activity Timeline: One newest-first feed of a user's watches, reads, reviews and
+watchlist/reading-list additions.
+
+A page is a single UNION ALL query with titles joined in. Each branch applies the
+keyset predicate, orders by its (user, timestamp) index and stops after limit + 1
+rows, so a page costs the same however much history the user has. Rows are
+ordered by (timestamp, kind, id) descending. The kind breaks ties between rows of
+different tables that share a timestamp and id. The opaque cursor encodes the
+last row's position.
+"""
+import base64
+import json
+import threading
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+from sqlalchemy import Float, String, and_, cast, func, literal, null, or_, union_all
+
+from ..models import db, Movie, Book, MovieAdaptation, WatchHistory, ReadHistory, Review, Watchlist, ReadingList
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# Kind codes double as the tie-breaker between tables
+KINDS = {'watch': 5, 'read': 4, 'review': 3, 'watchlist': 2, 'readinglist': 1}
+
+
+def encode_cursor(timestamp: datetime, kind: str, row_id: int) -> str:
+    """Opaque cursor pointing just after a timeline row."""
+    payload = json.dumps({'t': timestamp.isoformat(), 'k': kind, 'i': row_id})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """Decode a cursor from encode_cursor; raises ValueError when it is malformed."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if payload['k'] not in KINDS:
+            raise ValueError(payload['k'])
+        return {'timestamp': datetime.fromisoformat(payload['t']), 'kind': payload['k'], 'id': int(payload['i'])}
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def activity_query(kind: str, user_id: int):
+    """
+    One kind of a user's activity with its title joined in, unordered.
+
+    Returns:
+        (select, row id column, timestamp column). The select's columns are kind,
+        kind_code, row_id, timestamp, movie_id, book_id, adaptation_id, title,
+        rating and comment.
+    """
+    no_rating, no_text = cast(null(), Float), cast(null(), String)
+    no_id = cast(null(), db.Integer)
+    if kind == 'watch':
+        model, row_id, user_col, ts = WatchHistory, WatchHistory.id, WatchHistory.userID, WatchHistory.watched_date
+        columns = [WatchHistory.movieID, no_id, no_id, Movie.title, no_rating, no_text]
+        joins = [(Movie, Movie.movieID == WatchHistory.movieID)]
+    elif kind == 'read':
+        model, row_id, user_col, ts = ReadHistory, ReadHistory.id, ReadHistory.userID, ReadHistory.read_date
+        columns = [no_id, ReadHistory.bookID, no_id, Book.Title, no_rating, no_text]
+        joins = [(Book, Book.BookId == ReadHistory.bookID)]
+    elif kind == 'review':
+        model, row_id, user_col, ts = Review, Review.ReviewId, Review.UserId, Review.CreatedAt
+        columns = [Review.movieID, Review.BookId, Review.MovieAdaptationId,
+                   func.coalesce(Movie.title, MovieAdaptation.Title, Book.Title), Review.Rating, Review.Comment]
+        joins = [(Movie, Movie.movieID == Review.movieID), (Book, Book.BookId == Review.BookId),
+                 (MovieAdaptation, MovieAdaptation.MovieAdaptationId == Review.MovieAdaptationId)]
+    elif kind == 'watchlist':
+        model, row_id, user_col, ts = Watchlist, Watchlist.id, Watchlist.userID, Watchlist.added_date
+        columns = [Watchlist.movieID, no_id, no_id, Movie.title, no_rating, no_text]
+        joins = [(Movie, Movie.movieID == Watchlist.movieID)]
+    elif kind == 'readinglist':
+        model, row_id, user_col, ts = ReadingList, ReadingList.id, ReadingList.userID, ReadingList.added_date
+        columns = [no_id, ReadingList.bookID, no_id, Book.Title, no_rating, no_text]
+        joins = [(Book, Book.BookId == ReadingList.bookID)]
+    else:
+        raise ValueError(f"Unknown activity kind: {kind}")
+
+    labels = ('movie_id', 'book_id', 'adaptation_id', 'title', 'rating', 'comment')
+    query = db.select(
+        literal(kind).label('kind'),
+        literal(KINDS[kind]).label('kind_code'),
+        row_id.label('row_id'),
+        ts.label('timestamp'),
+        *(column.label(label) for column, label in zip(columns, labels))
+    ).select_from(model)
+    for target, condition in joins:
+        query = query.outerjoin(target, condition)
+    return query.where(user_col == user_id), row_id, ts
+
+
+class ActivityTimeline:
+    """
+    Singleton pattern implementation for the activity timeline
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super(ActivityTimeline, cls).__new__(cls)
+        return cls._instance
+
+    def page(self, user_id: int, limit: int = DEFAULT_LIMIT, cursor: Optional[str] = None,
+             since: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        Get one page of a user's activity, newest first.
+
+        Args:
+            user_id: ID of the user
+            limit: Items per page (capped at MAX_LIMIT)
+            cursor: next_cursor from the previous page, or None for the first page
+            since: Optional lower bound on the activity timestamp
+
+        Returns:
+            Dict with 'items' and 'next_cursor' (None on the last page)
+
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        limit = max(1, min(int(limit), MAX_LIMIT))
+        after = decode_cursor(cursor) if cursor else None
+
+        branches = [
+            self._branch(kind, user_id, after, since, limit + 1)
+            for kind in KINDS
+        ]
+        feed = union_all(*branches).subquery()
+        rows = db.session.execute(
+            db.select(feed)
+            .order_by(feed.c.timestamp.desc(), feed.c.kind_code.desc(), feed.c.row_id.desc())
+            .limit(limit + 1)
+        ).all()
+
+        items = [self._item(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = encode_cursor(last.timestamp, last.kind, last.row_id)
+        return {'items': items, 'next_cursor': next_cursor}
+
+    @staticmethod
+    def _branch(kind: str, user_id: int, after: Optional[Dict[str, Any]],
+                since: Optional[datetime], limit: int):
+        """One table's rows after the cursor, newest first, as a UNION ALL member."""
+        query, row_id, ts = activity_query(kind, user_id)
+        query = query.where(ts.isnot(None))
+        if since is not None:
+            query = query.where(ts >= since)
+        if after is not None:
+            # Rows strictly after the cursor in (timestamp, kind_code, id) descending order
+            code, cursor_code = KINDS[kind], KINDS[after['kind']]
+            if code < cursor_code:
+                query = query.where(ts <= after['timestamp'])
+            elif code > cursor_code:
+                query = query.where(ts < after['timestamp'])
+            else:
+                query = query.where(or_(ts < after['timestamp'],
+                                        and_(ts == after['timestamp'], row_id < after['id'])))
+
+        # Wrapped so the per-branch ORDER BY/LIMIT is legal inside UNION ALL on every backend
+        inner = query.order_by(ts.desc(), row_id.desc()).limit(limit).subquery()
+        return db.select(inner)
+
+    @staticmethod
+    def _item(row) -> Dict[str, Any]:
+        item = {
+            'type': row.kind,
+            'id': row.row_id,
+            'date': row.timestamp.isoformat(),
+            'title': row.title,
+            'movie_id': row.movie_id,
+            'book_id': row.book_id,
+            'adaptation_id': row.adaptation_id,
+            'details': None
+        }
+        if row.kind == 'review':
+            item['details'] = {'rating': row.rating, 'comment': row.comment}
+        return item
@@ -0,0 +1,134 @@
+"""
+Analytics Cache: Per-user analytics payloads keyed by the user's activity version.
+
+Inserts, updates and deletes of WatchHistory, ReadHistory, Review, Watchlist and
+ReadingList rows bump Users.ActivityVersion in the writer's transaction. A cached
+payload is valid for as long as the version it was computed from is current, so
+polling an unchanged user costs one primary-key lookup. The ETag is derived from
+(user, version), so a client holding it can be answered 304 without touching the
+cache at all.
+
+Entries also expire after ENTRY_TTL_SECONDS. This bounds how far time-relative
+parts such as recent activity can drift for a user who stops writing. Each
+process keeps its own LRU of MAX_CACHED_USERS entries. The version lives in the
+database, so all workers agree on when an entry is stale.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Callable, Optional, Tuple
+
+from sqlalchemy import event
+
+from ..models import db, User, WatchHistory, ReadHistory, Review, Watchlist, ReadingList
+
+ENTRY_TTL_SECONDS = 3600
+MAX_CACHED_USERS = 1024
+
+
+def etag_for(user_id: int, version: int) -> str:
+    """Entity tag for a user's analytics at an activity version."""
+    return f"analytics-{user_id}-v{version}"
+
+
+class AnalyticsCache:
+    """
+    Singleton pattern implementation for the analytics cache
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super(AnalyticsCache, cls).__new__(cls)
+                    cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        """Initialize the LRU and metric counters."""
+        self._entries: 'OrderedDict[int, Tuple[int, float, Dict[str, Any]]]' = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._not_modified = 0
+
+    @staticmethod
+    def version(user_id: int) -> int:
+        """The user's current activity version, read from the database."""
+        return db.session.execute(
+            db.select(User.ActivityVersion).where(User.UserId == user_id)
+        ).scalar() or 0
+
+    def get_or_compute(self, user_id: int, compute: Callable[[], Dict[str, Any]],
+                       version: Optional[int] = None) -> Tuple[str, Dict[str, Any]]:
+        """
+        Return (etag, payload), computing the payload only when no current entry exists.
+
+        Args:
+            user_id: ID of the user
+            compute: Builds the payload on a miss
+            version: The user's activity version, if the caller already read it
+        """
+        version = self.version(user_id) if version is None else version
+        now = time.monotonic()
+        with self._cache_lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] == version and entry[1] > now:
+                self._entries.move_to_end(user_id)
+                self._hits += 1
+                return etag_for(user_id, version), entry[2]
+            self._misses += 1
+
+        payload = compute()
+        with self._cache_lock:
+            current = self._entries.get(user_id)
+            # Never replace an entry computed from a newer version
+            if current is None or current[0] <= version:
+                self._entries[user_id] = (version, now + ENTRY_TTL_SECONDS, payload)
+                self._entries.move_to_end(user_id)
+            while len(self._entries) > MAX_CACHED_USERS:
+                self._entries.popitem(last=False)
+        return etag_for(user_id, version), payload
+
+    def record_not_modified(self) -> None:
+        """Count a request answered 304 from the ETag alone."""
+        with self._cache_lock:
+            self._not_modified += 1
+
+    def clear(self) -> None:
+        """Drop every entry, e.g. after rollups were backfilled."""
+        with self._cache_lock:
+            self._entries.clear()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get hit-rate metrics for the cache."""
+        with self._cache_lock:
+            lookups = self._hits + self._misses
+            return {
+                'cached_users': len(self._entries),
+                'hits': self._hits,
+                'misses': self._misses,
+                'not_modified': self._not_modified,
+                'hit_rate': round(self._hits / lookups * 100, 2) if lookups else 0.0
+            }
+
+
+def _bump_version(mapper, connection, target) -> None:
+    """Mapper hook: advance the owning user's activity version in the writer's transaction."""
+    user_id = target.UserId if isinstance(target, Review) else target.userID
+    if user_id is None:
+        return
+    table = User.__table__
+    connection.execute(
+        table.update()
+        .where(table.c.UserId == user_id)
+        .values(ActivityVersion=table.c.ActivityVersion + 1)
+    )
+
+
+for _model in (WatchHistory, ReadHistory, Review, Watchlist, ReadingList):
+    event.listen(_model, 'after_insert', _bump_version)
+    event.listen(_model, 'after_update', _bump_version)
+    event.listen(_model, 'after_delete', _bump_version)
@@ -0,0 +1,334 @@
+"""
+Analytics Rollup: Maintains per-user, per-day activity totals for analytics.
+
+Inserts, updates and deletes of WatchHistory, ReadHistory and Review rows adjust
+user_daily_activity (watch/read/review counts, rating sum), user_hourly_activity
+(hour-of-day watch/read histogram) and user_rating_counts (reviews per rating value)
+in the writer's own transaction. A rollback therefore rolls the totals back too.
+Analytics then read O(days) rollup rows instead of a user's raw history.
+
+A counter row is created by the first write that needs it. That INSERT runs in a
+savepoint; if a concurrent transaction created the row first, the savepoint is
+rolled back and the UPDATE retried against their row.
+
+Rows written outside the ORM (bulk Core inserts, manual SQL) bypass the hooks;
+backfill() rebuilds both tables from the raw history.
+"""
+import threading
+from collections import defaultdict
+from datetime import date, datetime, time, timezone
+from typing import Dict, Any, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from sqlalchemy import event, func, insert, update, delete, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.attributes import get_history
+
+from ..models import (db, User, WatchHistory, ReadHistory, Review, UserDailyActivity, UserHourlyActivity,
+                      UserRatingCount)
+from ..utils.sql_dates import day_of, hour_of, as_date
+from .report_engine import ReportEngine
+from .analytics_cache import AnalyticsCache
+
+DAILY_COUNTERS = ('Watches', 'Reads', 'Reviews', 'RatedReviews', 'RatingSum')
+HOURLY_COUNTERS = ('Watches', 'Reads')
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+DEFAULT_BATCH_SIZE = 1000
+
+# Model -> (user column attribute, timestamp attribute)
+_SOURCES = {
+    WatchHistory: ('userID', 'watched_date'),
+    ReadHistory: ('userID', 'read_date'),
+    Review: ('UserId', 'CreatedAt'),
+}
+
+
+class AnalyticsRollup:
+    """
+    Singleton pattern implementation for analytics rollups
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super(AnalyticsRollup, cls).__new__(cls)
+        return cls._instance
+
+    def daily(self, user_id: Optional[int] = None, start: Optional[date] = None,
+              end: Optional[date] = None) -> List[UserDailyActivity]:
+        """Daily rollup rows, oldest first, optionally for one user and a [start, end) range."""
+        query = db.select(UserDailyActivity)
+        if user_id is not None:
+            query = query.where(UserDailyActivity.UserId == user_id)
+        if start is not None:
+            query = query.where(UserDailyActivity.Day >= start)
+        if end is not None:
+            query = query.where(UserDailyActivity.Day < end)
+        return db.session.execute(query.order_by(UserDailyActivity.Day)).scalars().all()
+
+    def hour_histogram(self, user_id: int, start: Optional[date] = None,
+                       end: Optional[date] = None) -> Dict[int, int]:
+        """Watches per hour of day for a user over an optional [start, end) range."""
+        query = (
+            db.select(UserHourlyActivity.Hour, func.sum(UserHourlyActivity.Watches))
+            .where(UserHourlyActivity.UserId == user_id)
+            .group_by(UserHourlyActivity.Hour)
+        )
+        if start is not None:
+            query = query.where(UserHourlyActivity.Day >= start)
+        if end is not None:
+            query = query.where(UserHourlyActivity.Day < end)
+        return {int(hour): int(watches) for hour, watches in db.session.execute(query) if watches}
+
+    def rating_counts(self, user_id: int) -> Dict[float, int]:
+        """Number of the user's reviews per rating value."""
+        return dict(db.session.execute(
+            db.select(UserRatingCount.Rating, UserRatingCount.Reviews)
+            .where(UserRatingCount.UserId == user_id, UserRatingCount.Reviews > 0)
+            .order_by(UserRatingCount.Rating)
+        ).all())
+
+    def heatmap(self, user_id: Optional[int] = None, start: Optional[date] = None,
+                end: Optional[date] = None, tz: str = 'UTC') -> Dict[str, Any]:
+        """
+        Day-of-week x hour-of-day watch and read counts, for one user or everyone.
+
+        One grouped query returns at most 24 rows per day in the range; the (day, hour)
+        buckets are then shifted into the requested time zone and binned in Python.
+
+        Args:
+            user_id: Only this user's activity; None for all users
+            start: First UTC day included
+            end: First UTC day excluded
+            tz: IANA time zone name the weekdays and hours are reported in
+
+        Returns:
+            Dict with 'timezone', 'weekdays', and 7x24 'watches' and 'reads' matrices
+            (rows Monday..Sunday, columns hours 0..23)
+
+        Raises:
+            ValueError: If the time zone is unknown
+        """
+        try:
+            zone = ZoneInfo(tz)
+        except (ZoneInfoNotFoundError, ValueError) as e:
+            raise ValueError(f"Unknown time zone: {tz}") from e
+
+        query = (
+            db.select(UserHourlyActivity.Day, UserHourlyActivity.Hour,
+                      func.sum(UserHourlyActivity.Watches), func.sum(UserHourlyActivity.Reads))
+            .group_by(UserHourlyActivity.Day, UserHourlyActivity.Hour)
+        )
+        if user_id is not None:
+            query = query.where(UserHourlyActivity.UserId == user_id)
+        if start is not None:
+            query = query.where(UserHourlyActivity.Day >= start)
+        if end is not None:
+            query = query.where(UserHourlyActivity.Day < end)
+
+        watches = [[0] * 24 for _ in WEEKDAYS]
+        reads = [[0] * 24 for _ in WEEKDAYS]
+        for day, hour, day_watches, day_reads in db.session.execute(query):
+            # Buckets are UTC hours; the bucket's start decides its local weekday and hour
+            local = datetime.combine(as_date(day), time(int(hour)), timezone.utc).astimezone(zone)
+            watches[local.weekday()][local.hour] += int(day_watches or 0)
+            reads[local.weekday()][local.hour] += int(day_reads or 0)
+        return {'timezone': tz, 'weekdays': list(WEEKDAYS), 'watches': watches, 'reads': reads}
+
+    def backfill(self, batch_size: int = DEFAULT_BATCH_SIZE) -> Dict[str, int]:
+        """
+        Rebuild the rollup tables from raw history, a batch of users at a time.
+
+        Run it while history writes are paused; rows written during a backfill
+        may be counted twice or missed.
+
+        Returns:
+            Number of users processed and daily/hourly/rating rows written
+        """
+        db.session.execute(delete(UserDailyActivity))
+        db.session.execute(delete(UserHourlyActivity))
+        db.session.execute(delete(UserRatingCount))
+        db.session.commit()
+
+        user_ids = db.session.execute(db.select(User.UserId).order_by(User.UserId)).scalars().all()
+        report = {'users': len(user_ids), 'daily_rows': 0, 'hourly_rows': 0, 'rating_rows': 0}
+        for i in range(0, len(user_ids), batch_size):
+            daily, hourly, ratings = self._aggregate(user_ids[i:i + batch_size])
+            if daily:
+                db.session.execute(insert(UserDailyActivity), daily)
+            if hourly:
+                db.session.execute(insert(UserHourlyActivity), hourly)
+            if ratings:
+                db.session.execute(insert(UserRatingCount), ratings)
+            db.session.commit()
+            report['daily_rows'] += len(daily)
+            report['hourly_rows'] += len(hourly)
+            report['rating_rows'] += len(ratings)
+        ReportEngine().clear()
+        AnalyticsCache().clear()
+        return report
+
+    @staticmethod
+    def _aggregate(user_ids: List[int]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Group a batch of users' raw history into rollup rows."""
+        daily: Dict[Tuple[int, date], Dict[str, Any]] = defaultdict(lambda: dict.fromkeys(DAILY_COUNTERS, 0))
+
+        for model, counter in ((WatchHistory, 'Watches'), (ReadHistory, 'Reads')):
+            user_attr, date_attr = _SOURCES[model]
+            user_col, day = getattr(model, user_attr), day_of(getattr(model, date_attr))
+            for user_id, bucket, count in db.session.execute(
+                db.select(user_col, day, func.count())
+                .where(user_col.in_(user_ids), getattr(model, date_attr).isnot(None))
+                .group_by(user_col, day)
+            ):
+                daily[(user_id, as_date(bucket))][counter] = count
+
+        day = day_of(Review.CreatedAt)
+        for user_id, bucket, count, rated, rating_sum in db.session.execute(
+            db.select(Review.UserId, day, func.count(), func.count(Review.Rating), func.sum(Review.Rating))
+            .where(Review.UserId.in_(user_ids), Review.CreatedAt.isnot(None))
+            .group_by(Review.UserId, day)
+        ):
+            row = daily[(user_id, as_date(bucket))]
+            row.update(Reviews=count, RatedReviews=rated, RatingSum=float(rating_sum or 0.0))
+
+        hourly: Dict[Tuple[int, date, int], Dict[str, Any]] = defaultdict(lambda: dict.fromkeys(HOURLY_COUNTERS, 0))
+        for model, counter in ((WatchHistory, 'Watches'), (ReadHistory, 'Reads')):
+            user_attr, date_attr = _SOURCES[model]
+            user_col, timestamp = getattr(model, user_attr), getattr(model, date_attr)
+            day, hour = day_of(timestamp), hour_of(timestamp)
+            for user_id, bucket, bucket_hour, count in db.session.execute(
+                db.select(user_col, day, hour, func.count())
+                .where(user_col.in_(user_ids), timestamp.isnot(None))
+                .group_by(user_col, day, hour)
+            ):
+                hourly[(user_id, as_date(bucket), int(bucket_hour))][counter] = count
+
+        ratings = [{'UserId': user_id, 'Rating': float(rating), 'Reviews': count}
+                   for user_id, rating, count in db.session.execute(
+                       db.select(Review.UserId, Review.Rating, func.count())
+                       .where(Review.UserId.in_(user_ids), Review.Rating.isnot(None))
+                       .group_by(Review.UserId, Review.Rating)
+                   )]
+
+        return (
+            [dict(counters, UserId=user_id, Day=bucket) for (user_id, bucket), counters in daily.items()],
+            [dict(counters, UserId=user_id, Day=bucket, Hour=hour)
+             for (user_id, bucket, hour), counters in hourly.items()],
+            ratings
+        )
+
+
+def _utc(value: datetime) -> datetime:
+    """Aware datetimes are converted to UTC; naive ones are already UTC."""
+    return value.astimezone(timezone.utc) if value.tzinfo is not None else value
+
+
+def _contribution(model, values: Dict[str, Any]) -> Optional[Tuple[int, datetime, Dict[str, float], Optional[float]]]:
+    """A history or review row's (user, timestamp, counter deltas, rating), or None if it counts nowhere."""
+    user_attr, date_attr = _SOURCES[model]
+    user_id, timestamp = values[user_attr], values[date_attr]
+    if user_id is None or timestamp is None:
+        return None
+    rating = None
+    if model is WatchHistory:
+        deltas = {'Watches': 1}
+    elif model is ReadHistory:
+        deltas = {'Reads': 1}
+    else:
+        deltas = {'Reviews': 1}
+        if values['Rating'] is not None:
+            rating = float(values['Rating'])
+            deltas.update(RatedReviews=1, RatingSum=rating)
+    return user_id, _utc(timestamp), deltas, rating
+
+
+def _tracked(model) -> Tuple[str, ...]:
+    """Attributes a model's rollup contribution depends on."""
+    return _SOURCES[model] + (('Rating',) if model is Review else ())
+
+
+def _stored_values(mapper, connection, target) -> Dict[str, Any]:
+    """The row's values as currently stored, i.e. what the rollups were built from."""
+    model, attrs = mapper.class_, _tracked(mapper.class_)
+    key = mapper.primary_key_from_instance(target)
+    row = connection.execute(
+        select(*(getattr(model, attr) for attr in attrs))
+        .where(*(column == value for column, value in zip(mapper.primary_key, key)))
+    ).one()
+    return dict(zip(attrs, row))
+
+
+def _apply(connection, contribution, sign: int) -> None:
+    """Add (sign=1) or remove (sign=-1) one row's contribution to the rollups."""
+    user_id, timestamp, deltas, rating = contribution
+    day = timestamp.date()
+    _increment(connection, UserDailyActivity.__table__, {'UserId': user_id, 'Day': day},
+               {name: sign * value for name, value in deltas.items()}, DAILY_COUNTERS)
+    hourly = {name: sign for name in HOURLY_COUNTERS if name in deltas}
+    if hourly:
+        _increment(connection, UserHourlyActivity.__table__,
+                   {'UserId': user_id, 'Day': day, 'Hour': timestamp.hour},
+                   hourly, HOURLY_COUNTERS)
+    if rating is not None:
+        _increment(connection, UserRatingCount.__table__, {'UserId': user_id, 'Rating': rating},
+                   {'Reviews': sign}, ('Reviews',))
+
+
+def _increment(connection, table, key: Dict[str, Any], deltas: Dict[str, float], counters) -> None:
+    """UPDATE the keyed row by deltas, inserting it when it does not exist yet."""
+    statement = (
+        update(table)
+        .where(*(table.c[name] == value for name, value in key.items()))
+        .values({name: table.c[name] + value for name, value in deltas.items()})
+    )
+    if connection.execute(statement).rowcount:
+        return
+    row = dict.fromkeys(counters, 0)
+    row.update(deltas)
+    row.update(key)
+    try:
+        with connection.begin_nested():
+            connection.execute(insert(table).values(row))
+    except IntegrityError:
+        # Another transaction created the row between our UPDATE and INSERT
+        connection.execute(statement)
+
+
+def _on_insert(mapper, connection, target) -> None:
+    contribution = _contribution(mapper.class_, {attr: getattr(target, attr) for attr in _tracked(mapper.class_)})
+    if contribution is not None:
+        _apply(connection, contribution, 1)
+
+
+def _on_delete(mapper, connection, target) -> None:
+    """Runs before the DELETE so the stored row can still be read."""
+    contribution = _contribution(mapper.class_, _stored_values(mapper, connection, target))
+    if contribution is not None:
+        _apply(connection, contribution, -1)
+
+
+def _on_update(mapper, connection, target) -> None:
+    """Runs before the UPDATE: move the row's contribution from its stored to its new values."""
+    changes = {attr: get_history(target, attr) for attr in _tracked(mapper.class_)}
+    if not any(history.added for history in changes.values()):
+        return
+    stored = _stored_values(mapper, connection, target)
+    updated = dict(stored)
+    updated.update({attr: history.added[0] for attr, history in changes.items() if history.added})
+    old, new = _contribution(mapper.class_, stored), _contribution(mapper.class_, updated)
+    if old == new:
+        return
+    if old is not None:
+        _apply(connection, old, -1)
+    if new is not None:
+        _apply(connection, new, 1)
+
+
+for _model in _SOURCES:
+    event.listen(_model, 'after_insert', _on_insert)
+    event.listen(_model, 'before_delete', _on_delete)
+    event.listen(_model, 'before_update', _on_update)
@@ -2,8 +2,8 @@
 Analytics Service: Provides viewing habits visualization and analytics.
 
 This service implements the analytics functionality for the Film Adaptation Tracker,
-providing insights into user viewing habits, preferences, and trends. It uses pandas
-for data analysis and visualization.
+providing insights into user viewing habits, preferences, and trends. Aggregates are
+read from the per-user daily rollup tables or grouped in the database.
 
 Features:
 - User viewing statistics
@@ -15,13 +15,16 @@ Features:
 - Weekly report generation
 """
 
-from typing import Dict, Any, List, Optional
-from ..models import User, WatchHistory, Movie, Review, db
+from typing import Dict, Any, List, Optional, Tuple
+from ..models import User, WatchHistory, Movie, Review, UserDailyActivity, db
 from sqlalchemy import func
 from datetime import datetime, timedelta
-import pandas as pd
 from flask import current_app
 from sqlalchemy.exc import SQLAlchemyError
+from .analytics_rollup import AnalyticsRollup
+from .report_engine import ReportEngine, last_days
+from .activity_timeline import ActivityTimeline, MAX_LIMIT
+from .analytics_cache import AnalyticsCache
 
 class AnalyticsService:
     """Service class for analyzing user viewing habits and preferences."""
@@ -41,14 +44,13 @@ class AnalyticsService:
             ValueError: If data processing fails
         """
         try:
-            # Collect all necessary data
-            watch_history = WatchHistory.query.filter_by(userID=user.userID).all()
-            reviews = Review.query.filter_by(userID=user.userID).all()
+            # Habits and rating totals come from the per-day rollups: O(days) rows
+            daily = AnalyticsRollup().daily(user.UserId)
             
             return {
-                'viewing_habits': self._analyze_viewing_habits(watch_history),
-                'genre_preferences': self._analyze_genre_preferences(watch_history),
-                'rating_distribution': self._analyze_ratings(reviews),
+                'viewing_habits': self._analyze_viewing_habits(user.UserId, daily),
+                'genre_preferences': self._analyze_genre_preferences(user.UserId),
+                'rating_distribution': self._analyze_ratings(user.UserId, daily),
                 'recent_activity': self._get_recent_activity(user)
             }
             
@@ -59,17 +61,33 @@ class AnalyticsService:
             current_app.logger.error(f"Error processing analytics: {str(e)}")
             raise ValueError(f"Failed to process analytics: {str(e)}")
 
-    def _analyze_viewing_habits(self, watch_history: List[WatchHistory]) -> Dict[str, Any]:
+    def get_cached_user_analytics(self, user: User, version: Optional[int] = None) -> Tuple[str, Dict[str, Any]]:
+        """
+        Get the user's analytics from the versioned cache, computing them on a miss.
+        
+        Args:
+            user (User): The user to analyze
+            version: The user's activity version, if already read
+            
+        Returns:
+            Tuple of (etag, analytics dict)
+        """
+        return AnalyticsCache().get_or_compute(user.UserId, lambda: self.get_user_analytics(user), version)
+
+    def _analyze_viewing_habits(self, user_id: int, daily: List[UserDailyActivity]) -> Dict[str, Any]:
         """
         Analyze temporal patterns in user's viewing habits.
         
         Args:
-            watch_history: List of user's watch history entries
+            user_id: ID of the user to analyze
+            daily: The user's daily rollup rows, oldest first
             
         Returns:
             Dict containing viewing pattern metrics
         """
-        if not watch_history:
+        watch_days = [row for row in daily if row.Watches]
+        total_watched = sum(row.Watches for row in watch_days)
+        if not total_watched:
             return {
                 'total_watched': 0,
                 'average_per_week': 0,
@@ -78,59 +96,62 @@ class AnalyticsService:
             }
 
         try:
-            # Convert to pandas DataFrame for analysis
-            df = pd.DataFrame([{
-                'date': wh.watched_date,
-                'movie_id': wh.movieID,
-                'hour': wh.watched_date.hour
-            } for wh in watch_history])
-            
             # Calculate metrics
-            total_watched = len(watch_history)
-            date_range = (df['date'].max() - df['date'].min()).days
+            date_range = (watch_days[-1].Day - watch_days[0].Day).days
             weeks = max(1, date_range / 7)
             avg_per_week = round(total_watched / weeks, 2)
             
-            # Find peak viewing time
-            peak_hour = df['hour'].mode().iloc[0] if not df.empty else None
-            
-            # Create viewing trend
-            df['date'] = pd.to_datetime(df['date'])
-            trend = df.groupby(df['date'].dt.date).size()
+            # Find peak viewing time (ties go to the earliest hour)
+            histogram = AnalyticsRollup().hour_histogram(user_id)
+            peak_hour = min(histogram, key=lambda hour: (-histogram[hour], hour)) if histogram else None
             
             return {
                 'total_watched': total_watched,
                 'average_per_week': avg_per_week,
                 'peak_viewing_time': f"{peak_hour}:00" if peak_hour is not None else None,
-                'viewing_trend': trend.to_dict()
+                'viewing_trend': {row.Day.isoformat(): row.Watches for row in watch_days}
             }
             
         except Exception as e:
             current_app.logger.error(f"Error analyzing viewing habits: {str(e)}")
             return {
-                'total_watched': len(watch_history),
+                'total_watched': total_watched,
                 'error': 'Failed to analyze viewing patterns'
             }
 
-    def _analyze_genre_preferences(self, watch_history: List[WatchHistory]) -> Dict[str, Any]:
+    def _analyze_genre_preferences(self, user_id: int) -> Dict[str, Any]:
         """
         Analyze user's genre preferences based on watch history.
         
+        Not rolled up: genres belong to the movie and change when its TMDb details
+        are refreshed, which would mean rewriting every watcher's rollup. Watches
+        are grouped per movie in SQL over the (userID, watched_date) index instead,
+        so this reads one row per distinct movie watched.
+        
         Args:
-            watch_history: List of user's watch history entries
+            user_id: ID of the user to analyze
             
         Returns:
             Dict containing genre preference metrics
         """
         try:
             genre_counts = {}
-            total_movies = len(watch_history)
-            
-            for wh in watch_history:
-                movie = Movie.query.get(wh.movieID)
-                if movie and movie.genres:
-                    for genre in movie.genres:
-                        genre_counts[genre] = genre_counts.get(genre, 0) + 1
+            total_movies = 0
+            
+            # Watches per movie grouped in SQL, then one join instead of a Movie lookup per watch
+            per_movie = (
+                db.select(WatchHistory.movieID, func.count(WatchHistory.id).label('watches'))
+                .where(WatchHistory.userID == user_id)
+                .group_by(WatchHistory.movieID)
+                .subquery()
+            )
+            for movie, watches in db.session.execute(
+                db.select(Movie, per_movie.c.watches)
+                .join(per_movie, per_movie.c.movieID == Movie.movieID)
+            ):
+                total_movies += watches
+                for genre in movie.genres:
+                    genre_counts[genre] = genre_counts.get(genre, 0) + watches
             
             # Calculate percentages
             genre_preferences = {
@@ -155,114 +176,102 @@ class AnalyticsService:
             current_app.logger.error(f"Error analyzing genre preferences: {str(e)}")
             return {'error': 'Failed to analyze genre preferences'}
 
-    def _analyze_ratings(self, reviews: List[Review]) -> Dict[str, Any]:
+    def _analyze_ratings(self, user_id: int, daily: List[UserDailyActivity]) -> Dict[str, Any]:
         """
         Analyze user's rating distribution and patterns.
         
         Args:
-            reviews: List of user's reviews
+            user_id: ID of the user to analyze
+            daily: The user's daily rollup rows
             
         Returns:
             Dict containing rating metrics
         """
         try:
-            if not reviews:
+            total_reviews = sum(row.Reviews for row in daily)
+            if not total_reviews:
                 return {
                     'average_rating': 0,
                     'total_reviews': 0,
                     'rating_distribution': {}
                 }
             
-            ratings = [review.rating for review in reviews]
-            rating_counts = pd.Series(ratings).value_counts().to_dict()
+            rated = sum(row.RatedReviews for row in daily)
+            rating_sum = sum(row.RatingSum for row in daily)
+            rating_counts = AnalyticsRollup().rating_counts(user_id)
             
             return {
-                'average_rating': round(sum(ratings) / len(ratings), 2),
-                'total_reviews': len(reviews),
+                'average_rating': round(rating_sum / rated, 2) if rated else 0,
+                'total_reviews': total_reviews,
                 'rating_distribution': rating_counts,
-                'highest_rated_movies': self._get_highest_rated_movies(reviews)
+                'highest_rated_movies': self._get_highest_rated_movies(user_id)
             }
             
         except Exception as e:
             current_app.logger.error(f"Error analyzing ratings: {str(e)}")
             return {'error': 'Failed to analyze ratings'}
 
-    def _get_highest_rated_movies(self, reviews: List[Review], limit: int = 5) -> List[Dict[str, Any]]:
+    def _get_highest_rated_movies(self, user_id: int, limit: int = 5) -> List[Dict[str, Any]]:
         """
         Get user's highest rated movies.
         
+        Not rolled up: the (UserId, Rating, CreatedAt) index on Reviews already
+        returns the top rows by reading only the last few entries of the user's range.
+        
         Args:
-            reviews: List of user's reviews
+            user_id: ID of the user
             limit: Maximum number of movies to return
             
         Returns:
             List of highest rated movies with details
         """
         try:
-            sorted_reviews = sorted(reviews, key=lambda x: x.rating, reverse=True)[:limit]
+            rows = db.session.execute(
+                db.select(Review.movieID, Movie.title, Review.Rating, Review.CreatedAt)
+                .join(Movie, Movie.movieID == Review.movieID)
+                .where(Review.UserId == user_id, Review.Rating.isnot(None))
+                .order_by(Review.Rating.desc(), Review.CreatedAt.desc())
+                .limit(limit)
+            ).all()
             return [{
-                'movie_id': review.movieID,
-                'title': Movie.query.get(review.movieID).title,
-                'rating': review.rating,
-                'review_date': review.created_at
-            } for review in sorted_reviews]
+                'movie_id': movie_id,
+                'title': title,
+                'rating': rating,
+                'review_date': created_at
+            } for movie_id, title, rating, created_at in rows]
         except Exception as e:
             current_app.logger.error(f"Error getting highest rated movies: {str(e)}")
             return []
 
-    def _get_recent_activity(self, user: User, days: int = 30) -> List[Dict[str, Any]]:
+    def _get_recent_activity(self, user: User, days: int = 30, limit: Optional[int] = None) -> List[Dict[str, Any]]:
         """
         Get user's recent activity across all interactions.
         
         Args:
             user: User to get activity for
             days: Number of days of history to return
+            limit: Maximum number of items returned; None for everything in the window
             
         Returns:
-            List of recent activity items
+            List of recent activity items, newest first. Watch and review items keep
+            the 'movie_title' key next to the timeline's 'title'.
         """
         try:
             cutoff_date = datetime.utcnow() - timedelta(days=days)
             
-            # Get recent watches
-            recent_watches = WatchHistory.query.filter(
-                WatchHistory.userID == user.userID,
-                WatchHistory.watched_date >= cutoff_date
-            ).all()
-            
-            # Get recent reviews
-            recent_reviews = Review.query.filter(
-                Review.userID == user.userID,
-                Review.created_at >= cutoff_date
-            ).all()
-            
-            # Combine and sort activities
-            activities = []
-            
-            for watch in recent_watches:
-                movie = Movie.query.get(watch.movieID)
-                activities.append({
-                    'type': 'watch',
-                    'movie_title': movie.title if movie else 'Unknown Movie',
-                    'date': watch.watched_date,
-                    'details': None
-                })
-            
-            for review in recent_reviews:
-                movie = Movie.query.get(review.movieID)
-                activities.append({
-                    'type': 'review',
-                    'movie_title': movie.title if movie else 'Unknown Movie',
-                    'date': review.created_at,
-                    'details': {
-                        'rating': review.rating,
-                        'comment': review.comment
-                    }
-                })
-            
-            # Sort by date
-            activities.sort(key=lambda x: x['date'], reverse=True)
-            
+            # Watches, reads, reviews and list additions, a keyset page at a time
+            activities, cursor = [], None
+            while limit is None or len(activities) < limit:
+                page_size = MAX_LIMIT if limit is None else min(MAX_LIMIT, limit - len(activities))
+                page = ActivityTimeline().page(user.UserId, limit=page_size, cursor=cursor, since=cutoff_date)
+                activities.extend(page['items'])
+                cursor = page['next_cursor']
+                if cursor is None:
+                    break
+            
+            for item in activities:
+                if item['type'] in ('watch', 'review'):
+                    item['movie_title'] = item['title'] or 'Unknown Movie'
             return activities
             
         except Exception as e:
@@ -286,11 +295,15 @@ class AnalyticsService:
             # System load metrics
             system_stats = self._get_system_metrics()
             
+            # Recommendation cache metrics
+            cache_stats = self._get_recommendation_cache_metrics()
+            
             return {
                 'timestamp': datetime.utcnow(),
                 'database': db_stats,
                 'api': api_stats,
-                'system': system_stats
+                'system': system_stats,
+                'recommendation_cache': cache_stats
             }
         except Exception as e:
             current_app.logger.error(f"Error collecting performance metrics: {str(e)}")
@@ -327,6 +340,7 @@ class AnalyticsService:
             
             return {
                 'average_response_time': APIMonitor.get_average_response_time(),
+                'latency_percentiles': APIMonitor.get_latency_percentiles(),
                 'requests_per_minute': APIMonitor.get_requests_per_minute(),
                 'error_rate': APIMonitor.get_error_rate()
             }
@@ -334,6 +348,16 @@ class AnalyticsService:
             current_app.logger.error(f"Error getting API metrics: {str(e)}")
             return {'error': str(e)}
 
+    def _get_recommendation_cache_metrics(self) -> Dict[str, Any]:
+        """Get recommendation cache hit-rate and staleness metrics."""
+        try:
+            from .recommendation_cache import RecommendationCache
+            
+            return RecommendationCache().get_metrics()
+        except Exception as e:
+            current_app.logger.error(f"Error getting recommendation cache metrics: {str(e)}")
+            return {'error': str(e)}
+
     def _get_system_metrics(self) -> Dict[str, Any]:
         """Get system performance metrics."""
         try:
@@ -351,40 +375,26 @@ class AnalyticsService:
     def generate_weekly_report(self) -> Dict[str, Any]:
         """Generate weekly performance and analytics report."""
         try:
-            end_date = datetime.utcnow()
-            start_date = end_date - timedelta(days=7)
-            
-            # Collect metrics
-            performance_data = self.collect_performance_metrics()
-            
-            # Get user activity stats
-            total_users = User.query.count()
-            active_users = WatchHistory.query.filter(
-                WatchHistory.watched_date >= start_date
-            ).distinct(WatchHistory.userID).count()
-            
-            # Get content stats
-            total_movies = Movie.query.count()
-            new_reviews = Review.query.filter(
-                Review.created_at >= start_date
-            ).count()
-            
-            return {
-                'period': {
-                    'start': start_date,
-                    'end': end_date
-                },
-                'user_metrics': {
-                    'total_users': total_users,
-                    'active_users': active_users,
-                    'engagement_rate': round(active_users / total_users * 100, 2) if total_users > 0 else 0
-                },
-                'content_metrics': {
-                    'total_movies': total_movies,
-                    'new_reviews': new_reviews
-                },
-                'performance_metrics': performance_data
-            }
+            start_date, end_date = last_days(7)
+            report = dict(self.generate_report(start_date, end_date))
+            report['performance_metrics'] = self.collect_performance_metrics()
+            return report
         except Exception as e:
             current_app.logger.error(f"Error generating weekly report: {str(e)}")
             return {'error': str(e)}
+
+    def generate_report(self, start, end) -> Dict[str, Any]:
+        """
+        Generate the activity report for an arbitrary [start, end) window of days.
+        
+        Args:
+            start: First day included (date, datetime or ISO date string)
+            end: First day excluded
+            
+        Returns:
+            Dict containing period, user, activity and content metrics
+            
+        Raises:
+            ValueError: If the window is empty
+        """
+        return ReportEngine().report(start, end)
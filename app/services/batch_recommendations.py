@@ -0,0 +1,297 @@
+"""
+Batch Recommendations: Precomputes recommendation lists for every user.
+
+The parent process exports the movie/genre matrix once to .npy files and then
+shards user ids across a process pool. Each worker memory-maps the matrix
+read-only, so the pages are shared between workers rather than copied. It then
+scores whole shards with one matrix-vector product per user and bulk-writes the
+results into user_recommendations, the table served by RecommendationCache.
+Users without watch history are skipped: they are served live trending picks,
+which a nightly snapshot would freeze. Workers are spawned rather than forked,
+since the parent may already be running scheduler and refresher threads, and they
+create their application from the parent's configuration (create_app() never starts
+the scheduler in a worker).
+
+Scoring matches RecommendationService: a genre's preference is the user's average
+rating (3.0 when unrated) over watched movies in that genre. A movie's score is
+the sum of its genres' preferences, with watched movies excluded.
+"""
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+
+from flask import current_app
+from sqlalchemy import delete, insert, update
+from sqlalchemy.exc import IntegrityError
+
+from ..models import db, User, Movie, WatchHistory, Review, UserRecommendation
+from ..utils.lazy_import import lazy_import
+
+np = lazy_import('numpy')
+
+DEFAULT_RATING = 3.0
+DEFAULT_SHARD_SIZE = 500
+# Shard writes retried when the live cache inserts one of the shard's users first
+WRITE_ATTEMPTS = 3
+
+# Per-process state set up by _init_worker
+_worker: Dict[str, Any] = {}
+
+
+def export_movie_matrix(path: str) -> Dict[str, Any]:
+    """
+    Write the movie/genre matrix and its metadata to path.
+
+    Returns:
+        Metadata describing the matrix shape and genre vocabulary
+    """
+    movie_ids: List[int] = []
+    ratings: List[float] = []
+    rows: List[List[str]] = []
+    genres_seen: Dict[str, int] = {}
+
+    query = db.select(Movie).execution_options(yield_per=1000)
+    for movie in db.session.execute(query).scalars():
+        genres = movie.genres
+        movie_ids.append(movie.movieID)
+        ratings.append(movie.average_rating if movie.average_rating is not None else np.nan)
+        rows.append(genres)
+        for genre in genres:
+            genres_seen.setdefault(genre, len(genres_seen))
+    db.session.expunge_all()
+
+    matrix = np.zeros((len(movie_ids), max(1, len(genres_seen))), dtype=np.float32)
+    for i, genres in enumerate(rows):
+        for genre in genres:
+            matrix[i, genres_seen[genre]] = 1.0
+
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, 'genre_matrix.npy'), matrix)
+    np.save(os.path.join(path, 'movie_ids.npy'), np.array(movie_ids, dtype=np.int64))
+    np.save(os.path.join(path, 'average_rating.npy'), np.array(ratings, dtype=np.float32))
+    meta = {'n_movies': len(movie_ids), 'genres': list(genres_seen)}
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    return meta
+
+
+def load_movie_matrix(path: str) -> Dict[str, Any]:
+    """Memory-map an exported movie matrix read-only."""
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    matrix = np.load(os.path.join(path, 'genre_matrix.npy'), mmap_mode='r')
+    movie_ids = np.load(os.path.join(path, 'movie_ids.npy'), mmap_mode='r')
+    return {
+        'matrix': matrix,
+        'movie_ids': movie_ids,
+        'average_rating': np.load(os.path.join(path, 'average_rating.npy'), mmap_mode='r'),
+        'genres': meta['genres'],
+        'position': {int(movie_id): i for i, movie_id in enumerate(movie_ids)},
+        'has_genres': np.asarray(matrix).any(axis=1)
+    }
+
+
+def score_users(data: Dict[str, Any], history: Dict[int, Dict[int, float]],
+                limit: int = 10) -> Dict[int, List[Dict[str, Any]]]:
+    """
+    Score every movie for each user in a shard.
+
+    Args:
+        data: Matrix loaded by load_movie_matrix
+        history: user id -> {watched movie id: rating used for weighting}
+        limit: Recommendations kept per user
+
+    Returns:
+        user id -> list of {'movie_id', 'score', 'genres', 'average_rating'};
+        users without history are left out
+    """
+    matrix, position = data['matrix'], data['position']
+    n_movies = len(data['movie_ids'])
+    results: Dict[int, List[Dict[str, Any]]] = {}
+
+    for user_id, watched in history.items():
+        if not watched:
+            continue
+        rows = [position[m] for m in watched if m in position]
+        if not rows or n_movies == 0:
+            results[user_id] = []
+            continue
+
+        # Average rating per genre over the watched movies
+        watched_matrix = np.asarray(matrix[rows])
+        weights = np.array([watched[int(data['movie_ids'][r])] for r in rows], dtype=np.float32)
+        genre_counts = watched_matrix.sum(axis=0)
+        genre_sums = weights @ watched_matrix
+        preferences = np.divide(genre_sums, genre_counts, out=np.zeros_like(genre_sums),
+                                where=genre_counts > 0)
+
+        scores = np.asarray(matrix @ preferences, dtype=np.float64)
+        scores[~data['has_genres']] = -np.inf
+        scores[rows] = -np.inf
+        candidates = int(np.isfinite(scores).sum())
+        if candidates == 0:
+            results[user_id] = []
+            continue
+
+        n = min(limit, candidates)
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        results[user_id] = [{
+            'movie_id': int(data['movie_ids'][i]),
+            'score': float(scores[i]),
+            'genres': [data['genres'][g] for g in np.flatnonzero(matrix[i])],
+            'average_rating': None if np.isnan(data['average_rating'][i]) else float(data['average_rating'][i])
+        } for i in top]
+
+    return results
+
+
+def _init_worker(config_name: str, matrix_path: str) -> None:
+    """Process pool initializer: application context plus the shared mmap."""
+    # Spawned workers do not inherit the parent's application
+    from app import create_app
+    app = create_app(config_name)
+    context = app.app_context()
+    context.push()
+    _worker['app'] = app
+    _worker['context'] = context
+    _worker['data'] = load_movie_matrix(matrix_path)
+
+
+def _process_shard(user_ids: List[int], limit: int = 10) -> int:
+    """Worker entry point: score and persist one shard of users."""
+    try:
+        written = precompute_shard(_worker['data'], user_ids, limit)
+    finally:
+        db.session.remove()
+    return written
+
+
+def precompute_shard(data: Dict[str, Any], user_ids: List[int], limit: int = 10) -> int:
+    """
+    Load a shard's history in two queries, score it and bulk-write the results.
+
+    Cold-start users are not written, and an entry left from earlier history is
+    deleted so RecommendationCache falls back to trending for them.
+
+    Returns:
+        Number of users written
+    """
+    versions = dict(db.session.execute(
+        db.select(UserRecommendation.UserId, UserRecommendation.Version)
+        .where(UserRecommendation.UserId.in_(user_ids))
+    ).all())
+
+    ratings: Dict[int, Dict[int, float]] = defaultdict(dict)
+    for user_id, movie_id, rating in db.session.execute(
+        db.select(Review.UserId, Review.movieID, Review.Rating)
+        .where(Review.UserId.in_(user_ids), Review.movieID.isnot(None))
+    ):
+        ratings[user_id][movie_id] = rating
+
+    history: Dict[int, Dict[int, float]] = {user_id: {} for user_id in user_ids}
+    for user_id, movie_id in db.session.execute(
+        db.select(WatchHistory.userID, WatchHistory.movieID)
+        .where(WatchHistory.userID.in_(user_ids))
+    ):
+        rating = ratings[user_id].get(movie_id)
+        history[user_id][movie_id] = rating if rating is not None else DEFAULT_RATING
+
+    recommendations = score_users(data, history, limit)
+
+    movie_ids = {r['movie_id'] for recs in recommendations.values() for r in recs}
+    titles = dict(db.session.execute(
+        db.select(Movie.movieID, Movie.title).where(Movie.movieID.in_(movie_ids))
+    ).all()) if movie_ids else {}
+    # End the read transaction so concurrent workers never wait on each other's read locks
+    db.session.commit()
+
+    now = datetime.now(timezone.utc)
+    updates, inserts = [], []
+    for user_id, recs in recommendations.items():
+        payload = json.dumps([dict(r, title=titles.get(r['movie_id'])) for r in recs])
+        if user_id in versions:
+            updates.append({'UserId': user_id, '_recommendations': payload,
+                            'ComputedVersion': versions[user_id], 'ComputedAt': now})
+        else:
+            inserts.append({'UserId': user_id, 'Version': 0, '_recommendations': payload,
+                            'ComputedVersion': 0, 'ComputedAt': now})
+
+    cold_start = [user_id for user_id in versions if user_id not in recommendations]
+    for attempt in range(1, WRITE_ATTEMPTS + 1):
+        try:
+            if cold_start:
+                db.session.execute(delete(UserRecommendation).where(UserRecommendation.UserId.in_(cold_start)))
+            if updates:
+                db.session.execute(update(UserRecommendation), updates)
+            if inserts:
+                db.session.execute(insert(UserRecommendation), inserts)
+            db.session.commit()
+            break
+        except IntegrityError:
+            # RecommendationCache created some entries meanwhile; theirs are at least as fresh
+            db.session.rollback()
+            if attempt == WRITE_ATTEMPTS:
+                raise
+            created = set(db.session.execute(
+                db.select(UserRecommendation.UserId)
+                .where(UserRecommendation.UserId.in_([row['UserId'] for row in inserts]))
+            ).scalars())
+            inserts = [row for row in inserts if row['UserId'] not in created]
+    return len(recommendations)
+
+
+def run_batch(workers: Optional[int] = None, shard_size: int = DEFAULT_SHARD_SIZE,
+              limit: int = 10, config_name: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Precompute recommendations for every user across a process pool.
+
+    Must be called inside an application context. Workers use config_name, by
+    default the configuration the current application was created with.
+
+    Returns:
+        Run report with user count, wall time and throughput
+    """
+    started = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    config_name = config_name or current_app.config.get('CONFIG_NAME', 'default')
+    matrix_path = tempfile.mkdtemp(prefix='recommendation_matrix_')
+    try:
+        meta = export_movie_matrix(matrix_path)
+        user_ids = db.session.execute(db.select(User.UserId).order_by(User.UserId)).scalars().all()
+        db.session.remove()
+
+        shards = [user_ids[i:i + shard_size] for i in range(0, len(user_ids), shard_size)]
+        processed, failed = 0, 0
+        if shards:
+            # Forking while other threads hold locks can deadlock the child
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(config_name, matrix_path),
+                                     mp_context=multiprocessing.get_context('spawn')) as pool:
+                futures = {pool.submit(_process_shard, shard, limit): shard for shard in shards}
+                for future in as_completed(futures):
+                    try:
+                        processed += future.result()
+                    except Exception as e:
+                        failed += len(futures[future])
+                        current_app.logger.error(f"Recommendation shard failed: {str(e)}")
+    finally:
+        shutil.rmtree(matrix_path, ignore_errors=True)
+
+    wall_time = time.perf_counter() - started
+    return {
+        'users': processed,
+        'failed_users': failed,
+        'movies': meta['n_movies'],
+        'workers': workers,
+        'shards': len(shards),
+        'wall_time_seconds': round(wall_time, 3),
+        'users_per_second': round(processed / wall_time, 2) if wall_time > 0 else 0.0
+    }
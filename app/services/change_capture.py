@@ -0,0 +1,202 @@
+"""
+Change Capture: Transaction-scoped change records for every mapped table.
+
+After each flush, the session's new, dirty and deleted instances are reduced to
+compact records:
+
+    {'table': 'movies', 'pk': 42, 'op': 'update', 'columns': ('overview',),
+     'digest': '9f2c4e1a7b3d5c80'}
+
+The digest is a short hash of the listed columns' new values, so two edits of the same
+column can be told apart without carrying the values. Records from all flushes of a
+transaction are merged per row. An insert followed by
+updates stays an insert, and an insert that is then deleted disappears. Once the
+transaction commits, every subscriber receives one batch holding the records for
+the tables it watches. A rollback discards the batch. Subscribers therefore see
+exactly the changes that were persisted, however the rows were loaded, and nothing
+is kept per instance.
+
+Only instances of tables some subscriber watches are turned into records, so
+flushes that touch nothing of interest cost a set lookup per instance.
+
+Subscribers run on the committing thread after the commit and must not use that
+session. Anything slow should be queued, e.g. on the NotificationQueue.
+"""
+import hashlib
+import json
+import logging
+import threading
+from typing import Dict, Any, Callable, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_mapper
+
+logger = logging.getLogger(__name__)
+
+_SESSION_KEY = 'change_capture_records'
+
+INSERT = 'insert'
+UPDATE = 'update'
+DELETE = 'delete'
+
+Handler = Callable[[List[Dict[str, Any]]], None]
+
+
+class ChangeCapture:
+    """
+    Singleton pattern implementation for the change-capture bus
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super(ChangeCapture, cls).__new__(cls)
+                    cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        """Initialize the subscriber list and metric counters."""
+        self._subscribers: List[Tuple[Handler, Optional[frozenset]]] = []
+        self._tables: Optional[frozenset] = frozenset()
+        self._metrics_lock = threading.Lock()
+        self._transactions = 0
+        self._records = 0
+        self._handler_errors = 0
+
+    def subscribe(self, handler: Handler, tables: Optional[Iterable[str]] = None) -> None:
+        """
+        Register a handler for committed changes.
+
+        Args:
+            handler: Called with the list of change records of one transaction
+            tables: Table names to receive records for; None for every table
+        """
+        with self._lock:
+            if all(existing != handler for existing, _ in self._subscribers):
+                self._subscribers.append((handler, frozenset(tables) if tables is not None else None))
+                self._tables = self._watched_tables()
+
+    def unsubscribe(self, handler: Handler) -> None:
+        """Remove a handler registered with subscribe()."""
+        with self._lock:
+            self._subscribers = [(h, t) for h, t in self._subscribers if h != handler]
+            self._tables = self._watched_tables()
+
+    @property
+    def active(self) -> bool:
+        """Whether any handler is registered; flushes are not inspected otherwise."""
+        return bool(self._subscribers)
+
+    @property
+    def tables(self) -> Optional[frozenset]:
+        """Union of the subscribed tables; None when a subscriber watches every table."""
+        return self._tables
+
+    def _watched_tables(self) -> Optional[frozenset]:
+        if any(tables is None for _, tables in self._subscribers):
+            return None
+        return frozenset().union(*(tables for _, tables in self._subscribers))
+
+    def dispatch(self, records: List[Dict[str, Any]]) -> None:
+        """Hand one transaction's records to every interested subscriber."""
+        with self._metrics_lock:
+            self._transactions += 1
+            self._records += len(records)
+        for handler, tables in list(self._subscribers):
+            batch = records if tables is None else [r for r in records if r['table'] in tables]
+            if not batch:
+                continue
+            try:
+                handler(batch)
+            except Exception as e:
+                with self._metrics_lock:
+                    self._handler_errors += 1
+                logger.error(f"Change handler {getattr(handler, '__qualname__', handler)} failed: {str(e)}")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get counts of dispatched transactions, records and handler failures."""
+        with self._metrics_lock:
+            return {
+                'subscribers': len(self._subscribers),
+                'transactions': self._transactions,
+                'records': self._records,
+                'handler_errors': self._handler_errors
+            }
+
+
+def _digest(values: Any) -> str:
+    return hashlib.blake2b(json.dumps(values, default=str).encode(), digest_size=8).hexdigest()
+
+
+def _record(op: str, instance) -> Optional[Dict[str, Any]]:
+    """Compact change record for one flushed instance, or None if no column changed."""
+    state = inspect(instance)
+    mapper = state.mapper
+    if op == UPDATE:
+        props = [prop for prop in mapper.column_attrs if state.attrs[prop.key].history.has_changes()]
+        if not props:
+            return None
+    elif op == INSERT:
+        props = [prop for prop in mapper.column_attrs if state.dict.get(prop.key) is not None]
+    else:
+        props = []
+
+    identity = state.identity or mapper.primary_key_from_instance(instance)
+    return {
+        'table': mapper.persist_selectable.name,
+        'pk': identity[0] if len(identity) == 1 else tuple(identity),
+        'op': op,
+        'columns': tuple(prop.columns[0].name for prop in props),
+        # From the instance dict: reading attributes could reload expired server defaults
+        'digest': _digest([[prop.columns[0].name, state.dict.get(prop.key)] for prop in props]) if props else None
+    }
+
+
+def _merge(pending: Dict[Tuple[str, Any], Dict[str, Any]], record: Dict[str, Any]) -> None:
+    """Fold a record into the transaction's records for the same row."""
+    key = (record['table'], record['pk'])
+    previous = pending.get(key)
+    if previous is None:
+        pending[key] = record
+    elif record['op'] == DELETE:
+        if previous['op'] == INSERT:
+            del pending[key]
+        else:
+            pending[key] = record
+    elif record['op'] == UPDATE and previous['op'] != DELETE:
+        merged = previous['columns'] + tuple(c for c in record['columns'] if c not in previous['columns'])
+        pending[key] = dict(previous, columns=merged, digest=_digest([previous['digest'], record['digest']]))
+    else:
+        pending[key] = record
+
+
+@event.listens_for(Session, 'after_flush')
+def _capture_flush(session: Session, flush_context) -> None:
+    """Collect this flush's changes while new/dirty/deleted and attribute history are intact."""
+    if not ChangeCapture().active:
+        return
+    tables = ChangeCapture().tables
+    pending = session.info.setdefault(_SESSION_KEY, {})
+    for op, instances in ((INSERT, session.new), (UPDATE, session.dirty), (DELETE, session.deleted)):
+        for instance in instances:
+            if tables is not None and object_mapper(instance).persist_selectable.name not in tables:
+                continue
+            record = _record(op, instance)
+            if record is not None:
+                _merge(pending, record)
+
+
+@event.listens_for(Session, 'after_commit')
+def _dispatch_committed(session: Session) -> None:
+    """Hand the committed transaction's changes to the subscribers as one batch."""
+    pending = session.info.pop(_SESSION_KEY, None)
+    if pending:
+        ChangeCapture().dispatch(list(pending.values()))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rolled_back(session: Session) -> None:
+    session.info.pop(_SESSION_KEY, None)
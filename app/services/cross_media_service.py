@@ -0,0 +1,468 @@
+"""
+Cross-Media Service: Suggests movies to readers and books to watchers by walking
+a graph of books and movies.
+
+Edges come from three sources:
+- MovieAdaptations rows link a book to the movie adapted from it (strongest edge);
+- co-reads and co-watches link items consumed by the same user;
+- a user who both read a book and watched a movie links the two.
+
+Scoring is a truncated personalized PageRank: mass starts on the user's read books
+and watched movies and is pushed along normalized edges for a few hops. Only the
+neighbourhood reachable from the seeds is touched, not the whole graph. Small
+graphs are stored and walked as plain lists; numpy is only imported once a graph
+outgrows PURE_PYTHON_MAX_EDGES.
+
+Suggestions are materialized per user in cross_media_recommendations. History and
+adaptation inserts bump a user's version, and a scheduled job recomputes stale rows.
+Each row also records the version of the graph it was computed from (the graph's
+build time), so rows computed before a rebuild are recomputed after it.
+The graph is built by the scheduled rebuild or on a background thread, never on a
+request; until it exists, users without a row get empty suggestions marked stale.
+New adaptation edges are added to the in-memory graph once their row commits; other
+processes pick them up from the database before they recompute suggestions.
+"""
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Tuple, Iterable
+
+from flask import current_app
+from sqlalchemy import case, event, or_
+from sqlalchemy.orm import Session, object_session
+
+from ..models import (db, Movie, Book, MovieAdaptation, WatchHistory, ReadHistory,
+                      CrossMediaRecommendation)
+from ..utils.lazy_import import lazy_import
+
+np = lazy_import('numpy')
+
+ADAPTATION_WEIGHT = 5.0
+CO_ENGAGEMENT_WEIGHT = 1.0
+MAX_ITEMS_PER_USER = 50
+# Graphs up to this many directed edges are walked with plain lists instead of numpy
+PURE_PYTHON_MAX_EDGES = 20000
+
+Node = Tuple[str, int]
+
+_SESSION_KEY = 'cross_media_pending_adaptations'
+
+
+class CrossMediaGraph:
+    """Weighted, row-normalized book/movie graph stored as CSR arrays."""
+
+    def __init__(self):
+        # Build time in milliseconds; rows computed from an older graph are stale
+        self.version = int(time.time() * 1000)
+        self._nodes: Dict[Node, int] = {}
+        self._refs: List[Node] = []
+        self._edges: Dict[Tuple[int, int], float] = defaultdict(float)
+        self._adaptations: Dict[Node, set] = defaultdict(set)
+        self._dirty = True
+        # (vectorized, ptr, indices, weights), replaced as a whole so readers never mix
+        # arrays from two compiles; plain lists until the graph is worth numpy (see _compile)
+        self._csr: Tuple[bool, Any, Any, Any] = (False, [0], [], [])
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._refs)
+
+    def _node(self, node: Node) -> int:
+        idx = self._nodes.get(node)
+        if idx is None:
+            idx = len(self._refs)
+            self._nodes[node] = idx
+            self._refs.append(node)
+        return idx
+
+    def add_edge(self, a: Node, b: Node, weight: float) -> None:
+        """Add an undirected edge, accumulating weight on repeats."""
+        if a == b:
+            return
+        with self._lock:
+            i, j = self._node(a), self._node(b)
+            self._edges[(i, j)] += weight
+            self._edges[(j, i)] += weight
+            self._dirty = True
+
+    def add_adaptation(self, book_id: int, movie_id: int) -> bool:
+        """Link a book to a movie adapted from it; False if they are already linked."""
+        book, movie = ('book', book_id), ('movie', movie_id)
+        with self._lock:
+            if movie in self._adaptations[book]:
+                return False
+            self._adaptations[book].add(movie)
+            self._adaptations[movie].add(book)
+        self.add_edge(book, movie, ADAPTATION_WEIGHT)
+        return True
+
+    def add_co_engagement(self, items: Iterable[Node]) -> None:
+        """Link every pair of items engaged with by the same user."""
+        items = list(dict.fromkeys(items))[:MAX_ITEMS_PER_USER]
+        for x in range(len(items)):
+            for y in range(x + 1, len(items)):
+                self.add_edge(items[x], items[y], CO_ENGAGEMENT_WEIGHT)
+
+    def adaptations_of(self, node: Node) -> set:
+        return self._adaptations.get(node, set())
+
+    def _compile(self) -> None:
+        """Rebuild the CSR arrays after edges were added."""
+        with self._lock:
+            if not self._dirty:
+                return
+            n = len(self._refs)
+            if len(self._edges) <= PURE_PYTHON_MAX_EDGES:
+                self._csr = self._compile_lists(n)
+                self._dirty = False
+                return
+            pairs = np.array(list(self._edges.keys()), dtype=np.int64)
+            weights = np.fromiter(self._edges.values(), dtype=np.float64, count=len(self._edges))
+            order = np.lexsort((pairs[:, 1], pairs[:, 0]))
+            src, dst, weights = pairs[order, 0], pairs[order, 1], weights[order]
+            out_degree = np.bincount(src, weights=weights, minlength=n)
+            ptr = np.zeros(n + 1, dtype=np.int64)
+            np.cumsum(np.bincount(src, minlength=n), out=ptr[1:])
+            self._csr = (True, ptr, dst, weights / out_degree[src])
+            self._dirty = False
+
+    def _compile_lists(self, n: int) -> Tuple[bool, List[int], List[int], List[float]]:
+        """Pure-Python CSR for small graphs, so they never import numpy."""
+        rows: List[List[Tuple[int, float]]] = [[] for _ in range(n)]
+        for (i, j), weight in sorted(self._edges.items()):
+            rows[i].append((j, weight))
+        ptr, indices, weights = [0], [], []
+        for row in rows:
+            out_degree = sum(weight for _, weight in row)
+            for j, weight in row:
+                indices.append(j)
+                weights.append(weight / out_degree)
+            ptr.append(len(indices))
+        return False, ptr, indices, weights
+
+    def personalized_rank(self, seeds: Dict[Node, float], alpha: float = 0.15,
+                          hops: int = 3, epsilon: float = 1e-4) -> Dict[Node, float]:
+        """
+        Truncated personalized PageRank from the given seed weights.
+
+        Args:
+            seeds: Starting mass per node (normalized internally)
+            alpha: Restart probability; (1 - alpha) of the mass moves each hop
+            hops: Number of propagation steps
+            epsilon: Frontier entries below this mass are dropped
+
+        Returns:
+            Accumulated score per reachable node, seeds included
+        """
+        self._compile()
+        vectorized, ptr, indices, weights = self._csr
+        frontier: Dict[int, float] = {}
+        total = sum(seeds.values())
+        for node, mass in seeds.items():
+            idx = self._nodes.get(node)
+            if idx is not None and total > 0:
+                frontier[idx] = frontier.get(idx, 0.0) + mass / total
+
+        scores: Dict[int, float] = defaultdict(float)
+        for idx, mass in frontier.items():
+            scores[idx] += alpha * mass
+
+        for _ in range(hops):
+            if not frontier:
+                break
+            if not vectorized:
+                spread_by_node: Dict[int, float] = defaultdict(float)
+                for node_idx, value in frontier.items():
+                    pushed = value * (1 - alpha)
+                    for position in range(ptr[node_idx], ptr[node_idx + 1]):
+                        spread_by_node[indices[position]] += pushed * weights[position]
+                frontier = {}
+                for node_idx, value in sorted(spread_by_node.items()):
+                    scores[node_idx] += alpha * value
+                    if value >= epsilon:
+                        frontier[node_idx] = value
+                continue
+            idx = np.fromiter(frontier.keys(), dtype=np.int64, count=len(frontier))
+            mass = np.fromiter(frontier.values(), dtype=np.float64, count=len(frontier))
+            starts, ends = ptr[idx], ptr[idx + 1]
+            lengths = ends - starts
+            if not lengths.sum():
+                break
+            positions = np.concatenate([np.arange(s, e) for s, e in zip(starts, ends) if e > s])
+            pushed = np.repeat(mass * (1 - alpha), lengths) * weights[positions]
+            neighbours, inverse = np.unique(indices[positions], return_inverse=True)
+            spread = np.bincount(inverse, weights=pushed)
+
+            frontier = {}
+            for node_idx, value in zip(neighbours.tolist(), spread.tolist()):
+                scores[node_idx] += alpha * value
+                if value >= epsilon:
+                    frontier[node_idx] = value
+
+        return {self._refs[idx]: score for idx, score in scores.items()}
+
+
+class CrossMediaService:
+    """
+    Singleton pattern implementation for cross-media recommendations
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super(CrossMediaService, cls).__new__(cls)
+                    cls._instance.graph = None
+                    cls._instance._builder = None
+        return cls._instance
+
+    def build_graph(self) -> CrossMediaGraph:
+        """Build the book/movie graph from adaptations and users' histories."""
+        graph = CrossMediaGraph()
+        for book_id, movie_id in self._adaptation_pairs():
+            graph.add_adaptation(book_id, movie_id)
+
+        for items in self._user_items().values():
+            graph.add_co_engagement(node for node, _ in items)
+
+        self.graph = graph
+        return graph
+
+    def sync_adaptations(self, graph: CrossMediaGraph) -> int:
+        """
+        Add adaptations committed since the graph was built, wherever they committed.
+
+        The after_commit hook only reaches the committing process's graph; this
+        catches the others up. Returns the number of edges added.
+        """
+        return sum(graph.add_adaptation(book_id, movie_id) for book_id, movie_id in self._adaptation_pairs())
+
+    def _current_graph(self) -> CrossMediaGraph:
+        return self.graph if self.graph is not None else self.build_graph()
+
+    def build_in_background(self, app) -> Optional[threading.Thread]:
+        """Build the graph on a background thread unless one is already running; returns that thread."""
+        with self._lock:
+            if self._builder is not None and self._builder.is_alive():
+                return None
+            self._builder = threading.Thread(target=self._background_build, args=(app,),
+                                             name='cross-media-graph-build', daemon=True)
+            self._builder.start()
+            return self._builder
+
+    def _background_build(self, app) -> None:
+        with app.app_context():
+            try:
+                self.build_graph()
+            except Exception as e:
+                app.logger.error(f"Error building cross-media graph: {str(e)}")
+            finally:
+                db.session.remove()
+
+    def get(self, user_id: int) -> Dict[str, Any]:
+        """
+        Return materialized suggestions for a user with a single key lookup.
+
+        A missing row is computed inline once the graph exists. Before that, the
+        graph is built in the background and empty, stale suggestions are returned.
+        """
+        entry = db.session.get(CrossMediaRecommendation, user_id)
+        if entry is None:
+            if self.graph is None:
+                self.build_in_background(current_app._get_current_object())
+                return {'suggestions': {'movies': [], 'books': []}, 'computed_at': None, 'stale': True}
+            entry = self.refresh_user(user_id)
+        return {
+            'suggestions': entry.suggestions,
+            'computed_at': entry.ComputedAt,
+            'stale': entry.is_stale
+        }
+
+    def suggest(self, user_id: int, limit: int = 10,
+                graph: Optional[CrossMediaGraph] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Score movies and books for a user from their reads and watches.
+
+        Returns:
+            Dict with 'movies' and 'books' lists, each item carrying a reason:
+            'watch_the_adaptation', 'read_the_source' or 'also_enjoyed'
+        """
+        graph = graph if graph is not None else self._current_graph()
+        items = self._user_items(user_id).get(user_id, [])
+        if not items:
+            return {'movies': [], 'books': []}
+
+        seeds = {node: 1.0 for node, _ in items}
+        ranked = graph.personalized_rank(seeds)
+
+        movies, books = [], []
+        for node, score in sorted(ranked.items(), key=lambda x: x[1], reverse=True):
+            if node in seeds:
+                continue
+            linked = [ref for other in graph.adaptations_of(node) if other in seeds for _, ref in [other]]
+            kind, ref_id = node
+            if kind == 'movie' and len(movies) < limit:
+                reason = 'watch_the_adaptation' if linked else 'also_enjoyed'
+                movies.append({'movie_id': ref_id, 'score': round(score, 6), 'reason': reason, 'source_book_ids': linked})
+            elif kind == 'book' and len(books) < limit:
+                reason = 'read_the_source' if linked else 'also_enjoyed'
+                books.append({'book_id': ref_id, 'score': round(score, 6), 'reason': reason, 'adapted_movie_ids': linked})
+            if len(movies) >= limit and len(books) >= limit:
+                break
+
+        self._attach_titles(movies, books)
+        return {'movies': movies, 'books': books}
+
+    def refresh_user(self, user_id: int, graph: Optional[CrossMediaGraph] = None) -> CrossMediaRecommendation:
+        """
+        Recompute and store a user's suggestions against the version read.
+
+        Without a graph, this process's graph is first caught up with adaptations
+        committed elsewhere.
+        """
+        if graph is None:
+            graph = self._current_graph()
+            self.sync_adaptations(graph)
+        entry = db.session.get(CrossMediaRecommendation, user_id)
+        if entry is None:
+            entry = CrossMediaRecommendation(UserId=user_id, Version=0, ComputedVersion=0)
+            db.session.add(entry)
+        version = entry.Version
+        entry.suggestions = self.suggest(user_id, graph=graph)
+        entry.ComputedVersion = version
+        entry.GraphVersion = graph.version
+        entry.ComputedAt = datetime.now(timezone.utc)
+        db.session.commit()
+        return entry
+
+    def refresh_stale(self, limit: int = 500) -> int:
+        """
+        Recompute up to limit stale users; returns how many were refreshed.
+
+        A row is stale when the user's history changed or it was computed from an
+        older graph than this process's; history changes go first.
+        """
+        graph = self._current_graph()
+        history_changed = CrossMediaRecommendation.ComputedVersion < CrossMediaRecommendation.Version
+        stale_ids = db.session.execute(
+            db.select(CrossMediaRecommendation.UserId)
+            .where(or_(history_changed, CrossMediaRecommendation.GraphVersion < graph.version))
+            .order_by(case((history_changed, 0), else_=1), CrossMediaRecommendation.UserId)
+            .limit(limit)
+        ).scalars().all()
+        # Read after the stale rows, so the edge behind every adaptation bump seen above is added
+        self.sync_adaptations(graph)
+        for user_id in stale_ids:
+            try:
+                self.refresh_user(user_id, graph)
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.error(f"Error refreshing cross-media suggestions for user {user_id}: {str(e)}")
+        return len(stale_ids)
+
+    @staticmethod
+    def _adaptation_pairs() -> List[Tuple[int, int]]:
+        """(book id, movie id) for every adaptation, resolving movies by TMDB id when unlinked."""
+        tmdb_to_movie = dict(db.session.execute(
+            db.select(Movie.tmdb_id, Movie.movieID).where(Movie.tmdb_id.isnot(None))
+        ).all())
+        adaptations = db.session.execute(
+            db.select(MovieAdaptation.BookId, MovieAdaptation.movieID, MovieAdaptation.TmdbId)
+            .where(MovieAdaptation.BookId.isnot(None))
+        ).all()
+        pairs = []
+        for book_id, movie_id, tmdb_id in adaptations:
+            if movie_id is None and tmdb_id:
+                movie_id = tmdb_to_movie.get(int(tmdb_id)) if str(tmdb_id).isdigit() else None
+            if movie_id is not None:
+                pairs.append((book_id, movie_id))
+        return pairs
+
+    @staticmethod
+    def _user_items(user_id: Optional[int] = None) -> Dict[int, List[Tuple[Node, datetime]]]:
+        """Most recent reads and watches per user (optionally for a single user)."""
+        reads = db.select(ReadHistory.userID, ReadHistory.bookID, ReadHistory.read_date)
+        watches = db.select(WatchHistory.userID, WatchHistory.movieID, WatchHistory.watched_date)
+        if user_id is not None:
+            reads = reads.where(ReadHistory.userID == user_id)
+            watches = watches.where(WatchHistory.userID == user_id)
+
+        items: Dict[int, List[Tuple[Node, datetime]]] = defaultdict(list)
+        for uid, book_id, when in db.session.execute(reads):
+            items[uid].append((('book', book_id), when))
+        for uid, movie_id, when in db.session.execute(watches):
+            items[uid].append((('movie', movie_id), when))
+
+        epoch = datetime.min
+        for uid in items:
+            items[uid].sort(key=lambda x: x[1] or epoch, reverse=True)
+            del items[uid][MAX_ITEMS_PER_USER:]
+        return items
+
+    @staticmethod
+    def _attach_titles(movies: List[Dict[str, Any]], books: List[Dict[str, Any]]) -> None:
+        if movies:
+            titles = dict(db.session.execute(
+                db.select(Movie.movieID, Movie.title).where(Movie.movieID.in_([m['movie_id'] for m in movies]))
+            ).all())
+            for m in movies:
+                m['title'] = titles.get(m['movie_id'])
+        if books:
+            titles = dict(db.session.execute(
+                db.select(Book.BookId, Book.Title).where(Book.BookId.in_([b['book_id'] for b in books]))
+            ).all())
+            for b in books:
+                b['title'] = titles.get(b['book_id'])
+
+
+def _bump_users(connection, user_ids) -> None:
+    table = CrossMediaRecommendation.__table__
+    connection.execute(
+        table.update()
+        .where(table.c.UserId.in_(user_ids))
+        .values(Version=table.c.Version + 1)
+    )
+
+
+def _on_history_change(mapper, connection, target) -> None:
+    """Mapper hook: a read or watch changes the owning user's suggestions."""
+    if target.userID is not None:
+        _bump_users(connection, [target.userID])
+
+
+def _on_adaptation_insert(mapper, connection, target) -> None:
+    """Mapper hook: hold the new edge until commit and invalidate everyone who read the book."""
+    if target.BookId is None or target.movieID is None:
+        return
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_SESSION_KEY, []).append((target.BookId, target.movieID))
+    readers = db.select(ReadHistory.userID).where(ReadHistory.bookID == target.BookId).distinct()
+    _bump_users(connection, readers)
+
+
+for _model in (ReadHistory, WatchHistory):
+    event.listen(_model, 'after_insert', _on_history_change)
+    event.listen(_model, 'after_delete', _on_history_change)
+event.listen(MovieAdaptation, 'after_insert', _on_adaptation_insert)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_pending_adaptations(session: Session) -> None:
+    """Add committed adaptation edges to the in-memory graph."""
+    pending = session.info.pop(_SESSION_KEY, None)
+    if not pending:
+        return
+    graph = CrossMediaService().graph
+    if graph is None:
+        return
+    for book_id, movie_id in pending:
+        graph.add_adaptation(book_id, movie_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending_adaptations(session: Session) -> None:
+    session.info.pop(_SESSION_KEY, None)
@@ -0,0 +1,394 @@
+"""
+Notification Broadcaster: Pushes new notifications to connected Server-Sent Events clients.
+
+One broadcaster thread per process follows the notifications table by primary key.
+Each poll is a single range query for rows newer than the last one it saw, and each
+row is handed to the open streams of that row's user. However many clients are
+connected, the database sees one query per NOTIFICATION_STREAM_POLL_SECONDS.
+While nobody is connected it sees none. The delivery workers wake the broadcaster
+as soon as they commit, so local notifications go out without waiting for the
+next poll. Rows written by other processes are picked up by the poll.
+
+Ids are handed out when rows are inserted, not when they commit, so with several
+delivery workers a row can become visible after a higher id was already polled. Each
+poll remembers the ids it skipped as gap ranges and, for GAP_SECONDS, re-reads those
+ranges too, so late commits are still pushed. Clients drop ids they already sent.
+
+Coalescing merges later changes into an existing row, which keeps its id. Merges
+stamp the row's UpdatedAt, and each poll also reads rows updated since the last
+one it saw, re-reading the trailing GAP_SECONDS for late commits. Those go out as
+'notification-updated' events carrying the new count and text. They have no id,
+so a client's Last-Event-ID only ever moves forward.
+
+Event ids are NotificationIds. A client that reconnects with Last-Event-ID is sent
+what it missed first, then the live feed. That is every row merged into since its
+last event was created, then its newer rows, paging until it has caught up.
+Comment heartbeats keep idle connections open through proxies. A client that falls
+more than CLIENT_BUFFER events behind is disconnected. It resumes from its last id
+when it reconnects.
+"""
+import json
+import queue
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Any, Iterator, List, Optional, Set, Tuple
+
+from flask import current_app, has_app_context
+
+from sqlalchemy import and_, or_
+
+from ..models import db, Notification
+from .notification_service import serialize_notification
+
+CLIENT_BUFFER = 100
+REPLAY_LIMIT = 500
+POLL_BATCH_SIZE = 1000
+DEFAULT_POLL_SECONDS = 2
+DEFAULT_HEARTBEAT_SECONDS = 15
+RETRY_MILLISECONDS = 5000
+# How long skipped ids are re-checked for late commits, and how many gap ranges are kept
+GAP_SECONDS = 30
+MAX_GAP_RANGES = 100
+# Ids per client remembered to drop repeats
+SENT_MEMORY = 1000
+
+NEW = 'notification'
+UPDATED = 'notification-updated'
+
+
+def format_event(item: Dict[str, Any], event: str = NEW) -> str:
+    """
+    One notification as an SSE event.
+
+    New notifications carry their NotificationId as the event id. Updates carry
+    none, so they never move the client's Last-Event-ID backwards.
+    """
+    if event == UPDATED:
+        return f"event: {UPDATED}\ndata: {json.dumps(item)}\n\n"
+    return f"id: {item['id']}\nevent: {NEW}\ndata: {json.dumps(item)}\n\n"
+
+
+class _Client:
+    """One open stream: a bounded buffer of pending events for a user."""
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.events: "queue.Queue[Tuple[str, Dict[str, Any]]]" = queue.Queue(maxsize=CLIENT_BUFFER)
+        self.lagged = False
+        self._sent: "OrderedDict[int, int]" = OrderedDict()
+
+    def admit(self, event: str, item: Dict[str, Any]) -> Optional[str]:
+        """
+        The event to send for an item, or None if this client already has that version.
+
+        A row the client already has as a new notification goes out as an update.
+        """
+        sent = self._sent.get(item['id'])
+        if sent is not None and item['count'] <= sent:
+            return None
+        self._sent[item['id']] = item['count']
+        self._sent.move_to_end(item['id'])
+        if len(self._sent) > SENT_MEMORY:
+            self._sent.popitem(last=False)
+        return UPDATED if sent is not None else event
+
+
+def _holes(low: int, high: int, ids: List[int]) -> List[Tuple[int, int]]:
+    """Ranges within [low, high] not covered by the sorted ids."""
+    holes, expected = [], low
+    for row_id in ids:
+        if row_id > expected:
+            holes.append((expected, row_id - 1))
+        expected = max(expected, row_id + 1)
+    if expected <= high:
+        holes.append((expected, high))
+    return holes
+
+
+class NotificationBroadcaster:
+    """
+    Singleton pattern implementation for the notification broadcaster
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super(NotificationBroadcaster, cls).__new__(cls)
+                    cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        """Initialize the client registry, poll cursor and metric counters."""
+        self._clients: Dict[int, Set[_Client]] = {}
+        self._clients_lock = threading.Lock()
+        self._cursor: Optional[int] = None
+        # Newest UpdatedAt seen, and the (UpdatedAt, id) -> count of updates pushed in the trailing window
+        self._updated_cursor: Optional[datetime] = None
+        self._updates_seen: Dict[Tuple[datetime, int], int] = {}
+        # (low, high, expires) id ranges skipped by a poll that may still commit
+        self._gaps: List[Tuple[int, int, float]] = []
+        self._wake = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self._app = None
+        self._polls = 0
+        self._events_sent = 0
+        self._late_rows = 0
+        self._updated_rows = 0
+        self._lagged_clients = 0
+
+    def init_app(self, app) -> None:
+        """Bind the broadcaster thread to an application so it can use the database."""
+        self._app = app
+
+    def wake(self) -> None:
+        """Poll now instead of at the next interval, e.g. right after notifications were committed."""
+        self._wake.set()
+
+    def stream(self, user_id: int, last_event_id: Optional[int] = None) -> Iterator[str]:
+        """
+        SSE text for one client: missed notifications after last_event_id, then live ones.
+
+        Must be iterated inside an application context (use stream_with_context in views).
+        """
+        client = self._subscribe(user_id)
+        try:
+            yield f"retry: {RETRY_MILLISECONDS}\n\n"
+            if last_event_id is not None:
+                for item in self.replay_updates(user_id, last_event_id):
+                    event = client.admit(UPDATED, item)
+                    if event:
+                        yield format_event(item, event)
+            after = last_event_id
+            while after is not None:
+                page = self.replay(user_id, after, REPLAY_LIMIT)
+                for item in page:
+                    event = client.admit(NEW, item)
+                    if event:
+                        yield format_event(item, event)
+                # Keep paging until caught up; anything newer also arrives live and is dropped as sent
+                after = page[-1]['id'] if len(page) == REPLAY_LIMIT else None
+            # Nothing below touches the database; give the connection back for the stream's lifetime
+            db.session.remove()
+
+            heartbeat = (self._app.config.get('NOTIFICATION_STREAM_HEARTBEAT_SECONDS', DEFAULT_HEARTBEAT_SECONDS)
+                         if self._app is not None else DEFAULT_HEARTBEAT_SECONDS)
+            while not client.lagged:
+                try:
+                    event, item = client.events.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ": heartbeat\n\n"
+                    continue
+                event = client.admit(event, item)
+                if event:
+                    yield format_event(item, event)
+        finally:
+            self._unsubscribe(client)
+
+    @staticmethod
+    def replay(user_id: int, after_id: int, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """A user's notifications with ids above after_id, oldest first."""
+        rows = db.session.execute(
+            db.select(Notification)
+            .where(Notification.UserId == user_id, Notification.NotificationId > after_id)
+            .order_by(Notification.NotificationId)
+            .limit(limit or REPLAY_LIMIT)
+        ).scalars().all()
+        return [serialize_notification(row) for row in rows]
+
+    @staticmethod
+    def replay_updates(user_id: int, after_id: int) -> List[Dict[str, Any]]:
+        """
+        A user's notifications up to after_id merged into since that one was created.
+
+        Returns at most REPLAY_LIMIT of the most recently updated, oldest update first.
+        """
+        since = db.session.execute(
+            db.select(Notification.CreatedAt)
+            .where(Notification.UserId == user_id, Notification.NotificationId == after_id)
+        ).scalar()
+        if since is None:
+            return []
+        rows = db.session.execute(
+            db.select(Notification)
+            .where(Notification.UserId == user_id, Notification.NotificationId <= after_id,
+                   Notification.UpdatedAt >= since)
+            .order_by(Notification.UpdatedAt.desc())
+            .limit(REPLAY_LIMIT)
+        ).scalars().all()
+        return [serialize_notification(row) for row in reversed(rows)]
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get connection and fan-out metrics for the broadcaster."""
+        with self._clients_lock:
+            return {
+                'connected_users': len(self._clients),
+                'connected_clients': sum(len(clients) for clients in self._clients.values()),
+                'polls': self._polls,
+                'events_sent': self._events_sent,
+                'lagged_clients': self._lagged_clients,
+                'late_rows': self._late_rows,
+                'updated_rows': self._updated_rows,
+                'gap_ranges': len(self._gaps),
+                'cursor': self._cursor
+            }
+
+    def _subscribe(self, user_id: int) -> _Client:
+        """Register a client; the first one fixes the poll cursor at the current newest row."""
+        client = _Client(user_id)
+        with self._clients_lock:
+            if self._cursor is None:
+                self._cursor = db.session.execute(db.select(db.func.max(Notification.NotificationId))).scalar() or 0
+                self._updated_cursor = datetime.utcnow()
+            self._clients.setdefault(user_id, set()).add(client)
+        self._ensure_worker()
+        return client
+
+    def _unsubscribe(self, client: _Client) -> None:
+        with self._clients_lock:
+            clients = self._clients.get(client.user_id)
+            if clients is not None:
+                clients.discard(client)
+                if not clients:
+                    del self._clients[client.user_id]
+            if not self._clients:
+                # Nobody is listening; the next first client starts again from the newest row
+                self._cursor = None
+                self._gaps = []
+                self._updated_cursor = None
+                self._updates_seen = {}
+
+    def _ensure_worker(self) -> None:
+        """Start the broadcaster thread on first use, bound to the current application."""
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            if self._app is None:
+                if not has_app_context():
+                    return
+                self._app = current_app._get_current_object()
+            self._worker = threading.Thread(target=self._run, name='notification-broadcaster', daemon=True)
+            self._worker.start()
+
+    def _run(self) -> None:
+        """Broadcaster loop: one range query per wake-up or poll interval while clients are connected."""
+        while True:
+            self._wake.wait(self._app.config.get('NOTIFICATION_STREAM_POLL_SECONDS', DEFAULT_POLL_SECONDS))
+            self._wake.clear()
+            with self._clients_lock:
+                if not self._clients:
+                    continue
+            with self._app.app_context():
+                try:
+                    self._poll()
+                except Exception as e:
+                    self._app.logger.error(f"Error polling notifications for streaming: {str(e)}")
+                finally:
+                    db.session.remove()
+
+    def _poll(self) -> None:
+        """Fan out rows that committed late into earlier gaps, merged rows, then every row newer than the cursor."""
+        self._poll_gaps()
+        self._poll_updates()
+        while True:
+            cursor = self._cursor
+            if cursor is None:
+                return
+            rows = db.session.execute(
+                db.select(Notification)
+                .where(Notification.NotificationId > cursor)
+                .order_by(Notification.NotificationId)
+                .limit(POLL_BATCH_SIZE)
+            ).scalars().all()
+            with self._clients_lock:
+                self._polls += 1
+                if self._cursor != cursor:
+                    # Every client left (and maybe a new one arrived) during the query
+                    return
+                if rows:
+                    expires = time.monotonic() + GAP_SECONDS
+                    holes = _holes(self._cursor + 1, rows[-1].NotificationId,
+                                   [row.NotificationId for row in rows])
+                    self._gaps.extend((low, high, expires) for low, high in holes)
+                    del self._gaps[:-MAX_GAP_RANGES]
+                self._fan_out(rows)
+            if len(rows) < POLL_BATCH_SIZE:
+                return
+
+    def _poll_gaps(self) -> None:
+        """Re-read the unexpired gap ranges; whatever is there now committed after its neighbours."""
+        now = time.monotonic()
+        with self._clients_lock:
+            gaps = [gap for gap in self._gaps if gap[2] > now]
+            self._gaps = []
+        remaining = []
+        for low, high, expires in gaps:
+            rows = db.session.execute(
+                db.select(Notification)
+                .where(Notification.NotificationId.between(low, high))
+                .order_by(Notification.NotificationId)
+            ).scalars().all()
+            remaining.extend((l, h, expires) for l, h in _holes(low, high, [row.NotificationId for row in rows]))
+            with self._clients_lock:
+                self._late_rows += len(rows)
+                self._fan_out(rows)
+        with self._clients_lock:
+            if self._cursor is not None:
+                self._gaps = remaining + self._gaps
+
+    def _poll_updates(self) -> None:
+        """Fan out rows merged into since the last poll, re-reading the trailing GAP_SECONDS."""
+        with self._clients_lock:
+            if self._updated_cursor is None:
+                return
+            since = self._updated_cursor - timedelta(seconds=GAP_SECONDS)
+            self._updates_seen = {key: count for key, count in self._updates_seen.items() if key[0] > since}
+        after: Tuple[datetime, int] = (since, 0)
+        while True:
+            rows = db.session.execute(
+                db.select(Notification)
+                .where(or_(Notification.UpdatedAt > after[0],
+                           and_(Notification.UpdatedAt == after[0], Notification.NotificationId > after[1])))
+                .order_by(Notification.UpdatedAt, Notification.NotificationId)
+                .limit(POLL_BATCH_SIZE)
+            ).scalars().all()
+            with self._clients_lock:
+                if self._updated_cursor is None:
+                    return
+                for row in rows:
+                    key = (row.UpdatedAt, row.NotificationId)
+                    if self._updates_seen.get(key) == row.ChangeCount:
+                        continue
+                    self._updates_seen[key] = row.ChangeCount
+                    self._updated_rows += 1
+                    self._updated_cursor = max(self._updated_cursor, row.UpdatedAt)
+                    for client in self._clients.get(row.UserId, ()):
+                        self._offer(client, serialize_notification(row), UPDATED)
+            if len(rows) < POLL_BATCH_SIZE:
+                return
+            after = (rows[-1].UpdatedAt, rows[-1].NotificationId)
+
+    def _fan_out(self, rows: List[Notification]) -> None:
+        """Hand rows to their users' clients and advance the cursor; call with _clients_lock held."""
+        for row in rows:
+            if self._cursor is not None:
+                self._cursor = max(self._cursor, row.NotificationId)
+            for client in self._clients.get(row.UserId, ()):
+                self._offer(client, serialize_notification(row))
+
+    def _offer(self, client: _Client, item: Dict[str, Any], event: str = NEW) -> None:
+        """Queue an event for a client, cutting it loose if it has fallen too far behind."""
+        if client.lagged:
+            return
+        try:
+            client.events.put_nowait((event, item))
+            self._events_sent += 1
+        except queue.Full:
+            client.lagged = True
+            self._lagged_clients += 1
@@ -0,0 +1,205 @@
+"""
+Notification Queue: Delivers notification jobs off the request path, in batches.
+
+The Watchlist and ReadingList observers are subscribed to the change-capture bus
+here. When a movie or book update commits, they enqueue a plain-data job and
+return. A small pool of worker threads drains the bounded queue. Each worker
+collects jobs until it has NOTIFICATION_BATCH_SIZE of them or NOTIFICATION_BATCH_MS
+has passed since the first one. It then resolves the whole batch and writes every
+notification in one transaction, so fan-out throughput comes from bulk inserts
+rather than per-job commits. If the batch fails, its jobs are retried one at a
+time, so one bad job costs only itself rather than the whole batch.
+
+enqueue() never blocks: it runs in after_commit on the request thread. When the
+queue is full the job is dropped and counted in the 'dropped' metric, so a
+producer that outruns the workers cannot grow memory without bound or stall
+requests. A dropped job cannot be delivered inline either, because observers run
+after commit, when the committing session can no longer emit SQL.
+"""
+import logging
+import queue
+import threading
+import time
+from typing import Dict, Any, List, Optional
+
+from flask import current_app, has_app_context
+
+from ..models import db, Watchlist, ReadingList
+from .change_capture import ChangeCapture
+from .notification_service import NotificationService
+from .notification_broadcaster import NotificationBroadcaster
+
+MAX_QUEUE_SIZE = 10000
+DEFAULT_WORKERS = 2
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_BATCH_MS = 250
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationQueue:
+    """
+    Singleton pattern implementation for the notification delivery queue
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super(NotificationQueue, cls).__new__(cls)
+                    cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        """Initialize the bounded queue, worker list and metric counters."""
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=MAX_QUEUE_SIZE)
+        self._workers: List[threading.Thread] = []
+        self._app = None
+        self._metrics_lock = threading.Lock()
+        self._enqueued = 0
+        self._dropped = 0
+        self._batches = 0
+        self._delivered_jobs = 0
+        self._notifications = 0
+        self._retried_batches = 0
+        self._errors = 0
+        self._max_depth = 0
+
+    def init_app(self, app) -> None:
+        """Bind the workers to an application so they can use the database."""
+        self._app = app
+
+    def enqueue(self, job: Dict[str, Any]) -> bool:
+        """
+        Queue a job from notification_service's job builders for the workers.
+
+        Returns:
+            True if the job was queued, False if the queue was full and it was dropped
+        """
+        self._ensure_workers()
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            self._record(dropped=1)
+            logger.error(f"Notification queue full, dropped {job['kind']} job")
+            return False
+        self._record(enqueued=1, depth=self._queue.qsize())
+        return True
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until every queued job has been delivered (or failed).
+
+        Returns:
+            False if the timeout expired first
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get queue-depth and throughput metrics for the delivery workers."""
+        with self._metrics_lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'max_queue_depth': self._max_depth,
+                'capacity': MAX_QUEUE_SIZE,
+                'workers': sum(1 for worker in self._workers if worker.is_alive()),
+                'enqueued': self._enqueued,
+                'dropped': self._dropped,
+                'batches': self._batches,
+                'delivered_jobs': self._delivered_jobs,
+                'notifications_created': self._notifications,
+                'average_batch_size': round(self._delivered_jobs / self._batches, 2) if self._batches else 0.0,
+                'retried_batches': self._retried_batches,
+                'errors': self._errors
+            }
+
+    def _ensure_workers(self) -> None:
+        """Start the worker pool on first use, bound to the current application."""
+        if self._workers and all(worker.is_alive() for worker in self._workers):
+            return
+        with self._lock:
+            if self._app is None:
+                if not has_app_context():
+                    return
+                self._app = current_app._get_current_object()
+            self._workers = [worker for worker in self._workers if worker.is_alive()]
+            for index in range(len(self._workers), self._app.config.get('NOTIFICATION_WORKERS', DEFAULT_WORKERS)):
+                worker = threading.Thread(target=self._run, name=f'notification-worker-{index}', daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def _next_batch(self) -> List[Dict[str, Any]]:
+        """Block for one job, then gather more until the batch is full or its window closes."""
+        batch = [self._queue.get()]
+        batch_size = self._app.config.get('NOTIFICATION_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        deadline = time.monotonic() + self._app.config.get('NOTIFICATION_BATCH_MS', DEFAULT_BATCH_MS) / 1000.0
+        while len(batch) < batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        """Worker loop: deliver one batch per transaction."""
+        while True:
+            batch = self._next_batch()
+            with self._app.app_context():
+                try:
+                    created = NotificationService().deliver(batch)
+                    self._record(batches=1, jobs=len(batch), notifications=created)
+                except Exception as e:
+                    db.session.rollback()
+                    self._record(retried_batches=1)
+                    self._app.logger.error(f"Error delivering {len(batch)} notification jobs, "
+                                           f"retrying one at a time: {str(e)}")
+                    created = self._deliver_each(batch)
+                finally:
+                    db.session.remove()
+                    for _ in batch:
+                        self._queue.task_done()
+            if created:
+                NotificationBroadcaster().wake()
+
+    def _deliver_each(self, batch: List[Dict[str, Any]]) -> int:
+        """Deliver a failed batch job by job, dropping only the jobs that fail on their own."""
+        created = 0
+        for job in batch:
+            try:
+                delivered = NotificationService().deliver([job])
+                self._record(batches=1, jobs=1, notifications=delivered)
+                created += delivered
+            except Exception as e:
+                db.session.rollback()
+                self._record(errors=1)
+                self._app.logger.error(f"Error delivering {job.get('kind')} notification job: {str(e)}")
+        return created
+
+    def _record(self, enqueued: int = 0, dropped: int = 0, batches: int = 0, jobs: int = 0,
+                notifications: int = 0, retried_batches: int = 0, errors: int = 0,
+                depth: int = 0) -> None:
+        with self._metrics_lock:
+            self._enqueued += enqueued
+            self._dropped += dropped
+            self._batches += batches
+            self._delivered_jobs += jobs
+            self._notifications += notifications
+            self._retried_batches += retried_batches
+            self._errors += errors
+            self._max_depth = max(self._max_depth, depth)
+
+
+for _observer in (Watchlist, ReadingList):
+    ChangeCapture().subscribe(_observer.observe, _observer.observed_tables)
@@ -1,72 +1,495 @@
 """
 Notification Service: Implements the Observer pattern for user notifications
+
+Notifications are rows in the notifications table, so they survive restarts and every
+worker sees the same inbox. Fan-out work is described by plain-data jobs; deliver()
+resolves a batch of them and writes all recipients with bulk inserts, bumping their
+Users.UnreadNotifications counters in the same transaction. A page of a user's
+inbox is read newest first through the (UserId, CreatedAt) index with a keyset
+cursor, and the unread total is a primary-key read of the counter. Old rows are
+removed by prune(), run daily from the scheduler.
+
+Notifications about the same subject (a movie or a book) are coalesced per user. Within
+a batch, and against the user's unread notification on that subject from the last
+NOTIFICATION_COALESCE_SECONDS, further changes bump ChangeCount and refresh the text
+instead of adding rows. A change whose content fingerprint matches one already
+recorded is a duplicate and is dropped; watchlist updates fingerprint the changed
+columns' new values, so only a repeat of the same edit is dropped. Reading a notification closes it, so the next
+change starts a new one.
+
+New-adaptation alerts fan out through the subscription index (genre and book to
+user IDs), so only the interested users are read.
 """
-from typing import Dict, Any, List
-from ..models import User, Movie, Watchlist
-from datetime import datetime
+import base64
+import hashlib
+import json
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Any, Iterable, List, Optional, Set, Tuple, Union
+
+from flask import current_app, has_app_context
+
+from sqlalchemy import and_, bindparam, func, or_
+
+from ..models import db, User, Movie, Book, MovieAdaptation, Watchlist, Notification
+from .notification_subscriptions import SubscriptionIndex
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+RETENTION_DAYS = 90
+# Users per counter UPDATE; keeps IN lists within backend parameter limits
+WRITE_BATCH_SIZE = 500
+PRUNE_BATCH_SIZE = 5000
+# Seconds within which unread notifications about the same subject are merged
+DEFAULT_COALESCE_SECONDS = 300
+
+WATCHLIST_UPDATE = 'watchlist_update'
+NEW_ADAPTATION = 'new_adaptation'
+
+
+def encode_cursor(created_at: datetime, notification_id: int) -> str:
+    """Opaque cursor pointing just after a notification."""
+    payload = json.dumps({'t': created_at.isoformat(), 'i': notification_id})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """Decode a cursor from encode_cursor; raises ValueError when it is malformed."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return {'created_at': datetime.fromisoformat(payload['t']), 'id': int(payload['i'])}
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def watchlist_update_job(movie_id: int, title: Optional[str] = None, columns: Iterable[str] = (),
+                         digest: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Plain-data job notifying a movie's watchers; the title is looked up when not given.
+
+    digest identifies the new values of the changed columns (see change_capture), so
+    two edits of the same column count as two changes.
+    """
+    return {'kind': WATCHLIST_UPDATE, 'movie_id': movie_id, 'title': title, 'columns': sorted(columns),
+            'digest': digest}
+
+
+def new_adaptation_job(book_title: str, movie: Union[Movie, MovieAdaptation], book_id: Optional[int] = None,
+                       genres: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    """Plain-data job notifying a new adaptation's subscribers, safe to hand to another thread."""
+    return {
+        'kind': NEW_ADAPTATION,
+        'book_title': book_title,
+        'title': getattr(movie, 'title', None) or getattr(movie, 'Title', None),
+        'book_id': book_id if book_id is not None else getattr(movie, 'BookId', None),
+        'genres': list(genres if genres is not None else movie.genres)
+    }
+
+
+def book_adaptation_job(book_id: int) -> Dict[str, Any]:
+    """Plain-data job announcing a book's latest adaptation, resolved by the worker."""
+    return {'kind': NEW_ADAPTATION, 'book_id': book_id}
+
+
+def _delivery(user_ids: Iterable[int], kind: str, title: str, message: str,
+              subject: Optional[str] = None, detail: Any = None) -> Dict[str, Any]:
+    """A resolved job: recipients plus content, fingerprinted for duplicate detection."""
+    digest = hashlib.blake2b(json.dumps([kind, subject, title, message, detail]).encode(), digest_size=8)
+    return {'user_ids': user_ids, 'kind': kind, 'title': title, 'message': message,
+            'subject': subject, 'fingerprint': digest.hexdigest()}
+
+
+def serialize_notification(row: Notification) -> Dict[str, Any]:
+    """API representation of a notification row."""
+    return {
+        'id': row.NotificationId,
+        'kind': row.Kind,
+        'title': row.Title,
+        'message': row.Message,
+        'timestamp': row.CreatedAt.isoformat(),
+        'read': row.Read,
+        'count': row.ChangeCount,
+        'updated_at': row.UpdatedAt.isoformat() if row.UpdatedAt is not None else None
+    }
+
+
+def _batches(items: List[Any], size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
 
 class NotificationService:
     """
     Singleton pattern implementation for notification service
     """
     _instance = None
+    _lock = threading.Lock()
 
     def __new__(cls):
         if cls._instance is None:
-            cls._instance = super(NotificationService, cls).__new__(cls)
-            cls._instance.notifications = {}
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super(NotificationService, cls).__new__(cls)
+                    cls._instance._initialize()
         return cls._instance
 
+    def _initialize(self):
+        """Initialize the write-volume counters."""
+        self._metrics_lock = threading.Lock()
+        self._created = 0
+        self._merged = 0
+        self._duplicates = 0
+
     def notify_watchlist_updates(self, movie: Movie) -> None:
         """Notify users when a movie in their watchlist has updates"""
-        watchers = Watchlist.query.filter_by(movieID=movie.movieID).all()
-        
-        for watchlist_entry in watchers:
-            user = User.query.get(watchlist_entry.userID)
-            if user:
-                self._create_notification(
-                    user,
-                    f"Update for '{movie.title}'",
-                    f"There are new details available for {movie.title}"
+        self.deliver([watchlist_update_job(movie.movieID, movie.title)])
+
+    def notify_new_adaptation(self, book_title: str, movie: Movie, book_id: Optional[int] = None) -> None:
+        """
+        Notify users subscribed to the adaptation's genres or to its source book.
+
+        Args:
+            book_title: Title of the source book
+            movie: The new Movie or MovieAdaptation
+            book_id: Source book; defaults to the adaptation's BookId
+        """
+        self.deliver([new_adaptation_job(book_title, movie, book_id)])
+
+    def deliver(self, jobs: List[Dict[str, Any]]) -> int:
+        """
+        Resolve the recipients of several notification jobs and write them all at once.
+
+        Args:
+            jobs: Dicts from watchlist_update_job, new_adaptation_job or book_adaptation_job
+
+        Returns:
+            Number of notifications created
+        """
+        return self._write([self._resolve(job) for job in jobs])
+
+    def create_notifications(self, user_ids: Iterable[int], kind: str, title: str, message: str,
+                             subject: Optional[str] = None) -> int:
+        """
+        Deliver one notification to each user with a bulk insert and one counter update per batch.
+
+        Args:
+            user_ids: Recipients; duplicates receive a single notification
+            kind: Notification kind, e.g. WATCHLIST_UPDATE
+            title: Short title
+            message: Body text
+            subject: What the notification is about, e.g. 'movie:42'; notifications with a
+                subject are coalesced per user within the coalescing window
+
+        Returns:
+            Number of notifications created
+        """
+        return self._write([_delivery(user_ids, kind, title, message, subject)])
+
+    @staticmethod
+    def _resolve(job: Dict[str, Any]) -> Dict[str, Any]:
+        """Recipients, kind, title, message and subject for one job."""
+        if job['kind'] == WATCHLIST_UPDATE:
+            title = job.get('title') or db.session.execute(
+                db.select(Movie.title).where(Movie.movieID == job['movie_id'])
+            ).scalar()
+            if title is None:
+                return _delivery((), WATCHLIST_UPDATE, '', '')
+            # One join, answered from the (movieID, userID) index
+            user_ids = db.session.execute(
+                db.select(Watchlist.userID)
+                .join(User, User.UserId == Watchlist.userID)
+                .where(Watchlist.movieID == job['movie_id'])
+                .distinct()
+            ).scalars().all()
+            return _delivery(user_ids, WATCHLIST_UPDATE, f"Update for '{title}'",
+                             f"There are new details available for {title}",
+                             f"movie:{job['movie_id']}", [job.get('columns'), job.get('digest')])
+        if job['kind'] == NEW_ADAPTATION:
+            if 'title' not in job:
+                job = NotificationService._latest_adaptation_job(job['book_id'])
+                if job is None:
+                    return _delivery((), NEW_ADAPTATION, '', '')
+            return _delivery(SubscriptionIndex().subscribers(job['genres'], job['book_id']), NEW_ADAPTATION,
+                             "New Adaptation Alert", f"'{job['book_title']}' has been adapted into '{job['title']}'",
+                             f"book:{job['book_id']}" if job['book_id'] is not None else None)
+        raise ValueError(f"Unknown notification kind: {job['kind']}")
+
+    @staticmethod
+    def _latest_adaptation_job(book_id: int) -> Optional[Dict[str, Any]]:
+        """new_adaptation_job for a book's most recent adaptation, or None if it has none."""
+        book = db.session.get(Book, book_id)
+        # Books that were never adapted, the common case, stop at the counter
+        if book is None or not book.AdaptationCount:
+            return None
+        latest = db.session.get(MovieAdaptation, book.LatestAdaptationId)
+        if latest is None:
+            return None
+        genres = latest.genres
+        if not genres and latest.movieID is not None:
+            # Adaptations saved without genres inherit them from their movie
+            movie = db.session.get(Movie, latest.movieID)
+            genres = movie.genres if movie is not None else []
+        return new_adaptation_job(book.Title, latest, book_id, genres)
+
+    def _write(self, deliveries: List[Dict[str, Any]]) -> int:
+        """Coalesce the deliveries, then insert and merge notifications and bump counters in one transaction."""
+        pending, rows = self._coalesce(deliveries)
+        window = self._coalesce_window()
+        merges = self._merge_into_recent(pending, window) if pending and window else []
+
+        created_at = datetime.utcnow()
+        for (user_id, subject, kind), entry in pending.items():
+            rows.append(dict(entry['row'], UserId=user_id, Kind=kind, SubjectKey=subject,
+                             ChangeCount=entry['count']))
+        for row in rows:
+            row.update(Read=False, CreatedAt=created_at)
+        if not rows and not merges:
+            return 0
+
+        increments = Counter(row['UserId'] for row in rows)
+        # Users grouped by how many notifications they received, one UPDATE per group and batch
+        by_amount: Dict[int, List[int]] = {}
+        for user_id, amount in increments.items():
+            by_amount.setdefault(amount, []).append(user_id)
+        notifications, users = Notification.__table__, User.__table__
+        try:
+            if merges:
+                db.session.execute(
+                    notifications.update()
+                    .where(notifications.c.NotificationId == bindparam('notification_id'))
+                    .values(ChangeCount=notifications.c.ChangeCount + bindparam('changes'),
+                            Title=bindparam('title'), Message=bindparam('message'),
+                            Fingerprint=bindparam('fingerprint'), UpdatedAt=created_at),
+                    merges
                 )
+            if rows:
+                # A single executemany; SQLAlchemy folds it into multi-row INSERTs
+                db.session.execute(notifications.insert(), rows)
+            for amount, user_ids in by_amount.items():
+                for batch in _batches(sorted(user_ids), WRITE_BATCH_SIZE):
+                    db.session.execute(
+                        users.update()
+                        .where(users.c.UserId.in_(batch))
+                        .values(UnreadNotifications=users.c.UnreadNotifications + amount)
+                    )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        self._record(created=len(rows), merged=len(merges))
+        return len(rows)
+
+    def _coalesce(self, deliveries: List[Dict[str, Any]]):
+        """
+        Fold a batch's deliveries per (user, subject, kind).
+
+        Returns:
+            (pending, rows): pending maps (user, subject, kind) to the newest content, the
+            fingerprints seen and the number of distinct changes; rows are ready-made rows
+            for deliveries without a subject, which are never coalesced
+        """
+        pending: Dict[Tuple[int, str, str], Dict[str, Any]] = {}
+        rows: List[Dict[str, Any]] = []
+        duplicates = 0
+        for delivery in deliveries:
+            content = {'Title': delivery['title'], 'Message': delivery['message'],
+                       'Fingerprint': delivery['fingerprint']}
+            for user_id in sorted(set(delivery['user_ids'])):
+                if delivery['subject'] is None:
+                    rows.append(dict(content, UserId=user_id, Kind=delivery['kind'],
+                                     SubjectKey=None, ChangeCount=1))
+                    continue
+                key = (user_id, delivery['subject'], delivery['kind'])
+                entry = pending.get(key)
+                if entry is None:
+                    pending[key] = {'row': content, 'fingerprints': {delivery['fingerprint']}, 'count': 1}
+                elif delivery['fingerprint'] in entry['fingerprints']:
+                    duplicates += 1
+                else:
+                    entry['row'] = content
+                    entry['fingerprints'].add(delivery['fingerprint'])
+                    entry['count'] += 1
+        self._record(duplicates=duplicates)
+        return pending, rows
+
+    def _merge_into_recent(self, pending: Dict[Tuple[int, str, str], Dict[str, Any]],
+                           window: float) -> List[Dict[str, Any]]:
+        """
+        Match pending entries against unread notifications inside the window.
 
-    def notify_new_adaptation(self, book_title: str, movie: Movie) -> None:
-        """Notify relevant users about new adaptations"""
-        # This could be enhanced with user preferences
-        users = User.query.all()
-        
-        for user in users:
-            if self._should_notify_user(user, movie):
-                self._create_notification(
-                    user,
-                    "New Adaptation Alert",
-                    f"'{book_title}' has been adapted into '{movie.title}'"
+        Matched entries are removed from pending. Exact duplicates of the stored
+        notification are dropped; the rest become ChangeCount increments.
+
+        Returns:
+            Parameter sets for the merge UPDATE
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=window)
+        groups: Dict[Tuple[str, str], Set[int]] = {}
+        for user_id, subject, kind in pending:
+            groups.setdefault((subject, kind), set()).add(user_id)
+
+        merges, duplicates = [], 0
+        for (subject, kind), user_ids in groups.items():
+            recent = db.session.execute(
+                db.select(Notification.NotificationId, Notification.UserId, Notification.Fingerprint)
+                .where(Notification.SubjectKey == subject, Notification.Kind == kind,
+                       Notification.CreatedAt >= cutoff, Notification.Read.is_(False))
+                .order_by(Notification.NotificationId.desc())
+            ).all()
+            seen: Set[int] = set()
+            for notification_id, user_id, fingerprint in recent:
+                if user_id not in user_ids or user_id in seen:
+                    continue
+                seen.add(user_id)
+                entry = pending.pop((user_id, subject, kind))
+                changes = entry['count'] - (1 if fingerprint in entry['fingerprints'] else 0)
+                if changes == 0:
+                    duplicates += 1
+                    continue
+                merges.append({'notification_id': notification_id, 'changes': changes,
+                               'title': entry['row']['Title'], 'message': entry['row']['Message'],
+                               'fingerprint': entry['row']['Fingerprint']})
+        self._record(duplicates=duplicates)
+        return merges
+
+    @staticmethod
+    def _coalesce_window() -> float:
+        """Seconds within which notifications about the same subject are merged."""
+        if has_app_context():
+            return current_app.config.get('NOTIFICATION_COALESCE_SECONDS', DEFAULT_COALESCE_SECONDS)
+        return DEFAULT_COALESCE_SECONDS
+
+    def _record(self, created: int = 0, merged: int = 0, duplicates: int = 0) -> None:
+        with self._metrics_lock:
+            self._created += created
+            self._merged += merged
+            self._duplicates += duplicates
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get write-volume metrics: notifications created, merged into recent ones and dropped as duplicates."""
+        with self._metrics_lock:
+            return {'created': self._created, 'merged': self._merged, 'duplicates_dropped': self._duplicates}
+
+    @staticmethod
+    def unread_count(user_id: int) -> int:
+        """The user's unread total, read from the denormalized counter."""
+        return db.session.execute(
+            db.select(User.UnreadNotifications).where(User.UserId == user_id)
+        ).scalar() or 0
+
+    def get_user_notifications(self, user: User, limit: int = DEFAULT_PAGE_SIZE,
+                               cursor: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Get one page of a user's notifications, newest first, with the unread total.
+
+        Args:
+            user: The user
+            limit: Notifications per page (capped at MAX_PAGE_SIZE)
+            cursor: next_cursor from the previous page, or None for the first page
+
+        Returns:
+            Dict with 'notifications', 'unread_count' and 'next_cursor' (None on the last page)
+
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        query = db.select(Notification).where(Notification.UserId == user.UserId)
+        if cursor:
+            after = decode_cursor(cursor)
+            query = query.where(or_(
+                Notification.CreatedAt < after['created_at'],
+                and_(Notification.CreatedAt == after['created_at'],
+                     Notification.NotificationId < after['id'])
+            ))
+        rows = db.session.execute(
+            query.order_by(Notification.CreatedAt.desc(), Notification.NotificationId.desc())
+            .limit(limit + 1)
+        ).scalars().all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = encode_cursor(last.CreatedAt, last.NotificationId)
+        return {
+            'notifications': [serialize_notification(row) for row in rows[:limit]],
+            'unread_count': self.unread_count(user.UserId),
+            'next_cursor': next_cursor
+        }
+
+    @staticmethod
+    def mark_read(user_id: int, notification_ids: Optional[Iterable[int]] = None) -> int:
+        """
+        Mark some or all of a user's notifications read and lower the unread counter to match.
+
+        Returns:
+            Number of notifications that changed from unread to read
+        """
+        notifications, users = Notification.__table__, User.__table__
+        statement = notifications.update().where(
+            notifications.c.UserId == user_id, notifications.c.Read.is_(False)
+        )
+        if notification_ids is not None:
+            statement = statement.where(notifications.c.NotificationId.in_(list(notification_ids)))
+        try:
+            changed = db.session.execute(statement.values(Read=True)).rowcount
+            if changed:
+                db.session.execute(
+                    users.update()
+                    .where(users.c.UserId == user_id)
+                    .values(UnreadNotifications=users.c.UnreadNotifications - changed)
                 )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return changed
+
+    @staticmethod
+    def prune(retention_days: int = RETENTION_DAYS) -> int:
+        """
+        Delete notifications older than the retention window, oldest first, in batches.
+
+        Unread rows that are removed are taken off their users' counters in the same
+        transaction as the delete.
 
-    def _should_notify_user(self, user: User, movie: Movie) -> bool:
-        """Check if user should be notified based on preferences"""
-        if not user.preferences:
-            return False
-            
-        # Check genre preferences
-        user_genres = user.preferences.get('preferred_genres', [])
-        if movie.genres:
-            return any(genre in user_genres for genre in movie.genres)
-            
-        return False
-
-    def _create_notification(self, user: User, title: str, message: str) -> None:
-        """Create a new notification for a user"""
-        if user.userID not in self.notifications:
-            self.notifications[user.userID] = []
-            
-        self.notifications[user.userID].append({
-            'title': title,
-            'message': message,
-            'timestamp': datetime.utcnow(),
-            'read': False
-        })
-
-    def get_user_notifications(self, user: User) -> List[Dict[str, Any]]:
-        """Get all notifications for a user"""
-        return self.notifications.get(user.userID, [])
+        Returns:
+            Number of notifications deleted
+        """
+        cutoff = datetime.utcnow() - timedelta(days=retention_days)
+        notifications, users = Notification.__table__, User.__table__
+        lower_counter = (
+            users.update()
+            .where(users.c.UserId == bindparam('user_id'))
+            .values(UnreadNotifications=users.c.UnreadNotifications - bindparam('unread'))
+        )
+        deleted = 0
+        while True:
+            # Ids grow with CreatedAt, so walking the primary key reaches old rows first
+            ids = db.session.execute(
+                db.select(notifications.c.NotificationId)
+                .where(notifications.c.CreatedAt < cutoff)
+                .order_by(notifications.c.NotificationId)
+                .limit(PRUNE_BATCH_SIZE)
+            ).scalars().all()
+            if not ids:
+                break
+            try:
+                unread = db.session.execute(
+                    db.select(notifications.c.UserId, func.count())
+                    .where(notifications.c.NotificationId.in_(ids), notifications.c.Read.is_(False))
+                    .group_by(notifications.c.UserId)
+                ).all()
+                if unread:
+                    db.session.execute(lower_counter, [{'user_id': user_id, 'unread': count}
+                                                       for user_id, count in unread])
+                db.session.execute(notifications.delete().where(notifications.c.NotificationId.in_(ids)))
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            deleted += len(ids)
+            if len(ids) < PRUNE_BATCH_SIZE:
+                break
+        return deleted
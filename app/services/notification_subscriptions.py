@@ -0,0 +1,186 @@
+"""
+Notification Subscriptions: Inverted index from genres and books to interested users.
+
+A user subscribes to every genre in preferences['preferred_genres'] and to every book
+on their reading list. The index lives in notification_subscriptions, keyed
+(Kind, Key, UserId). Mapper hooks keep it current in the writer's transaction: a
+preferences change rewrites the user's genre rows, and reading-list inserts and
+deletes add or drop the book row. New-adaptation fan-out therefore reads only the
+matching users, through the primary key, never the whole Users table.
+"""
+import json
+import threading
+from typing import Dict, Any, Iterable, List, Optional, Set
+
+from sqlalchemy import and_, event, inspect, or_
+
+from ..models import db, User, ReadingList, NotificationSubscription
+
+GENRE = 'genre'
+BOOK = 'book'
+
+
+def preferred_genres(raw_preferences: Optional[str]) -> Set[str]:
+    """Genres from a user's stored preferences JSON; malformed preferences have none."""
+    try:
+        preferences = json.loads(raw_preferences) if raw_preferences else None
+    except (TypeError, ValueError):
+        return set()
+    if not isinstance(preferences, dict):
+        return set()
+    genres = preferences.get('preferred_genres') or []
+    if isinstance(genres, str):
+        genres = [genres]
+    return {str(genre) for genre in genres if genre}
+
+
+class SubscriptionIndex:
+    """
+    Singleton pattern implementation for the notification subscription index
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super(SubscriptionIndex, cls).__new__(cls)
+        return cls._instance
+
+    @staticmethod
+    def subscribers(genres: Iterable[str] = (), book_id: Optional[int] = None) -> Set[int]:
+        """
+        Users subscribed to any of the genres or to the book.
+
+        Args:
+            genres: Genre names of the new title
+            book_id: Source book of the adaptation, if known
+
+        Returns:
+            Set of user IDs
+        """
+        genres = {str(genre) for genre in genres if genre}
+        conditions = []
+        if genres:
+            conditions.append(and_(NotificationSubscription.Kind == GENRE,
+                                   NotificationSubscription.Key.in_(genres)))
+        if book_id is not None:
+            conditions.append(and_(NotificationSubscription.Kind == BOOK,
+                                   NotificationSubscription.Key == str(book_id)))
+        if not conditions:
+            return set()
+        return set(db.session.execute(
+            db.select(NotificationSubscription.UserId).where(or_(*conditions)).distinct()
+        ).scalars())
+
+    @staticmethod
+    def user_subscriptions(user_id: int) -> Dict[str, List[str]]:
+        """A user's indexed genres and books, for inspection."""
+        rows = db.session.execute(
+            db.select(NotificationSubscription.Kind, NotificationSubscription.Key)
+            .where(NotificationSubscription.UserId == user_id)
+        ).all()
+        return {
+            'genres': sorted(key for kind, key in rows if kind == GENRE),
+            'books': sorted(key for kind, key in rows if kind == BOOK)
+        }
+
+    @staticmethod
+    def rebuild() -> Dict[str, Any]:
+        """
+        Rebuild the whole index from Users.preferences and the reading lists.
+
+        Returns:
+            Dict with the number of 'genre' and 'book' rows written
+        """
+        table = NotificationSubscription.__table__
+        genre_rows = [
+            {'Kind': GENRE, 'Key': genre, 'UserId': user_id}
+            for user_id, raw in db.session.execute(
+                db.select(User.UserId, User._preferences).where(User._preferences.isnot(None))
+            )
+            for genre in preferred_genres(raw)
+        ]
+        book_rows = [
+            {'Kind': BOOK, 'Key': str(book_id), 'UserId': user_id}
+            for user_id, book_id in db.session.execute(
+                db.select(ReadingList.userID, ReadingList.bookID).distinct()
+            )
+        ]
+        try:
+            db.session.execute(table.delete())
+            if genre_rows:
+                db.session.execute(table.insert(), genre_rows)
+            if book_rows:
+                db.session.execute(table.insert(), book_rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return {'genre': len(genre_rows), 'book': len(book_rows)}
+
+
+def _write_genres(connection, user_id: int, raw_preferences: Optional[str]) -> None:
+    table = NotificationSubscription.__table__
+    connection.execute(table.delete().where(and_(table.c.UserId == user_id, table.c.Kind == GENRE)))
+    genres = preferred_genres(raw_preferences)
+    if genres:
+        connection.execute(table.insert(), [{'Kind': GENRE, 'Key': genre, 'UserId': user_id}
+                                            for genre in sorted(genres)])
+
+
+def _user_inserted(mapper, connection, target) -> None:
+    """Mapper hook: index a new user's preferred genres."""
+    if target._preferences:
+        _write_genres(connection, target.UserId, target._preferences)
+
+
+def _user_updated(mapper, connection, target) -> None:
+    """Mapper hook: re-index the genres when the preferences column changed."""
+    if inspect(target).attrs._preferences.history.has_changes():
+        _write_genres(connection, target.UserId, target._preferences)
+
+
+def _user_deleted(mapper, connection, target) -> None:
+    """Mapper hook: drop a deleted user's subscriptions before the row goes."""
+    table = NotificationSubscription.__table__
+    connection.execute(table.delete().where(table.c.UserId == target.UserId))
+
+
+def _book_key(target):
+    return BOOK, str(target.bookID), target.userID
+
+
+def _reading_list_inserted(mapper, connection, target) -> None:
+    """Mapper hook: subscribe the user to a book added to their reading list."""
+    table = NotificationSubscription.__table__
+    kind, key, user_id = _book_key(target)
+    exists = connection.execute(
+        db.select(table.c.UserId)
+        .where(table.c.Kind == kind, table.c.Key == key, table.c.UserId == user_id)
+    ).first()
+    if exists is None:
+        connection.execute(table.insert().values(Kind=kind, Key=key, UserId=user_id))
+
+
+def _reading_list_deleted(mapper, connection, target) -> None:
+    """Mapper hook: unsubscribe once no reading-list entry for the book remains."""
+    remaining = connection.execute(
+        db.select(ReadingList.id)
+        .where(ReadingList.userID == target.userID, ReadingList.bookID == target.bookID)
+        .limit(1)
+    ).first()
+    if remaining is None:
+        table = NotificationSubscription.__table__
+        kind, key, user_id = _book_key(target)
+        connection.execute(
+            table.delete().where(table.c.Kind == kind, table.c.Key == key, table.c.UserId == user_id)
+        )
+
+
+event.listen(User, 'after_insert', _user_inserted)
+event.listen(User, 'after_update', _user_updated)
+event.listen(User, 'before_delete', _user_deleted)
+event.listen(ReadingList, 'after_insert', _reading_list_inserted)
+event.listen(ReadingList, 'after_delete', _reading_list_deleted)
@@ -0,0 +1,298 @@
+"""
+Recommendation Cache: Serves per-user recommendation lists from the
+user_recommendations table and keeps them fresh in the background.
+
+Writes to WatchHistory, Review and Watchlist bump the owning user's cache
+version inside the same transaction. Once the transaction commits, the user is
+queued for the refresher thread, which recomputes the list while the route keeps
+serving the last good one.
+
+Users without watch history get trending picks, which change by the hour rather
+than with the user's writes. Those are computed per request and never stored.
+"""
+import queue
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, object_session
+
+from ..models import db, User, WatchHistory, Review, Watchlist, UserRecommendation
+from .recommendation_service import RecommendationService
+
+_SESSION_KEY = 'recommendation_cache_dirty_users'
+
+
+class RecommendationCache:
+    """
+    Singleton pattern implementation for the recommendation cache
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super(RecommendationCache, cls).__new__(cls)
+                    cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        """Initialize the refresh queue and metric counters."""
+        self._queue: "queue.Queue[int]" = queue.Queue()
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._app = None
+        self._metrics_lock = threading.Lock()
+        self._hits = 0
+        self._stale_hits = 0
+        self._misses = 0
+        self._recomputes = 0
+        self._recompute_errors = 0
+        self._staleness_total = 0.0
+        self._staleness_max = 0.0
+
+    def get(self, user_id: int) -> Dict[str, Any]:
+        """
+        Return the cached recommendations for a user with a single key lookup.
+
+        A missing entry is computed inline; a stale entry is served as-is and
+        queued for recomputation. Cold-start users are served trending picks
+        without an entry.
+        """
+        entry = db.session.get(UserRecommendation, user_id)
+        if entry is None:
+            self._record('miss')
+            entry = self._compute_entry(user_id)
+            if entry is None:
+                return self._trending_payload(user_id)
+            return self._payload(entry, stale=False)
+
+        if entry.is_stale:
+            self._record('stale', self._age_seconds(entry))
+            self.enqueue(user_id)
+            return self._payload(entry, stale=True)
+
+        self._record('hit')
+        return self._payload(entry, stale=False)
+
+    def invalidate(self, user_id: int) -> None:
+        """Mark a user's entry stale outside of the ORM event hooks (e.g. bulk deletes)."""
+        db.session.execute(
+            UserRecommendation.__table__.update()
+            .where(UserRecommendation.UserId == user_id)
+            .values(Version=UserRecommendation.Version + 1)
+        )
+        _mark_dirty(db.session(), user_id)
+
+    def enqueue(self, user_id: int) -> None:
+        """Queue a user for background recomputation, ignoring duplicates."""
+        with self._pending_lock:
+            if user_id in self._pending:
+                return
+            self._pending.add(user_id)
+        self._ensure_worker()
+        self._queue.put(user_id)
+
+    def refresh(self, user_id: int) -> Optional[UserRecommendation]:
+        """
+        Recompute one user's recommendations and store them against the version read.
+
+        Returns None when the entry was already fresh and nothing was recomputed,
+        or when the user is cold-start and any old entry was dropped.
+        """
+        entry = db.session.get(UserRecommendation, user_id)
+        if entry is not None and not entry.is_stale:
+            return None
+        return self._compute_entry(user_id, entry)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get hit-rate and staleness metrics for the cache."""
+        with self._metrics_lock:
+            lookups = self._hits + self._stale_hits + self._misses
+            return {
+                'lookups': lookups,
+                'hits': self._hits,
+                'stale_hits': self._stale_hits,
+                'misses': self._misses,
+                'hit_rate': round((self._hits + self._stale_hits) / lookups * 100, 2) if lookups else 0.0,
+                'fresh_hit_rate': round(self._hits / lookups * 100, 2) if lookups else 0.0,
+                'average_staleness_seconds': round(self._staleness_total / self._stale_hits, 3) if self._stale_hits else 0.0,
+                'max_staleness_seconds': round(self._staleness_max, 3),
+                'recomputes': self._recomputes,
+                'recompute_errors': self._recompute_errors,
+                'queue_depth': self._queue.qsize()
+            }
+
+    def _compute_entry(self, user_id: int,
+                       entry: Optional[UserRecommendation] = None) -> Optional[UserRecommendation]:
+        """
+        Compute recommendations and persist them with the version they were built from.
+
+        Returns None for cold-start users, whose trending picks are not cached;
+        an entry left over from earlier history is deleted.
+        """
+        user = db.session.get(User, user_id)
+        service = RecommendationService()
+        if user is None or service.is_cold_start(user):
+            if entry is not None:
+                db.session.delete(entry)
+                db.session.commit()
+            return None
+        version = entry.Version if entry is not None else 0
+        recommendations = service.get_recommendations(user)
+
+        if entry is None:
+            entry = UserRecommendation(UserId=user_id, Version=0)
+            db.session.add(entry)
+        entry.recommendations = recommendations
+        entry.ComputedVersion = version
+        entry.ComputedAt = datetime.now(timezone.utc)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # The refresher or another process created the entry first; serve theirs
+            db.session.rollback()
+            return db.session.get(UserRecommendation, user_id)
+        return entry
+
+    def _ensure_worker(self) -> None:
+        """Start the refresher thread on first use, bound to the current application."""
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            if self._app is None:
+                if not has_app_context():
+                    return
+                self._app = current_app._get_current_object()
+            self._worker = threading.Thread(
+                target=self._run, name='recommendation-refresher', daemon=True
+            )
+            self._worker.start()
+
+    def _run(self) -> None:
+        """Refresher loop: drain queued users, periodically sweeping for stale rows."""
+        poll_seconds = self._app.config.get('RECOMMENDATION_CACHE_POLL_SECONDS', 30)
+        while True:
+            try:
+                user_id = self._queue.get(timeout=poll_seconds)
+            except queue.Empty:
+                self._sweep_stale()
+                continue
+
+            with self._pending_lock:
+                self._pending.discard(user_id)
+            with self._app.app_context():
+                try:
+                    if self.refresh(user_id) is not None:
+                        self._record('recompute')
+                except Exception as e:
+                    db.session.rollback()
+                    self._record('error')
+                    self._app.logger.error(f"Error refreshing recommendations for user {user_id}: {str(e)}")
+                finally:
+                    db.session.remove()
+
+    def _sweep_stale(self, limit: int = 500) -> None:
+        """Queue stale entries written by other processes."""
+        with self._app.app_context():
+            try:
+                stale_ids = db.session.execute(
+                    db.select(UserRecommendation.UserId)
+                    .where(UserRecommendation.ComputedVersion < UserRecommendation.Version)
+                    .limit(limit)
+                ).scalars().all()
+            finally:
+                db.session.remove()
+        for user_id in stale_ids:
+            self.enqueue(user_id)
+
+    def _record(self, kind: str, staleness: float = 0.0) -> None:
+        with self._metrics_lock:
+            if kind == 'hit':
+                self._hits += 1
+            elif kind == 'stale':
+                self._stale_hits += 1
+                self._staleness_total += staleness
+                self._staleness_max = max(self._staleness_max, staleness)
+            elif kind == 'miss':
+                self._misses += 1
+            elif kind == 'recompute':
+                self._recomputes += 1
+            elif kind == 'error':
+                self._recompute_errors += 1
+
+    @staticmethod
+    def _age_seconds(entry: UserRecommendation) -> float:
+        if entry.ComputedAt is None:
+            return 0.0
+        computed_at = entry.ComputedAt
+        if computed_at.tzinfo is None:
+            computed_at = computed_at.replace(tzinfo=timezone.utc)
+        return max(0.0, (datetime.now(timezone.utc) - computed_at).total_seconds())
+
+    @staticmethod
+    def _trending_payload(user_id: int) -> Dict[str, Any]:
+        user = db.session.get(User, user_id)
+        return {
+            'recommendations': RecommendationService().get_trending_recommendations() if user else [],
+            'version': None,
+            'computed_at': datetime.now(timezone.utc),
+            'stale': False
+        }
+
+    @staticmethod
+    def _payload(entry: UserRecommendation, stale: bool) -> Dict[str, Any]:
+        return {
+            'recommendations': entry.recommendations,
+            'version': entry.ComputedVersion,
+            'computed_at': entry.ComputedAt,
+            'stale': stale
+        }
+
+
+def _mark_dirty(session: Optional[Session], user_id: int) -> None:
+    """Remember a user whose cache entry must be refreshed once the session commits."""
+    if session is not None and user_id is not None:
+        session.info.setdefault(_SESSION_KEY, set()).add(user_id)
+
+
+def _bump_version(mapper, connection, target) -> None:
+    """Mapper hook: invalidate the owning user's entry in the writer's transaction."""
+    user_id = target.UserId if isinstance(target, Review) else target.userID
+    if user_id is None:
+        return
+    connection.execute(
+        UserRecommendation.__table__.update()
+        .where(UserRecommendation.__table__.c.UserId == user_id)
+        .values(Version=UserRecommendation.__table__.c.Version + 1)
+    )
+    _mark_dirty(object_session(target), user_id)
+
+
+for _model in (WatchHistory, Review, Watchlist):
+    event.listen(_model, 'after_insert', _bump_version)
+    event.listen(_model, 'after_delete', _bump_version)
+
+
+@event.listens_for(Session, 'after_commit')
+def _queue_dirty_users(session: Session) -> None:
+    """Hand committed invalidations to the refresher thread."""
+    dirty = session.info.pop(_SESSION_KEY, None)
+    if not dirty:
+        return
+    cache = RecommendationCache()
+    for user_id in dirty:
+        cache.enqueue(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_dirty_users(session: Session) -> None:
+    session.info.pop(_SESSION_KEY, None)
@@ -4,8 +4,8 @@ and viewing history.
 """
 from typing import List, Dict, Any
 from ..models import User, Movie, WatchHistory, Review
+from .trending_service import TrendingService
 from sqlalchemy import func
-import numpy as np
 from collections import defaultdict
 
 class RecommendationService:
@@ -22,11 +22,15 @@ class RecommendationService:
     def get_recommendations(self, user: User) -> List[Dict[str, Any]]:
         """Generate personalized movie recommendations"""
         # Get user's watch history
-        watched_movies = WatchHistory.query.filter_by(userID=user.userID).all()
+        watched_movies = WatchHistory.query.filter_by(userID=user.UserId).all()
         watched_ids = [wh.movieID for wh in watched_movies]
 
+        # Cold-start users get what is trending on AJTracker instead of nothing
+        if not watched_ids:
+            return self.get_trending_recommendations(limit=10)
+
         # Get user's ratings
-        user_ratings = Review.query.filter_by(userID=user.userID).all()
+        user_ratings = Review.query.filter_by(UserId=user.UserId).all()
         
         # Calculate genre preferences
         genre_scores = self._calculate_genre_preferences(watched_movies, user_ratings)
@@ -49,10 +53,11 @@ class RecommendationService:
         # Weight genres based on watch history and ratings
         for wh in watch_history:
             movie = Movie.query.get(wh.movieID)
-            if movie and movie.genres:
-                for genre in movie.genres:
+            genres = movie.genres if movie else None
+            if genres:
+                for genre in genres:
                     # Find corresponding rating if exists
-                    rating = next((r.rating for r in ratings if r.movieID == movie.movieID), 3.0)
+                    rating = next((r.Rating for r in ratings if r.movieID == movie.movieID), 3.0)
                     genre_scores[genre] += rating
                     genre_counts[genre] += 1
 
@@ -75,8 +80,9 @@ class RecommendationService:
         # Score movies based on genre preferences
         movie_scores = []
         for movie in available_movies:
-            if movie.genres:
-                score = sum(genre_preferences.get(genre, 0) for genre in movie.genres)
+            genres = movie.genres
+            if genres:
+                score = sum(genre_preferences.get(genre, 0) for genre in genres)
                 movie_scores.append((movie, score))
 
         # Sort by score and return top recommendations
@@ -93,3 +99,24 @@ class RecommendationService:
             })
 
         return recommendations
+
+    def is_cold_start(self, user: User) -> bool:
+        """Whether a user has no watch history, so recommendations fall back to trending"""
+        return WatchHistory.query.filter_by(userID=user.UserId).first() is None
+
+    def get_trending_recommendations(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Get the day's trending movies as recommendations for users without history"""
+        trending = TrendingService().top('movie', 'day', limit)
+        movies = {
+            movie.movieID: movie
+            for movie in Movie.query.filter(Movie.movieID.in_([t['id'] for t in trending])).all()
+        } if trending else {}
+
+        return [{
+            'movie_id': item['id'],
+            'title': movies[item['id']].title,
+            'score': item['score'],
+            'genres': movies[item['id']].genres,
+            'average_rating': movies[item['id']].average_rating,
+            'trending': True
+        } for item in trending if item['id'] in movies]
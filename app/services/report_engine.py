@@ -0,0 +1,172 @@
+"""
+Report Engine: Activity reports for arbitrary [start, end) windows of whole UTC days.
+
+All activity metrics come from a single aggregate scan of user_daily_activity
+over the window. That includes distinct active users across watches, reads and
+reviews, counted with COUNT(DISTINCT ...) rather than per-table row counts.
+Finished reports are cached per window. Windows that ended before today only
+change when rollups are backfilled, so they are kept for FINISHED_TTL_SECONDS;
+windows that include today are kept for OPEN_TTL_SECONDS.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Any, Tuple, Union
+
+from sqlalchemy import func, case
+
+from ..models import db, User, Movie, Book, UserDailyActivity
+
+FINISHED_TTL_SECONDS = 3600
+OPEN_TTL_SECONDS = 60
+MAX_CACHED_REPORTS = 256
+
+DateLike = Union[date, datetime, str]
+
+
+def to_day(value: DateLike) -> date:
+    """Whole UTC day for a date, datetime or ISO date string."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        return value.date()
+    return value
+
+
+class ReportEngine:
+    """
+    Singleton pattern implementation for windowed activity reports
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super(ReportEngine, cls).__new__(cls)
+                    cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        """Initialize the report cache."""
+        self._cache: 'OrderedDict[Tuple[date, date], Tuple[float, Dict[str, Any]]]' = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def report(self, start: DateLike, end: DateLike) -> Dict[str, Any]:
+        """
+        Get the activity report for the days in [start, end).
+
+        Args:
+            start: First day included
+            end: First day excluded
+
+        Returns:
+            Dict with period, user_metrics, activity_metrics and content_metrics
+
+        Raises:
+            ValueError: If the window is empty
+        """
+        start, end = to_day(start), to_day(end)
+        if start >= end:
+            raise ValueError(f"Report window must end after it starts: [{start}, {end})")
+
+        key = (start, end)
+        now = time.monotonic()
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] > now:
+                self._cache.move_to_end(key)
+                self._hits += 1
+                return cached[1]
+            self._misses += 1
+
+        report = self._compute(start, end)
+        finished = end <= datetime.now(timezone.utc).date()
+        expires = now + (FINISHED_TTL_SECONDS if finished else OPEN_TTL_SECONDS)
+        with self._cache_lock:
+            self._cache[key] = (expires, report)
+            self._cache.move_to_end(key)
+            while len(self._cache) > MAX_CACHED_REPORTS:
+                self._cache.popitem(last=False)
+        return report
+
+    def clear(self) -> None:
+        """Drop every cached report, e.g. after rollups were backfilled."""
+        with self._cache_lock:
+            self._cache.clear()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get cache hit-rate metrics."""
+        with self._cache_lock:
+            lookups = self._hits + self._misses
+            return {
+                'cached_reports': len(self._cache),
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / lookups * 100, 2) if lookups else 0.0
+            }
+
+    @staticmethod
+    def _compute(start: date, end: date) -> Dict[str, Any]:
+        """Compute a report with one aggregate scan of the daily rollups."""
+        activity = UserDailyActivity
+        active = (activity.Watches > 0) | (activity.Reads > 0) | (activity.Reviews > 0)
+        row = db.session.execute(
+            db.select(
+                func.count(func.distinct(case((active, activity.UserId)))).label('active_users'),
+                func.count(func.distinct(case((activity.Watches > 0, activity.UserId)))).label('watchers'),
+                func.count(func.distinct(case((activity.Reads > 0, activity.UserId)))).label('readers'),
+                func.count(func.distinct(case((activity.Reviews > 0, activity.UserId)))).label('reviewers'),
+                func.coalesce(func.sum(activity.Watches), 0).label('watches'),
+                func.coalesce(func.sum(activity.Reads), 0).label('reads'),
+                func.coalesce(func.sum(activity.Reviews), 0).label('reviews'),
+                func.coalesce(func.sum(activity.RatedReviews), 0).label('rated_reviews'),
+                func.coalesce(func.sum(activity.RatingSum), 0.0).label('rating_sum')
+            ).where(activity.Day >= start, activity.Day < end)
+        ).one()
+
+        total_users = db.session.execute(db.select(func.count(User.UserId))).scalar()
+        total_movies = db.session.execute(db.select(func.count(Movie.movieID))).scalar()
+        total_books = db.session.execute(db.select(func.count(Book.BookId))).scalar()
+
+        return {
+            'period': {
+                'start': start.isoformat(),
+                'end': end.isoformat(),
+                'days': (end - start).days
+            },
+            'user_metrics': {
+                'total_users': total_users,
+                'active_users': row.active_users,
+                'watchers': row.watchers,
+                'readers': row.readers,
+                'reviewers': row.reviewers,
+                'engagement_rate': round(row.active_users / total_users * 100, 2) if total_users else 0
+            },
+            'activity_metrics': {
+                'watches': int(row.watches),
+                'reads': int(row.reads),
+                'reviews': int(row.reviews),
+                'average_rating': round(row.rating_sum / row.rated_reviews, 2) if row.rated_reviews else None,
+                'actions_per_active_user': round((row.watches + row.reads + row.reviews) / row.active_users, 2)
+                if row.active_users else 0
+            },
+            'content_metrics': {
+                'total_movies': total_movies,
+                'total_books': total_books,
+                'new_reviews': int(row.reviews)
+            },
+            'generated_at': datetime.now(timezone.utc).isoformat()
+        }
+
+
+def last_days(days: int = 7) -> Tuple[date, date]:
+    """The [start, end) window covering the last `days` days, today included."""
+    end = datetime.now(timezone.utc).date() + timedelta(days=1)
+    return end - timedelta(days=days), end
@@ -0,0 +1,538 @@
+"""
+Similarity Index: Content-based "more like this" lookups over movie overviews,
+book descriptions and adaptation overviews.
+
+Documents are tokenized into unigrams and bigrams, hashed into a fixed feature
+space and weighted with TF-IDF. Vectors are L2-normalised, so a dot product is the
+cosine similarity. The index has two segments:
+
+- a base segment, built from the database and persisted to disk as numpy arrays
+  that are memory-mapped on first use (so application startup never imports numpy);
+- an in-memory delta segment holding rows added or changed since the base was
+  built, filled by refresh().
+
+refresh() indexes rows above each kind's id high-water mark, re-reads rows this
+process committed edits to (reported by the change-capture bus, which also catches
+inserts that commit below the high-water mark), and tombstones rows that no longer
+exist, found by comparing ids. The bus only sees this process's commits, so an edit
+committed by another process reaches this one at the next rebuild.
+
+Delta documents are weighted with the base document frequencies until the next
+rebuild() folds them into a new base segment. rebuild() runs in one process; every
+other process notices the new meta.json (checked at most every RELOAD_CHECK_SECONDS)
+and remaps the base segment, dropping a delta the new base already covers.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import zlib
+from collections import defaultdict
+from typing import Dict, Any, List, Optional, Set, Tuple, Iterable
+
+from ..models import db, Movie, Book, MovieAdaptation
+from ..utils.lazy_import import lazy_import
+from .change_capture import ChangeCapture, INSERT, UPDATE
+
+np = lazy_import('numpy')
+
+KIND_MOVIE = 0
+KIND_BOOK = 1
+KIND_ADAPTATION = 2
+KIND_NAMES = {KIND_MOVIE: 'movie', KIND_BOOK: 'book', KIND_ADAPTATION: 'adaptation'}
+KIND_CODES = {name: code for code, name in KIND_NAMES.items()}
+
+# kind, table, id column and the columns a document's text is made of
+_SOURCES = (
+    ('movie', Movie.__tablename__, Movie.movieID, Movie.title, Movie.overview),
+    ('book', Book.__tablename__, Book.BookId, Book.Title, Book.Description),
+    ('adaptation', MovieAdaptation.__tablename__, MovieAdaptation.MovieAdaptationId,
+     MovieAdaptation.Title, MovieAdaptation.Overview),
+)
+_TABLE_KINDS = {table: kind for kind, table, _, _, _ in _SOURCES}
+_TEXT_COLUMNS = {table: {title.name, text.name} for _, table, _, title, text in _SOURCES}
+
+DEFAULT_FEATURES = 2 ** 18
+# Ids per query when re-reading changed documents
+CHANGED_BATCH_SIZE = 500
+# How often a process checks whether another process rebuilt the persisted segment
+RELOAD_CHECK_SECONDS = 30
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+_STOPWORDS = frozenset("""
+a an and are as at be but by for from has have he her his in into is it its
+of on or she that the their them they this to was were which who will with
+""".split())
+
+_ARRAYS = ('term_ptr', 'postings_doc', 'postings_weight', 'doc_ptr', 'doc_terms',
+           'doc_weights', 'doc_kind', 'doc_ref', 'df')
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Lowercase word tokens with stopwords removed, plus adjacent-word bigrams."""
+    if not text:
+        return []
+    words = [w for w in _TOKEN_RE.findall(text.lower()) if w not in _STOPWORDS and len(w) > 1]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def hash_features(tokens: Iterable[str], n_features: int) -> Dict[int, int]:
+    """Map tokens to hashed feature ids with their term counts."""
+    counts: Dict[int, int] = {}
+    for token in tokens:
+        feature = zlib.crc32(token.encode('utf-8')) % n_features
+        counts[feature] = counts.get(feature, 0) + 1
+    return counts
+
+
+def _weigh(counts: Dict[int, int], df: np.ndarray, n_docs: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Turn raw term counts into an L2-normalised sublinear TF-IDF vector."""
+    if not counts:
+        return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+    terms = np.fromiter(counts.keys(), dtype=np.int32, count=len(counts))
+    tf = 1.0 + np.log(np.fromiter(counts.values(), dtype=np.float64, count=len(counts)))
+    idf = np.log((1.0 + n_docs) / (1.0 + df[terms])) + 1.0
+    weights = tf * idf
+    norm = np.linalg.norm(weights)
+    if norm > 0:
+        weights /= norm
+    order = np.argsort(terms)
+    return terms[order], weights[order].astype(np.float32)
+
+
+class _Segment:
+    """Immutable, possibly memory-mapped, base segment."""
+
+    def __init__(self, arrays: Dict[str, np.ndarray], meta: Dict[str, Any]):
+        self.arrays = arrays
+        self.meta = meta
+        self.n_docs = int(meta.get('n_docs', 0))
+        self.positions: Dict[Tuple[int, int], int] = {
+            (int(kind), int(ref)): pos
+            for pos, (kind, ref) in enumerate(zip(arrays['doc_kind'], arrays['doc_ref']))
+        }
+
+    @classmethod
+    def empty(cls, n_features: int) -> '_Segment':
+        arrays = {
+            'term_ptr': np.zeros(n_features + 1, dtype=np.int64),
+            'postings_doc': np.empty(0, dtype=np.int32),
+            'postings_weight': np.empty(0, dtype=np.float32),
+            'doc_ptr': np.zeros(1, dtype=np.int64),
+            'doc_terms': np.empty(0, dtype=np.int32),
+            'doc_weights': np.empty(0, dtype=np.float32),
+            'doc_kind': np.empty(0, dtype=np.int8),
+            'doc_ref': np.empty(0, dtype=np.int64),
+            'df': np.zeros(n_features, dtype=np.int32),
+        }
+        return cls(arrays, {'n_docs': 0, 'n_features': n_features, 'high_water': {}})
+
+    def vector(self, pos: int) -> Tuple[np.ndarray, np.ndarray]:
+        start, end = self.arrays['doc_ptr'][pos], self.arrays['doc_ptr'][pos + 1]
+        return self.arrays['doc_terms'][start:end], self.arrays['doc_weights'][start:end]
+
+    def scores(self, terms: np.ndarray, weights: np.ndarray) -> np.ndarray:
+        """Accumulate dot products for every base document via the term postings."""
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        term_ptr = self.arrays['term_ptr']
+        postings_doc = self.arrays['postings_doc']
+        postings_weight = self.arrays['postings_weight']
+        for term, weight in zip(terms, weights):
+            start, end = term_ptr[term], term_ptr[term + 1]
+            if start != end:
+                # A document appears at most once per posting list, so fancy indexing is safe
+                scores[postings_doc[start:end]] += weight * postings_weight[start:end]
+        return scores
+
+
+class SimilarityIndex:
+    """
+    Singleton pattern implementation for the content similarity index
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super(SimilarityIndex, cls).__new__(cls)
+                    cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        """Start with an empty index until init_app() or load() points at a directory."""
+        self.path: Optional[str] = None
+        self.n_features = DEFAULT_FEATURES
+        self._segment: Optional[_Segment] = None
+        # None marks a tombstone: a base document that was deleted
+        self._delta: Dict[Tuple[int, int], Optional[Tuple[np.ndarray, np.ndarray]]] = {}
+        self._high_water: Dict[str, int] = {}
+        self._changed: Set[Tuple[str, int]] = set()
+        self._loaded_mtime: Optional[int] = None
+        self._next_reload_check = 0.0
+        self._write_lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._logger = logging.getLogger(__name__)
+
+    def init_app(self, app) -> None:
+        """Point at the persisted base segment; it is memory-mapped on first use."""
+        self.path = app.config.get('SIMILARITY_INDEX_PATH') or os.path.join(app.instance_path, 'similarity_index')
+        self._segment = None
+        self._logger = app.logger
+
+    @property
+    def _base(self) -> _Segment:
+        """The base segment, opened (and numpy imported) on first access."""
+        segment = self._segment
+        if segment is None:
+            self._ensure_loaded()
+            segment = self._segment
+        elif time.monotonic() >= self._next_reload_check:
+            self._reload_if_rebuilt()
+            segment = self._segment
+        return segment
+
+    def _reload_if_rebuilt(self) -> None:
+        """Remap the base segment if another process has rebuilt it since it was loaded."""
+        with self._load_lock:
+            if time.monotonic() < self._next_reload_check:
+                return
+            self._next_reload_check = time.monotonic() + RELOAD_CHECK_SECONDS
+            if self.path is None:
+                return
+            try:
+                mtime = os.stat(os.path.join(self.path, 'meta.json')).st_mtime_ns
+            except OSError:
+                return
+            if mtime == self._loaded_mtime:
+                return
+            try:
+                self.load(self.path)
+            except Exception as e:
+                self._logger.error(f"Error reloading similarity index from {self.path}: {str(e)}")
+
+    def _ensure_loaded(self) -> None:
+        if self._segment is not None:
+            return
+        with self._load_lock:
+            if self._segment is not None:
+                return
+            if self.path is not None:
+                try:
+                    self.load(self.path)
+                except Exception as e:
+                    self._logger.error(f"Error loading similarity index from {self.path}: {str(e)}")
+            if self._segment is None:
+                self._segment = _Segment.empty(self.n_features)
+
+    def load(self, path: str) -> None:
+        """Open the base segment at path read-only via mmap and reset the delta."""
+        self.path = path
+        meta_file = os.path.join(path, 'meta.json')
+        if not os.path.exists(meta_file):
+            return
+        mtime = os.stat(meta_file).st_mtime_ns
+        with open(meta_file) as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in _ARRAYS}
+        with self._write_lock:
+            self.n_features = int(meta['n_features'])
+            self._segment = _Segment(arrays, meta)
+            self._delta = {}
+            self._high_water = dict(meta.get('high_water', {}))
+            self._loaded_mtime = mtime
+            self._next_reload_check = time.monotonic() + RELOAD_CHECK_SECONDS
+
+    @property
+    def size(self) -> int:
+        """Number of live documents across the base and delta segments."""
+        base, delta = self._base, self._delta
+        added = sum(1 for key, vector in delta.items() if vector is not None and key not in base.positions)
+        removed = sum(1 for key, vector in delta.items() if vector is None and key in base.positions)
+        return base.n_docs + added - removed
+
+    def more_like_this(self, kind: str, ref_id: int, k: int = 10,
+                       kinds: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Find the k documents most similar to an indexed movie, book or adaptation.
+
+        Args:
+            kind: 'movie', 'book' or 'adaptation'
+            ref_id: Primary key of the row in its own table
+            k: Number of results to return
+            kinds: Optional restriction on the kinds of documents returned
+
+        Returns:
+            List of {'kind', 'id', 'score'} dicts, best match first
+        """
+        key = (KIND_CODES[kind], int(ref_id))
+        vector = self._vector(key)
+        if vector is None:
+            return []
+        return self._top_k(vector, k, kinds, exclude=key)
+
+    def search_text(self, text: str, k: int = 10, kinds: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Find the k indexed documents most similar to free text."""
+        base = self._base
+        vector = _weigh(hash_features(tokenize(text), self.n_features), base.arrays['df'], base.n_docs)
+        return self._top_k(vector, k, kinds)
+
+    def add_document(self, kind: str, ref_id: int, text: Optional[str]) -> None:
+        """Add or replace a single document in the delta segment."""
+        base = self._base
+        vector = _weigh(hash_features(tokenize(text), self.n_features), base.arrays['df'], base.n_docs)
+        with self._write_lock:
+            delta = dict(self._delta)
+            delta[(KIND_CODES[kind], int(ref_id))] = vector
+            self._delta = delta
+
+    def remove_document(self, kind: str, ref_id: int) -> None:
+        """Tombstone a document so it stops matching until the next rebuild drops it."""
+        with self._write_lock:
+            delta = dict(self._delta)
+            delta[(KIND_CODES[kind], int(ref_id))] = None
+            self._delta = delta
+
+    def mark_changed(self, kind: str, ref_id: int) -> None:
+        """Queue a document whose row was inserted or edited for the next refresh()."""
+        with self._write_lock:
+            self._changed.add((kind, int(ref_id)))
+
+    def refresh(self) -> int:
+        """
+        Bring the delta segment up to date with the database.
+
+        Indexes rows created since the last build or refresh, re-indexes rows queued
+        by mark_changed(), and tombstones indexed documents whose rows were deleted.
+
+        Returns:
+            Number of documents added, re-indexed or removed
+        """
+        self._ensure_loaded()
+        updated = 0
+        for kind, rows in self._new_rows():
+            for ref_id, text in rows:
+                self.add_document(kind, ref_id, text)
+                self._high_water[kind] = max(self._high_water.get(kind, 0), ref_id)
+                updated += 1
+
+        with self._write_lock:
+            changed, self._changed = self._changed, set()
+        try:
+            updated += self._reindex(changed)
+        except Exception:
+            with self._write_lock:
+                self._changed |= changed
+            raise
+        return updated + self._remove_deleted()
+
+    def _reindex(self, changed: Set[Tuple[str, int]]) -> int:
+        """Re-read queued documents; rows that are gone are left to _remove_deleted()."""
+        by_kind: Dict[str, List[int]] = defaultdict(list)
+        for kind, ref_id in changed:
+            by_kind[kind].append(ref_id)
+        reindexed = 0
+        for kind, ref_ids in by_kind.items():
+            for start in range(0, len(ref_ids), CHANGED_BATCH_SIZE):
+                for ref_id, text in self._rows_with_ids(kind, ref_ids[start:start + CHANGED_BATCH_SIZE]):
+                    self.add_document(kind, ref_id, text)
+                    reindexed += 1
+        return reindexed
+
+    def _remove_deleted(self) -> int:
+        """Tombstone live documents whose rows no longer exist; one id scan per kind."""
+        base, delta = self._base, self._delta
+        indexed: Dict[int, Set[int]] = defaultdict(set)
+        for kind_code, ref in base.positions:
+            indexed[kind_code].add(ref)
+        for (kind_code, ref), vector in delta.items():
+            if vector is None:
+                indexed[kind_code].discard(ref)
+            else:
+                indexed[kind_code].add(ref)
+        removed = 0
+        for kind, existing in self._existing_ids():
+            for ref in indexed[KIND_CODES[kind]] - existing:
+                self.remove_document(kind, ref)
+                removed += 1
+        return removed
+
+    def rebuild(self, path: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Build a fresh base segment from the database, persist it and memory-map it.
+
+        Returns:
+            The metadata written alongside the segment
+        """
+        path = path or self.path
+        if path is None:
+            raise ValueError("No similarity index path configured")
+        self._ensure_loaded()
+
+        n_features = self.n_features
+        documents: List[Tuple[int, int, Dict[int, int]]] = []
+        high_water: Dict[str, int] = {}
+        for kind, rows in self._all_rows():
+            for ref_id, text in rows:
+                documents.append((KIND_CODES[kind], ref_id, hash_features(tokenize(text), n_features)))
+                high_water[kind] = max(high_water.get(kind, 0), ref_id)
+
+        n_docs = len(documents)
+        df = np.zeros(n_features, dtype=np.int32)
+        for _, _, counts in documents:
+            if counts:
+                df[np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))] += 1
+
+        doc_ptr = np.zeros(n_docs + 1, dtype=np.int64)
+        term_chunks, weight_chunks = [], []
+        for pos, (_, _, counts) in enumerate(documents):
+            terms, weights = _weigh(counts, df, n_docs)
+            term_chunks.append(terms)
+            weight_chunks.append(weights)
+            doc_ptr[pos + 1] = doc_ptr[pos] + len(terms)
+        doc_terms = np.concatenate(term_chunks) if term_chunks else np.empty(0, dtype=np.int32)
+        doc_weights = np.concatenate(weight_chunks) if weight_chunks else np.empty(0, dtype=np.float32)
+
+        # Transpose the document-major CSR into term-major postings
+        doc_of_entry = np.repeat(np.arange(n_docs, dtype=np.int32), np.diff(doc_ptr))
+        order = np.argsort(doc_terms, kind='stable')
+        postings_doc = doc_of_entry[order]
+        postings_weight = doc_weights[order]
+        term_ptr = np.zeros(n_features + 1, dtype=np.int64)
+        np.cumsum(np.bincount(doc_terms, minlength=n_features), out=term_ptr[1:])
+
+        arrays = {
+            'term_ptr': term_ptr,
+            'postings_doc': postings_doc,
+            'postings_weight': postings_weight,
+            'doc_ptr': doc_ptr,
+            'doc_terms': doc_terms,
+            'doc_weights': doc_weights,
+            'doc_kind': np.array([d[0] for d in documents], dtype=np.int8),
+            'doc_ref': np.array([d[1] for d in documents], dtype=np.int64),
+            'df': df,
+        }
+        meta = {'n_docs': n_docs, 'n_features': n_features, 'high_water': high_water}
+        self._write(path, arrays, meta)
+        self.load(path)
+        return meta
+
+    def _vector(self, key: Tuple[int, int]) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        delta, base = self._delta, self._base
+        if key in delta:
+            return delta[key]
+        pos = base.positions.get(key)
+        return base.vector(pos) if pos is not None else None
+
+    def _top_k(self, vector: Tuple[np.ndarray, np.ndarray], k: int,
+               kinds: Optional[List[str]], exclude: Optional[Tuple[int, int]] = None) -> List[Dict[str, Any]]:
+        terms, weights = vector
+        if len(terms) == 0 or k <= 0:
+            return []
+        base, delta = self._base, self._delta
+        allowed = {KIND_CODES[name] for name in kinds} if kinds else None
+
+        candidates: List[Tuple[float, int, int]] = []
+        if base.n_docs:
+            scores = base.scores(terms, weights)
+            # Documents superseded by the delta (or the query itself) must not match from the base
+            for key in list(delta.keys()) + ([exclude] if exclude else []):
+                pos = base.positions.get(key)
+                if pos is not None:
+                    scores[pos] = 0.0
+            if allowed is not None:
+                scores[~np.isin(base.arrays['doc_kind'], list(allowed))] = 0.0
+            n = min(k, base.n_docs)
+            top = np.argpartition(-scores, n - 1)[:n]
+            for pos in top:
+                if scores[pos] > 0:
+                    candidates.append((float(scores[pos]), int(base.arrays['doc_kind'][pos]),
+                                       int(base.arrays['doc_ref'][pos])))
+
+        query = dict(zip(terms.tolist(), weights.tolist()))
+        for (kind, ref), vector in delta.items():
+            if vector is None or (kind, ref) == exclude or (allowed is not None and kind not in allowed):
+                continue
+            d_terms, d_weights = vector
+            score = sum(query.get(t, 0.0) * w for t, w in zip(d_terms.tolist(), d_weights.tolist()))
+            if score > 0:
+                candidates.append((score, kind, ref))
+
+        candidates.sort(key=lambda c: c[0], reverse=True)
+        return [{'kind': KIND_NAMES[kind], 'id': ref, 'score': round(score, 4)}
+                for score, kind, ref in candidates[:k]]
+
+    def _all_rows(self):
+        return self._rows_since({})
+
+    def _new_rows(self):
+        return self._rows_since(self._high_water)
+
+    @staticmethod
+    def _rows_since(high_water: Dict[str, int]):
+        """Yield (kind, [(id, text), ...]) for rows with ids above each kind's high-water mark."""
+        for kind, _, id_column, title_column, text_column in _SOURCES:
+            rows = db.session.execute(
+                db.select(id_column, title_column, text_column)
+                .where(id_column > high_water.get(kind, 0))
+                .order_by(id_column)
+            ).all()
+            yield kind, [(ref_id, f"{title or ''} {text or ''}") for ref_id, title, text in rows]
+
+    @staticmethod
+    def _rows_with_ids(kind: str, ref_ids: List[int]) -> List[Tuple[int, str]]:
+        """(id, text) for the given rows of one kind that still exist."""
+        for source_kind, _, id_column, title_column, text_column in _SOURCES:
+            if source_kind == kind:
+                rows = db.session.execute(
+                    db.select(id_column, title_column, text_column).where(id_column.in_(ref_ids))
+                ).all()
+                return [(ref_id, f"{title or ''} {text or ''}") for ref_id, title, text in rows]
+        raise ValueError(f"Unknown document kind: {kind}")
+
+    @staticmethod
+    def _existing_ids():
+        """Yield (kind, set of ids) for every row of each kind."""
+        for kind, _, id_column, _, _ in _SOURCES:
+            yield kind, set(db.session.execute(db.select(id_column)).scalars())
+
+    @staticmethod
+    def _write(path: str, arrays: Dict[str, np.ndarray], meta: Dict[str, Any]) -> None:
+        """Write a segment to a temporary directory and swap it into place."""
+        tmp_path = f"{path}.tmp"
+        old_path = f"{path}.old"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_path, f'{name}.npy'), np.ascontiguousarray(array))
+        with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        shutil.rmtree(old_path, ignore_errors=True)
+        if os.path.exists(path):
+            os.replace(path, old_path)
+        os.replace(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+
+
+def _on_committed_changes(changes: List[Dict[str, Any]]) -> None:
+    """Change-capture handler: queue inserted rows and text edits for the next refresh."""
+    index = SimilarityIndex()
+    for change in changes:
+        kind = _TABLE_KINDS[change['table']]
+        if change['op'] == INSERT:
+            # Rows above the high-water mark are picked up anyway; these committed late
+            queue = change['pk'] <= index._high_water.get(kind, 0)
+        else:
+            # Deletes are found by the id scan, which also sees other processes' deletes
+            queue = change['op'] == UPDATE and bool(_TEXT_COLUMNS[change['table']].intersection(change['columns']))
+        if queue:
+            index.mark_changed(kind, change['pk'])
+
+
+ChangeCapture().subscribe(_on_committed_changes, tuple(_TABLE_KINDS))
@@ -4,6 +4,20 @@ from app.models import Movie
 from datetime import datetime
 from app import db
 
+# TMDb's fixed movie genre ids; list results carry only genre_ids, details carry names
+TMDB_GENRES = {
+    28: 'Action', 12: 'Adventure', 16: 'Animation', 35: 'Comedy', 80: 'Crime',
+    99: 'Documentary', 18: 'Drama', 10751: 'Family', 14: 'Fantasy', 36: 'History',
+    27: 'Horror', 10402: 'Music', 9648: 'Mystery', 10749: 'Romance',
+    878: 'Science Fiction', 10770: 'TV Movie', 53: 'Thriller', 10752: 'War', 37: 'Western'
+}
+
+def genre_names(movie_data):
+    """Genre names from TMDb list results (genre_ids) or details (genres)."""
+    if movie_data.get('genres'):
+        return [genre['name'] for genre in movie_data['genres'] if genre.get('name')]
+    return [TMDB_GENRES[genre_id] for genre_id in movie_data.get('genre_ids') or [] if genre_id in TMDB_GENRES]
+
 def get_popular_movies():
     """Get a list of popular movies from TMDB API."""
     api_key = os.getenv('TMDB_API_KEY')
@@ -34,7 +48,8 @@ def create_movie_from_tmdb_data(movie_data):
         tmdb_id=movie_data.get('id'),
         releaseDate=release_date,  # Corrected attribute name
         overview=movie_data.get('overview', ''),
-        average_rating=movie_data.get('vote_average', 0.0)
+        average_rating=movie_data.get('vote_average', 0.0),
+        genres=genre_names(movie_data)
     )
 
 def search_movies(query):
@@ -0,0 +1,405 @@
+"""
+Trending Service: "Trending on AJTracker" popularity built from our own activity.
+
+Inserts into watch_history, read_history, watchlist, readinglist and Reviews feed
+exponentially decaying counters per item for two windows: 'hour' (one-hour
+half-life) and 'day' (one-day half-life). Reads and watches of a book or movie
+that belongs to an adaptation also count towards the adaptation. Inserts and new
+adaptation links are held in the session and applied only once they commit.
+
+The counters use forward decay. Every score is stored relative to a fixed
+landmark time, so decaying never changes the relative order of items. Each
+(kind, window) pair keeps its items in a sorted list, so top-k is a slice of the
+first k entries.
+
+A periodic checkpoint merges this process's increments into trending_counters
+and reloads the merged totals, so restarts and other workers see the same counts.
+The merge locks the rows it reads and retries if another process inserted one
+first, so concurrent checkpoints add up instead of overwriting each other.
+"""
+import math
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Tuple, Optional
+
+from flask import current_app
+from sqlalchemy import bindparam, event, delete, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, object_session
+
+from ..models import (db, WatchHistory, ReadHistory, Watchlist, ReadingList, Review,
+                      MovieAdaptation, TrendingCounter)
+
+WINDOWS = {'hour': 3600.0, 'day': 86400.0}
+KINDS = ('movie', 'book', 'adaptation')
+EVENT_WEIGHTS = {
+    'watch': 3.0,
+    'read': 3.0,
+    'review': 2.0,
+    'watchlist': 1.0,
+    'readinglist': 1.0
+}
+# Items whose decayed score falls below this are dropped at checkpoint time
+MIN_SCORE = 0.01
+# Rescale forward-decayed scores well before exp() can overflow
+MAX_EXPONENT = 200.0
+# Checkpoint attempts when another process inserts the same counter row first
+MERGE_ATTEMPTS = 3
+
+_SESSION_KEY = 'trending_pending_events'
+_ADAPTATIONS_KEY = 'trending_pending_adaptations'
+
+
+class DecayedTopK:
+    """Exponentially decaying counters kept in score order."""
+
+    def __init__(self, half_life: float, landmark: Optional[float] = None):
+        self.tau = half_life / math.log(2)
+        self.landmark = landmark if landmark is not None else time.time()
+        self._scores: Dict[int, float] = {}
+        self._order: List[Tuple[float, int]] = []
+
+    def __len__(self):
+        return len(self._scores)
+
+    def add(self, key: int, weight: float, now: float) -> float:
+        """Add weight at time now; returns the forward-decayed increment."""
+        if (now - self.landmark) / self.tau > MAX_EXPONENT:
+            self.rescale(now)
+        increment = weight * math.exp((now - self.landmark) / self.tau)
+        old = self._scores.get(key)
+        if old is not None:
+            del self._order[bisect_left(self._order, (-old, key))]
+        new = (old or 0.0) + increment
+        self._scores[key] = new
+        insort(self._order, (-new, key))
+        return increment
+
+    def add_forward(self, key: int, forward: float) -> None:
+        """Add an increment already expressed against this landmark."""
+        old = self._scores.get(key)
+        if old is not None:
+            del self._order[bisect_left(self._order, (-old, key))]
+        new = (old or 0.0) + forward
+        self._scores[key] = new
+        insort(self._order, (-new, key))
+
+    def score(self, key: int, now: float) -> float:
+        """Decayed score of one item at time now."""
+        return self._scores.get(key, 0.0) * math.exp(-(now - self.landmark) / self.tau)
+
+    def top(self, k: int, now: float) -> List[Tuple[int, float]]:
+        """The k highest-scoring items with their decayed scores, in O(k)."""
+        factor = math.exp(-(now - self.landmark) / self.tau)
+        return [(key, -neg * factor) for neg, key in self._order[:k]]
+
+    def items(self, now: float):
+        """All items with their decayed scores at time now."""
+        factor = math.exp(-(now - self.landmark) / self.tau)
+        return ((key, value * factor) for key, value in self._scores.items())
+
+    def rescale(self, now: float) -> None:
+        """Move the landmark to now; order is unchanged, so only values are scaled."""
+        factor = math.exp(-(now - self.landmark) / self.tau)
+        self._scores = {key: value * factor for key, value in self._scores.items()}
+        self._order = [(neg * factor, key) for neg, key in self._order]
+        self.landmark = now
+
+
+class TrendingService:
+    """
+    Singleton pattern implementation for trending counters
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super(TrendingService, cls).__new__(cls)
+                    cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        """Create empty counters; they are filled from the checkpoint table on first use."""
+        now = time.time()
+        self._counters = {(kind, window): DecayedTopK(half_life, now)
+                          for kind in KINDS for window, half_life in WINDOWS.items()}
+        self._delta: Dict[Tuple[str, str], Dict[int, float]] = defaultdict(lambda: defaultdict(float))
+        self._movie_adaptations: Dict[int, List[int]] = defaultdict(list)
+        self._book_adaptations: Dict[int, List[int]] = defaultdict(list)
+        self._loaded = False
+        self._write_lock = threading.Lock()
+
+    def record(self, kind: str, item_id: int, weight: float, now: Optional[float] = None) -> None:
+        """Count one interaction with an item in every window."""
+        now = now if now is not None else time.time()
+        with self._write_lock:
+            for window in WINDOWS:
+                counter = self._counters[(kind, window)]
+                landmark = counter.landmark
+                forward = counter.add(item_id, weight, now)
+                delta = self._delta[(kind, window)]
+                if counter.landmark != landmark:
+                    # The counter rescaled; unsaved increments must follow its new landmark
+                    factor = math.exp(-(counter.landmark - landmark) / counter.tau)
+                    for key in delta:
+                        delta[key] *= factor
+                delta[item_id] += forward
+
+    def record_event(self, event_type: str, movie_id: Optional[int] = None,
+                     book_id: Optional[int] = None, adaptation_id: Optional[int] = None) -> None:
+        """Count an activity event against its movie/book and any linked adaptations."""
+        weight = EVENT_WEIGHTS[event_type]
+        adaptations = set()
+        if movie_id is not None:
+            self.record('movie', movie_id, weight)
+            adaptations.update(self._movie_adaptations.get(movie_id, ()))
+        if book_id is not None:
+            self.record('book', book_id, weight)
+            adaptations.update(self._book_adaptations.get(book_id, ()))
+        if adaptation_id is not None:
+            adaptations.add(adaptation_id)
+        for adaptation in adaptations:
+            self.record('adaptation', adaptation, weight)
+
+    def add_adaptation(self, adaptation_id: int, movie_id: Optional[int], book_id: Optional[int]) -> None:
+        """Link a movie/book to an adaptation so their activity counts towards it."""
+        if movie_id is not None:
+            self._movie_adaptations[movie_id].append(adaptation_id)
+        if book_id is not None:
+            self._book_adaptations[book_id].append(adaptation_id)
+
+    def top(self, kind: str, window: str = 'day', limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Get the most popular items of a kind for a window.
+
+        Args:
+            kind: 'movie', 'book' or 'adaptation'
+            window: 'hour' or 'day'
+            limit: Number of items to return
+
+        Returns:
+            List of {'kind', 'id', 'score'} dicts, most popular first
+        """
+        if kind not in KINDS or window not in WINDOWS:
+            raise ValueError(f"Unknown trending kind/window: {kind}/{window}")
+        self._ensure_loaded()
+        return [{'kind': kind, 'id': item_id, 'score': round(score, 4)}
+                for item_id, score in self._counters[(kind, window)].top(limit, time.time())]
+
+    def checkpoint(self) -> int:
+        """
+        Merge this process's increments into trending_counters and reload the totals.
+
+        Returns:
+            Number of counter rows written
+        """
+        self._ensure_loaded()
+        with self._write_lock:
+            delta, self._delta = self._delta, defaultdict(lambda: defaultdict(float))
+            landmarks = {key: counter.landmark for key, counter in self._counters.items()}
+
+        now = time.time()
+        try:
+            written = self._merge_into_table(delta, landmarks, now)
+        except Exception:
+            self._restore_delta(delta, landmarks)
+            raise
+
+        self._reload(now)
+        return written
+
+    def _restore_delta(self, delta: Dict[Tuple[str, str], Dict[int, float]],
+                       landmarks: Dict[Tuple[str, str], float]) -> None:
+        """Put increments from a failed checkpoint back for the next one."""
+        with self._write_lock:
+            for key, increments in delta.items():
+                counter = self._counters[key]
+                factor = math.exp(-(counter.landmark - landmarks[key]) / counter.tau)
+                for item_id, forward in increments.items():
+                    self._delta[key][item_id] += forward * factor
+
+    @staticmethod
+    def _merge_into_table(delta: Dict[Tuple[str, str], Dict[int, float]],
+                          landmarks: Dict[Tuple[str, str], float], now: float) -> int:
+        """Merge increments into the stored rows, retrying when another process inserted one first."""
+        for attempt in range(1, MERGE_ATTEMPTS + 1):
+            try:
+                return TrendingService._merge_once(delta, landmarks, now)
+            except IntegrityError:
+                db.session.rollback()
+                if attempt == MERGE_ATTEMPTS:
+                    raise
+        return 0
+
+    @staticmethod
+    def _merge_once(delta: Dict[Tuple[str, str], Dict[int, float]],
+                    landmarks: Dict[Tuple[str, str], float], now: float) -> int:
+        """One transaction: lock the stored rows, add the decayed increments to them, insert the rest."""
+        now_dt = datetime.fromtimestamp(now, timezone.utc).replace(tzinfo=None)
+        table = TrendingCounter.__table__
+        written = 0
+        for (kind, window), increments in delta.items():
+            if not increments:
+                continue
+            tau = WINDOWS[window] / math.log(2)
+            stored = {
+                item_id: (score, updated_at)
+                for item_id, score, updated_at in db.session.execute(
+                    db.select(table.c.ItemId, table.c.Score, table.c.UpdatedAt)
+                    .where(table.c.Kind == kind, table.c.Window == window,
+                           table.c.ItemId.in_(list(increments)))
+                    .with_for_update()
+                ).all()
+            }
+            updates, inserts = [], []
+            local_factor = math.exp(-(now - landmarks[(kind, window)]) / tau)
+            for item_id, forward in increments.items():
+                merged = forward * local_factor
+                if item_id in stored:
+                    score, updated_at = stored[item_id]
+                    merged += score * math.exp(-(now - _epoch(updated_at)) / tau)
+                    updates.append({'b_item': item_id, 'b_score': merged})
+                else:
+                    inserts.append({'Kind': kind, 'ItemId': item_id, 'Window': window,
+                                    'Score': merged, 'UpdatedAt': now_dt})
+            if updates:
+                db.session.execute(
+                    table.update()
+                    .where(table.c.Kind == kind, table.c.Window == window,
+                           table.c.ItemId == bindparam('b_item'))
+                    .values(Score=bindparam('b_score'), UpdatedAt=now_dt),
+                    updates
+                )
+            if inserts:
+                db.session.execute(insert(table), inserts)
+            written += len(increments)
+        db.session.commit()
+        return written
+
+    def _ensure_loaded(self) -> None:
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._reload(time.time())
+
+    def _reload(self, now: float) -> None:
+        """Rebuild in-memory counters from the checkpoint table plus unsaved increments."""
+        counters = {(kind, window): DecayedTopK(half_life, now)
+                    for kind in KINDS for window, half_life in WINDOWS.items()}
+        expired: List[Dict[str, Any]] = []
+        for kind, item_id, window, score, updated_at in db.session.execute(
+            db.select(TrendingCounter.Kind, TrendingCounter.ItemId, TrendingCounter.Window,
+                      TrendingCounter.Score, TrendingCounter.UpdatedAt)
+        ).all():
+            if (kind, window) not in counters:
+                continue
+            decayed = score * math.exp(-(now - _epoch(updated_at)) / counters[(kind, window)].tau)
+            if decayed < MIN_SCORE:
+                expired.append({'b_kind': kind, 'b_item': item_id, 'b_window': window,
+                                'b_updated': updated_at})
+                continue
+            counters[(kind, window)].add_forward(item_id, decayed)
+
+        movie_adaptations, book_adaptations = defaultdict(list), defaultdict(list)
+        for adaptation_id, movie_id, book_id in db.session.execute(
+            db.select(MovieAdaptation.MovieAdaptationId, MovieAdaptation.movieID, MovieAdaptation.BookId)
+        ).all():
+            if movie_id is not None:
+                movie_adaptations[movie_id].append(adaptation_id)
+            if book_id is not None:
+                book_adaptations[book_id].append(adaptation_id)
+
+        if expired:
+            # Only rows nobody merged into since they were read; a newer UpdatedAt means fresh counts
+            table = TrendingCounter.__table__
+            db.session.execute(delete(table).where(
+                table.c.Kind == bindparam('b_kind'), table.c.ItemId == bindparam('b_item'),
+                table.c.Window == bindparam('b_window'), table.c.UpdatedAt == bindparam('b_updated')
+            ), expired)
+            db.session.commit()
+
+        with self._write_lock:
+            # Increments recorded while the checkpoint ran are not in the table yet
+            for key, increments in self._delta.items():
+                old_landmark = self._counters[key].landmark
+                factor = math.exp(-(now - old_landmark) / counters[key].tau)
+                for item_id, forward in increments.items():
+                    counters[key].add_forward(item_id, forward * factor)
+                    increments[item_id] = forward * factor
+            self._counters = counters
+            self._movie_adaptations = movie_adaptations
+            self._book_adaptations = book_adaptations
+            self._loaded = True
+
+
+def _epoch(value: datetime) -> float:
+    """Seconds since the epoch for a naive-UTC or aware datetime."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _events_for(target) -> List[Dict[str, Any]]:
+    """Translate an inserted row into trending events."""
+    if isinstance(target, WatchHistory):
+        return [{'event_type': 'watch', 'movie_id': target.movieID}]
+    if isinstance(target, ReadHistory):
+        return [{'event_type': 'read', 'book_id': target.bookID}]
+    if isinstance(target, Watchlist):
+        return [{'event_type': 'watchlist', 'movie_id': target.movieID}]
+    if isinstance(target, ReadingList):
+        return [{'event_type': 'readinglist', 'book_id': target.bookID}]
+    if isinstance(target, Review):
+        return [{'event_type': 'review', 'movie_id': target.movieID,
+                 'book_id': target.BookId, 'adaptation_id': target.MovieAdaptationId}]
+    return []
+
+
+def _on_insert(mapper, connection, target) -> None:
+    """Mapper hook: hold events until the transaction commits."""
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_SESSION_KEY, []).extend(_events_for(target))
+
+
+def _on_adaptation_insert(mapper, connection, target) -> None:
+    """Mapper hook: hold the adaptation link until the transaction commits."""
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_ADAPTATIONS_KEY, []).append(
+            (target.MovieAdaptationId, target.movieID, target.BookId))
+
+
+for _model in (WatchHistory, ReadHistory, Watchlist, ReadingList, Review):
+    event.listen(_model, 'after_insert', _on_insert)
+event.listen(MovieAdaptation, 'after_insert', _on_adaptation_insert)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_pending_events(session: Session) -> None:
+    """Feed committed inserts into the counters."""
+    adaptations = session.info.pop(_ADAPTATIONS_KEY, None)
+    pending = session.info.pop(_SESSION_KEY, None)
+    if not adaptations and not pending:
+        return
+    service = TrendingService()
+    # Links first, so activity committed alongside a new adaptation counts towards it
+    for adaptation_id, movie_id, book_id in adaptations or ():
+        service.add_adaptation(adaptation_id, movie_id, book_id)
+    for item in pending or ():
+        try:
+            service.record_event(**item)
+        except Exception as e:
+            current_app.logger.error(f"Error recording trending event: {str(e)}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending_events(session: Session) -> None:
+    session.info.pop(_SESSION_KEY, None)
+    session.info.pop(_ADAPTATIONS_KEY, None)
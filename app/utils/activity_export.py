@@ -0,0 +1,265 @@
+"""
+Activity Export: Streams activity tables to partitioned Parquet or Arrow IPC files.
+
+Each table is read in primary-key order through a server-side cursor, one chunk
+at a time. Every chunk becomes an Arrow table, with user/movie/book id columns
+dictionary-encoded, and is split by event date into hive partitions
+(event_date=YYYY-MM-DD). Each partition is appended to an open Parquet file or
+Arrow IPC stream, and at most MAX_OPEN_FILES partitions stay open. Memory stays
+at about one chunk whatever the table size.
+
+Exports are incremental: the highest exported primary key per table is recorded
+in _watermarks.json in the output directory. The next run only reads rows above
+it and writes new files next to the old ones. Updates and deletes of
+already-exported rows are not captured; use full=True to re-export from scratch.
+
+Keys are assigned at insert, not at commit, so a row below the watermark can
+become visible after a run has passed it. Each run records the key ranges it
+skipped as gaps next to the watermark. Later runs re-read those ranges until a
+run starts LATE_COMMIT_SECONDS after the gap was first seen. Only gap keys are
+re-read, so nothing is exported twice.
+"""
+import json
+import os
+import shutil
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+
+from ..models import db, WatchHistory, ReadHistory, Review, Watchlist, ReadingList
+
+DEFAULT_CHUNK_SIZE = 100000
+MAX_OPEN_FILES = 32
+WATERMARK_FILE = '_watermarks.json'
+# How long skipped key ranges are re-read for rows that commit late, and how many are kept per table
+LATE_COMMIT_SECONDS = 3600
+MAX_GAP_RANGES = 1000
+FORMATS = ('parquet', 'arrow')
+
+# Export name -> (model, primary key attribute, timestamp attribute, exported attributes)
+TABLES = {
+    'watch_history': (WatchHistory, 'id', 'watched_date', ('id', 'userID', 'movieID', 'watched_date')),
+    'read_history': (ReadHistory, 'id', 'read_date', ('id', 'userID', 'bookID', 'read_date')),
+    'reviews': (Review, 'ReviewId', 'CreatedAt',
+                ('ReviewId', 'UserId', 'movieID', 'BookId', 'MovieAdaptationId', 'Rating', 'CreatedAt')),
+    'watchlist': (Watchlist, 'id', 'added_date', ('id', 'userID', 'movieID', 'added_date')),
+    'readinglist': (ReadingList, 'id', 'added_date', ('id', 'userID', 'bookID', 'added_date')),
+}
+
+# Foreign-key id columns repeat heavily, so they are stored dictionary-encoded
+_DICTIONARY_COLUMNS = {'userID', 'UserId', 'movieID', 'bookID', 'BookId', 'MovieAdaptationId'}
+
+
+def load_export_state(output_dir: str) -> Dict[str, Dict[str, Any]]:
+    """Per table, the highest exported primary key and the [low, high, first_seen] gaps below it."""
+    path = os.path.join(output_dir, WATERMARK_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        state = json.load(f)
+    # Files written before gaps were tracked hold a bare watermark per table
+    return {name: value if isinstance(value, dict) else {'watermark': value, 'gaps': []}
+            for name, value in state.items()}
+
+
+def load_watermarks(output_dir: str) -> Dict[str, int]:
+    """Highest exported primary key per table, empty when nothing was exported yet."""
+    return {name: entry['watermark'] for name, entry in load_export_state(output_dir).items()}
+
+
+def save_export_state(output_dir: str, state: Dict[str, Dict[str, Any]]) -> None:
+    """Atomically replace the watermark file."""
+    path = os.path.join(output_dir, WATERMARK_FILE)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def _remaining_gaps(gaps: List[List[Any]], found: List[int]) -> List[List[Any]]:
+    """Split gaps around the keys found in them; each piece keeps its gap's first_seen."""
+    found = sorted(found)
+    remaining = []
+    for low, high, first_seen in gaps:
+        expected = low
+        for key in found:
+            if key < low or key > high:
+                continue
+            if key > expected:
+                remaining.append([expected, key - 1, first_seen])
+            expected = key + 1
+        if expected <= high:
+            remaining.append([expected, high, first_seen])
+    return remaining
+
+
+def _schema(pa, columns, timestamp_attr: str):
+    fields = []
+    for name in columns:
+        if name in _DICTIONARY_COLUMNS:
+            fields.append(pa.field(name, pa.dictionary(pa.int32(), pa.int64())))
+        elif name == timestamp_attr:
+            fields.append(pa.field(name, pa.timestamp('us')))
+        elif name == 'Rating':
+            fields.append(pa.field(name, pa.float64()))
+        else:
+            fields.append(pa.field(name, pa.int64()))
+    return pa.schema(fields)
+
+
+class _PartitionWriter:
+    """Hive-partitioned file writer keeping at most MAX_OPEN_FILES partitions open."""
+
+    def __init__(self, base_dir: str, schema, fmt: str):
+        import pyarrow as pa
+        self._pa = pa
+        self.base_dir = base_dir
+        self.schema = schema
+        self.fmt = fmt
+        self.run_id = uuid.uuid4().hex[:12]
+        self.files = 0
+        self._open: 'OrderedDict[Any, Any]' = OrderedDict()
+
+    def write(self, day, table) -> None:
+        writer = self._open.pop(day, None) or self._new_writer(day)
+        self._open[day] = writer
+        writer.write_table(table)
+        if len(self._open) > MAX_OPEN_FILES:
+            self._open.popitem(last=False)[1].close()
+
+    def close(self) -> None:
+        while self._open:
+            self._open.popitem(last=False)[1].close()
+
+    def _new_writer(self, day):
+        partition = f"event_date={day.isoformat() if day is not None else '__null__'}"
+        directory = os.path.join(self.base_dir, partition)
+        os.makedirs(directory, exist_ok=True)
+        self.files += 1
+        if self.fmt == 'parquet':
+            import pyarrow.parquet as pq
+            path = os.path.join(directory, f"part-{self.run_id}-{self.files}.parquet")
+            return pq.ParquetWriter(path, self.schema, compression='zstd', use_dictionary=True)
+        # The IPC stream format, unlike the file format, allows a new dictionary per batch
+        path = os.path.join(directory, f"part-{self.run_id}-{self.files}.arrows")
+        options = self._pa.ipc.IpcWriteOptions(compression='zstd')
+        return self._pa.ipc.new_stream(self._pa.OSFile(path, 'wb'), self.schema, options=options)
+
+
+def export_table(name: str, output_dir: str, since_id: int = 0, fmt: str = 'parquet',
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, gaps: Optional[List[List[Any]]] = None,
+                 now: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Stream one table's rows with primary key above since_id, or inside gaps, into output_dir/name.
+
+    Args:
+        gaps: [low, high, first_seen] key ranges below since_id skipped by earlier runs
+        now: Epoch seconds the run started, used to age the gaps
+
+    Returns:
+        Rows and files written, rows found late in gaps, the new watermark (since_id
+        when nothing was new) and the gaps to re-read next time
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    model, pk_attr, timestamp_attr, columns = TABLES[name]
+    schema = _schema(pa, columns, timestamp_attr)
+    pk_index, timestamp_index = columns.index(pk_attr), columns.index(timestamp_attr)
+    now = time.time() if now is None else now
+    gaps = gaps or []
+    stats = {'rows': 0, 'late_rows': 0, 'files': 0, 'watermark': since_id}
+
+    pk = getattr(model, pk_attr)
+    result = db.session.execute(
+        db.select(*(getattr(model, column) for column in columns))
+        .where(db.or_(pk > since_id, *(pk.between(low, high) for low, high, _ in gaps)))
+        .order_by(pk)
+        .execution_options(stream_results=True, yield_per=chunk_size)
+    )
+    late_keys: List[int] = []
+    new_gaps: List[List[Any]] = []
+    expected = since_id + 1
+    writer = _PartitionWriter(os.path.join(output_dir, name), schema, fmt)
+    try:
+        for rows in result.partitions():
+            arrays = []
+            for index, column in enumerate(columns):
+                values = [row[index] for row in rows]
+                field = schema.field(column)
+                if pa.types.is_dictionary(field.type):
+                    arrays.append(pa.array(values, type=pa.int64()).dictionary_encode().cast(field.type))
+                else:
+                    arrays.append(pa.array(values, type=field.type))
+            chunk = pa.Table.from_arrays(arrays, schema=schema)
+
+            # Rows arrive in key order, which roughly follows time, so a chunk spans few days
+            days = pc.cast(arrays[timestamp_index], pa.date32())
+            for day in pc.unique(days).to_pylist():
+                mask = pc.is_null(days) if day is None else pc.equal(days, pa.scalar(day, pa.date32()))
+                writer.write(day, chunk.filter(mask))
+
+            for row in rows:
+                key = row[pk_index]
+                if key <= since_id:
+                    late_keys.append(key)
+                    continue
+                if key > expected:
+                    new_gaps.append([expected, key - 1, now])
+                expected = key + 1
+
+            stats['rows'] += len(rows)
+            stats['watermark'] = max(stats['watermark'], rows[-1][pk_index])
+    finally:
+        writer.close()
+        result.close()
+    db.session.commit()
+    stats['files'] = writer.files
+    stats['late_rows'] = len(late_keys)
+    # A gap is read one last time by the first run that starts after it has aged out
+    kept = [gap for gap in _remaining_gaps(gaps, late_keys) if now - gap[2] < LATE_COMMIT_SECONDS]
+    stats['gaps'] = (kept + new_gaps)[-MAX_GAP_RANGES:]
+    return stats
+
+
+def export_activity(output_dir: str, tables: Optional[List[str]] = None, fmt: str = 'parquet',
+                    full: bool = False, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Dict[str, Any]:
+    """
+    Export activity tables incrementally, advancing each table's watermark once it is written.
+
+    Must be called inside an application context.
+
+    Returns:
+        Per-table rows and watermarks, plus total rows, wall time and throughput
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    tables = tables or list(TABLES)
+    unknown = [name for name in tables if name not in TABLES]
+    if unknown:
+        raise ValueError(f"Unknown activity tables: {', '.join(unknown)}")
+
+    os.makedirs(output_dir, exist_ok=True)
+    state = load_export_state(output_dir)
+    started = time.perf_counter()
+    now = time.time()
+    report: Dict[str, Any] = {'tables': {}}
+    for name in tables:
+        if full:
+            shutil.rmtree(os.path.join(output_dir, name), ignore_errors=True)
+            state.pop(name, None)
+        entry = state.get(name, {'watermark': 0, 'gaps': []})
+        stats = export_table(name, output_dir, entry['watermark'], fmt, chunk_size, entry['gaps'], now)
+        state[name] = {'watermark': stats['watermark'], 'gaps': stats.pop('gaps')}
+        save_export_state(output_dir, state)
+        report['tables'][name] = stats
+
+    wall_time = time.perf_counter() - started
+    total = sum(stats['rows'] for stats in report['tables'].values())
+    report.update({
+        'rows': total,
+        'wall_time_seconds': round(wall_time, 3),
+        'rows_per_second': round(total / wall_time, 2) if wall_time > 0 else 0.0
+    })
+    return report
@@ -1,20 +1,156 @@
 """
 API Monitor: Tracks and analyzes API performance metrics.
+
+Requests, errors and latencies go into fixed-size rings of time buckets: 60
+one-second buckets for the last minute and 60 one-minute buckets for the last
+hour. A bucket is identified by its epoch (time // width), so recording reuses a
+slot by resetting it when its epoch is stale. That makes every update O(1), and
+every read sums at most one ring, however much traffic there was.
+
+Latencies are kept in per-minute log-linear histograms (HDR-style): exact below
+64 microseconds and within about 3% above that, up to an hour. Histograms merge
+by adding counts, so percentiles over any number of minutes are one merge away.
+
+State is split into stripes, each with its own lock and rings, and a thread
+always records into the same stripe. Concurrent requests rarely contend on the
+hot path. Reads merge the stripes.
 """
-from datetime import datetime, timedelta
-from collections import deque
-from threading import Lock
-from typing import Dict, Any, Deque
+from datetime import datetime
+from threading import Lock, get_native_id
+from typing import Dict, Any, Iterable, List, Optional
 from functools import wraps
 from flask import request, current_app
 import time
 
+STRIPES = 8
+SECOND_BUCKETS = 60
+MINUTE_BUCKETS = 60
+LATENCY_WINDOW_MINUTES = 5
+
+# Histogram layout: values below 2 * SUB_BUCKETS are exact, each power of two above
+# that is split into SUB_BUCKETS buckets
+SUB_BUCKET_BITS = 5
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+MAX_LATENCY_MICROSECONDS = 3600 * 1000000
+
+
+def _bucket_index(value: int) -> int:
+    if value < 2 * SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - 1 - SUB_BUCKET_BITS
+    return 2 * SUB_BUCKETS + (shift - 1) * SUB_BUCKETS + (value >> shift) - SUB_BUCKETS
+
+
+def _bucket_value(index: int) -> float:
+    """Midpoint of the values that fall into a bucket."""
+    if index < 2 * SUB_BUCKETS:
+        return float(index)
+    shift = (index - 2 * SUB_BUCKETS) // SUB_BUCKETS + 1
+    top = (index - 2 * SUB_BUCKETS) % SUB_BUCKETS + SUB_BUCKETS
+    return ((top << shift) + ((top + 1) << shift) - 1) / 2.0
+
+
+class LatencyHistogram:
+    """Mergeable log-linear histogram of latencies, recorded in seconds."""
+
+    __slots__ = ('counts', 'count', 'total')
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds: float) -> None:
+        microseconds = min(max(int(seconds * 1000000), 0), MAX_LATENCY_MICROSECONDS)
+        index = _bucket_index(microseconds)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+
+    def merge(self, other: 'LatencyHistogram') -> 'LatencyHistogram':
+        """Add another histogram's counts to this one."""
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        return self
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentiles(self, quantiles: Iterable[float]) -> List[float]:
+        """Latencies in seconds at each quantile (0-100), from one pass over the buckets."""
+        targets = sorted((q, position) for position, q in enumerate(quantiles))
+        results = [0.0] * len(targets)
+        if not self.count:
+            return results
+        seen, pending = 0, iter(targets)
+        quantile, position = next(pending)
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            while seen >= quantile / 100.0 * self.count:
+                results[position] = _bucket_value(index) / 1000000
+                try:
+                    quantile, position = next(pending)
+                except StopIteration:
+                    return results
+        return results
+
+
+class _Bucket:
+    """Counts for one slot of a ring; epoch is the time slot it currently holds."""
+
+    __slots__ = ('epoch', 'requests', 'errors', 'latency')
+
+    def __init__(self, with_latency: bool):
+        self.epoch = -1
+        self.requests = 0
+        self.errors = 0
+        self.latency = LatencyHistogram() if with_latency else None
+
+
+class _BucketRing:
+    """Fixed number of buckets of a fixed width in seconds, reused as time moves on."""
+
+    def __init__(self, size: int, width: int, with_latency: bool = False):
+        self.size = size
+        self.width = width
+        self.buckets = [_Bucket(with_latency) for _ in range(size)]
+
+    def record(self, now: float, elapsed: float, error: bool) -> None:
+        epoch = int(now // self.width)
+        bucket = self.buckets[epoch % self.size]
+        if bucket.epoch != epoch:
+            bucket.epoch = epoch
+            bucket.requests = 0
+            bucket.errors = 0
+            if bucket.latency is not None:
+                bucket.latency = LatencyHistogram()
+        bucket.requests += 1
+        if error:
+            bucket.errors += 1
+        if bucket.latency is not None:
+            bucket.latency.record(elapsed)
+
+    def recent(self, now: float, count: int) -> List[_Bucket]:
+        """The buckets of the last count slots, the current one included."""
+        current = int(now // self.width)
+        return [bucket for bucket in self.buckets if current - count < bucket.epoch <= current]
+
+
+class _Stripe:
+    def __init__(self):
+        self.lock = Lock()
+        self.seconds = _BucketRing(SECOND_BUCKETS, 1)
+        self.minutes = _BucketRing(MINUTE_BUCKETS, 60, with_latency=True)
+
+
 class APIMonitor:
     """Singleton class for monitoring API performance metrics."""
-    
+
     _instance = None
     _lock = Lock()
-    
+
     def __new__(cls):
         if cls._instance is None:
             with cls._lock:
@@ -22,13 +158,11 @@ class APIMonitor:
                     cls._instance = super(APIMonitor, cls).__new__(cls)
                     cls._instance._initialize()
         return cls._instance
-    
+
     def _initialize(self):
-        """Initialize monitoring data structures."""
-        self._response_times: Deque[float] = deque(maxlen=1000)  # Last 1000 response times
-        self._requests: Deque[datetime] = deque(maxlen=1000)     # Last 1000 request timestamps
-        self._errors: Deque[datetime] = deque(maxlen=1000)       # Last 1000 error timestamps
-    
+        """Initialize the striped bucket rings."""
+        self._stripes = [_Stripe() for _ in range(STRIPES)]
+
     @classmethod
     def track_request(cls, func):
         """Decorator to track API request metrics."""
@@ -36,78 +170,78 @@ class APIMonitor:
         def wrapper(*args, **kwargs):
             instance = cls()
             start_time = time.time()
-            
+
             try:
                 result = func(*args, **kwargs)
-                end_time = time.time()
-                
-                # Record response time
-                instance._response_times.append(end_time - start_time)
-                
-                # Record request timestamp
-                instance._requests.append(datetime.utcnow())
-                
+                instance.record(time.time() - start_time)
                 return result
-                
+
             except Exception as e:
-                # Record error
-                instance._errors.append(datetime.utcnow())
+                instance.record(time.time() - start_time, error=True)
                 current_app.logger.error(f"API Error in {func.__name__}: {str(e)}")
                 raise
-                
+
         return wrapper
-    
+
+    def record(self, elapsed: float, error: bool = False, now: Optional[float] = None) -> None:
+        """Record one request's response time in seconds; O(1) under this thread's stripe lock."""
+        now = time.time() if now is None else now
+        stripe = self._stripes[get_native_id() % STRIPES]
+        with stripe.lock:
+            stripe.seconds.record(now, elapsed, error)
+            stripe.minutes.record(now, elapsed, error)
+
+    def _recent(self, ring: str, count: int, now: Optional[float]) -> List[_Bucket]:
+        now = time.time() if now is None else now
+        buckets = []
+        for stripe in self._stripes:
+            with stripe.lock:
+                buckets.extend(getattr(stripe, ring).recent(now, count))
+        return buckets
+
+    def _latency(self, minutes: int, now: Optional[float]) -> LatencyHistogram:
+        merged = LatencyHistogram()
+        now = time.time() if now is None else now
+        for stripe in self._stripes:
+            with stripe.lock:
+                for bucket in stripe.minutes.recent(now, minutes):
+                    merged.merge(bucket.latency)
+        return merged
+
     @classmethod
-    def get_average_response_time(cls) -> float:
-        """Get average response time over the last 1000 requests."""
-        instance = cls()
-        if not instance._response_times:
-            return 0.0
-        return sum(instance._response_times) / len(instance._response_times)
-    
+    def get_average_response_time(cls, minutes: int = LATENCY_WINDOW_MINUTES, now: Optional[float] = None) -> float:
+        """Get average response time over the last few minutes."""
+        return cls()._latency(minutes, now).mean()
+
     @classmethod
-    def get_requests_per_minute(cls) -> float:
-        """Calculate requests per minute based on recent requests."""
-        instance = cls()
-        if not instance._requests:
-            return 0.0
-            
-        now = datetime.utcnow()
-        minute_ago = now - timedelta(minutes=1)
-        
-        # Count requests in the last minute
-        recent_requests = sum(1 for req_time in instance._requests 
-                            if req_time >= minute_ago)
-        
-        return recent_requests
-    
+    def get_latency_percentiles(cls, minutes: int = LATENCY_WINDOW_MINUTES,
+                                now: Optional[float] = None) -> Dict[str, float]:
+        """Get p50/p95/p99 response times in seconds over the last few minutes."""
+        p50, p95, p99 = cls()._latency(minutes, now).percentiles((50, 95, 99))
+        return {'p50': p50, 'p95': p95, 'p99': p99}
+
     @classmethod
-    def get_error_rate(cls) -> float:
-        """Calculate error rate as percentage of total requests."""
-        instance = cls()
-        if not instance._requests:
-            return 0.0
-            
-        now = datetime.utcnow()
-        hour_ago = now - timedelta(hours=1)
-        
-        # Count errors and requests in the last hour
-        recent_errors = sum(1 for err_time in instance._errors 
-                          if err_time >= hour_ago)
-        recent_requests = sum(1 for req_time in instance._requests 
-                            if req_time >= hour_ago)
-        
+    def get_requests_per_minute(cls, now: Optional[float] = None) -> float:
+        """Count requests in the last minute, to the second."""
+        return sum(bucket.requests for bucket in cls()._recent('seconds', SECOND_BUCKETS, now))
+
+    @classmethod
+    def get_error_rate(cls, now: Optional[float] = None) -> float:
+        """Calculate error rate as percentage of requests in the last hour."""
+        buckets = cls()._recent('minutes', MINUTE_BUCKETS, now)
+        recent_requests = sum(bucket.requests for bucket in buckets)
         if recent_requests == 0:
             return 0.0
-            
-        return (recent_errors / recent_requests) * 100
-    
+        return (sum(bucket.errors for bucket in buckets) / recent_requests) * 100
+
     @classmethod
     def get_all_metrics(cls) -> Dict[str, Any]:
         """Get all API metrics in a single call."""
+        now = time.time()
         return {
-            'average_response_time': cls.get_average_response_time(),
-            'requests_per_minute': cls.get_requests_per_minute(),
-            'error_rate': cls.get_error_rate(),
+            'average_response_time': cls.get_average_response_time(now=now),
+            'latency_percentiles': cls.get_latency_percentiles(now=now),
+            'requests_per_minute': cls.get_requests_per_minute(now=now),
+            'error_rate': cls.get_error_rate(now=now),
             'timestamp': datetime.utcnow()
         }
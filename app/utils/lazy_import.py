@@ -0,0 +1,83 @@
+"""
+Lazy Import: Defers heavy optional dependencies (numpy, pyarrow, ...) until first use.
+
+    np = lazy_import('numpy')
+
+binds a module stand-in. The real import happens on the first attribute access,
+e.g. np.zeros, so create_app(), the CLI and tests only pay for numpy when a code
+path actually needs it. Worker processes forked before that point don't carry it
+either.
+
+import_timings() runs a statement in a fresh interpreter with -X importtime and
+returns per-module import costs, for the CLI startup report.
+"""
+import importlib
+import os
+import subprocess
+import sys
+import types
+from typing import Dict, Any, List, Optional
+
+
+class LazyModule(types.ModuleType):
+    """Module stand-in that imports the real module on first attribute access."""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__['_lazy_target'] = None
+
+    def _load(self) -> types.ModuleType:
+        module = self.__dict__['_lazy_target']
+        if module is None:
+            module = importlib.import_module(self.__name__)
+            self.__dict__['_lazy_target'] = module
+        return module
+
+    def __getattr__(self, attr: str) -> Any:
+        # Only called for attributes not found normally; cache them for the next lookup
+        value = getattr(self._load(), attr)
+        self.__dict__[attr] = value
+        return value
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def lazy_import(name: str) -> types.ModuleType:
+    """The module itself if it is already imported, otherwise a LazyModule for it."""
+    module = sys.modules.get(name)
+    return module if module is not None else LazyModule(name)
+
+
+def is_loaded(name: str) -> bool:
+    """Whether a module has really been imported in this process."""
+    return name in sys.modules
+
+
+def import_timings(statement: str, cwd: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Import cost of running statement in a fresh interpreter.
+
+    Returns:
+        Dict with 'modules' (name, depth, self_us, cumulative_us in import order) and
+        'total_us' (sum of top-level cumulative times)
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', statement],
+        capture_output=True, text=True, cwd=cwd or os.getcwd()
+    )
+    modules: List[Dict[str, Any]] = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        modules.append({'name': name.strip(), 'depth': depth,
+                        'self_us': int(self_us), 'cumulative_us': int(cumulative_us)})
+    if result.returncode != 0:
+        errors = [line for line in result.stderr.splitlines() if not line.startswith('import time:')]
+        raise RuntimeError(f"Startup statement failed: {errors[-1] if errors else result.returncode}")
+    return {
+        'modules': modules,
+        'total_us': sum(m['cumulative_us'] for m in modules if m['depth'] == 0)
+    }
@@ -0,0 +1,404 @@
+"""
+Recommendation Benchmark: Offline speed and quality harness for recommendation engines.
+
+A synthetic catalogue is generated at a chosen scale. Movies belong to latent
+genres, each user prefers a couple of genres, and watches within a genre follow a
+Zipf popularity curve. Each user's most recent watches are held out. The rest is
+bulk-loaded into a dedicated benchmark database, and every registered engine is
+asked for top-k movies for a sample of users.
+
+Per engine the report holds p50/p95 latency, tracemalloc peak memory over setup
+and queries, and precision@k/recall@k against the held-out watches. Reports are
+saved as JSON with the git commit, so runs can be compared across commits with
+compare_results.
+"""
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Callable, Optional, Iterable
+
+from sqlalchemy import func
+
+from ..models import db, User, Movie, WatchHistory, Review
+from .lazy_import import lazy_import
+
+np = lazy_import('numpy')
+
+DEFAULT_GENRES = 12
+DEFAULT_HOLDOUT = 0.2
+MIN_HISTORY = 5
+HISTORY_DAYS = 180
+INSERT_CHUNK = 50000
+WORDS_PER_GENRE = 8
+ZIPF_EXPONENT = 1.3
+MAX_DRAW_ROUNDS = 10
+
+# Engine name -> setup(dataset) returning recommend(user_id, k) -> [movie ids]
+ENGINES: Dict[str, Callable[[Dict[str, Any]], Callable[[int, int], List[int]]]] = {}
+
+
+def register_engine(name: str):
+    """Decorator registering an engine setup function under a name."""
+    def decorator(setup):
+        ENGINES[name] = setup
+        return setup
+    return decorator
+
+
+def generate_dataset(interactions: int, users: Optional[int] = None, movies: Optional[int] = None,
+                     genres: int = DEFAULT_GENRES, holdout: float = DEFAULT_HOLDOUT,
+                     seed: int = 42) -> Dict[str, Any]:
+    """
+    Generate synthetic watches with a per-user held-out split.
+
+    Ids are 1-based so they can be written as primary keys unchanged.
+
+    Returns:
+        Dict of numpy arrays: watch_user, watch_movie, watch_time (epoch seconds),
+        train (bool mask), movie_genre, user_genres, plus the scale parameters
+    """
+    rng = np.random.default_rng(seed)
+    users = users or max(100, interactions // 50)
+    movies = movies or max(200, interactions // 100)
+    genres = min(genres, movies)
+
+    movie_genre = np.arange(movies) % genres
+    genre_sizes = np.bincount(movie_genre, minlength=genres)
+    user_genres = rng.integers(0, genres, size=(users, 2))
+
+    # Draw in rounds until enough distinct (user, movie) pairs survive deduplication
+    pairs = np.empty(0, dtype=np.int64)
+    for _ in range(MAX_DRAW_ROUNDS):
+        draws = 2 * (interactions - len(pairs)) + 100
+        watch_user = rng.integers(0, users, size=draws)
+        preferred = rng.random(draws) < 0.8
+        genre = np.where(preferred, user_genres[watch_user, rng.integers(0, 2, size=draws)],
+                         rng.integers(0, genres, size=draws))
+        rank = (rng.zipf(ZIPF_EXPONENT, size=draws) - 1) % genre_sizes[genre]
+        drawn = watch_user.astype(np.int64) * movies + genre + genres * rank
+        pairs = np.unique(np.concatenate((pairs, drawn)))
+        if len(pairs) >= interactions:
+            break
+    pairs = rng.permutation(pairs)[:interactions]
+    watch_user, watch_movie = pairs // movies, pairs % movies
+    watch_time = time.time() - rng.random(len(pairs)) * HISTORY_DAYS * 86400
+
+    # Hold out each user's most recent watches, for users with enough history
+    order = np.lexsort((watch_time, watch_user))
+    watch_user, watch_movie, watch_time = watch_user[order], watch_movie[order], watch_time[order]
+    counts = np.bincount(watch_user, minlength=users)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    position = np.arange(len(watch_user)) - starts[watch_user]
+    n_test = np.ceil(counts * holdout).astype(np.int64)
+    n_test[counts < MIN_HISTORY] = 0
+    train = position < counts[watch_user] - n_test[watch_user]
+
+    return {
+        'n_users': users,
+        'n_movies': movies,
+        'n_genres': genres,
+        'seed': seed,
+        'watch_user': watch_user + 1,
+        'watch_movie': watch_movie + 1,
+        'watch_time': watch_time,
+        'train': train,
+        'movie_genre': movie_genre,
+        'user_genres': user_genres
+    }
+
+
+def held_out(dataset: Dict[str, Any]) -> Dict[int, set]:
+    """User id -> set of held-out movie ids."""
+    test = ~dataset['train']
+    relevant: Dict[int, set] = {}
+    for user_id, movie_id in zip(dataset['watch_user'][test].tolist(), dataset['watch_movie'][test].tolist()):
+        relevant.setdefault(user_id, set()).add(movie_id)
+    return relevant
+
+
+def load_dataset(dataset: Dict[str, Any], review_fraction: float = 0.3) -> None:
+    """
+    Replace the benchmark database contents with the training split.
+
+    A fraction of training watches also get a review, rated high when the movie is
+    in one of the user's preferred genres.
+    """
+    db.drop_all()
+    db.create_all()
+    rng = np.random.default_rng(dataset['seed'] + 1)
+    genre_words = [[f"genre{g}word{w}" for w in range(WORDS_PER_GENRE)] for g in range(dataset['n_genres'])]
+
+    _insert(User.__table__, ({'UserId': u, 'Username': f'bench_user_{u}', 'Email': f'bench_user_{u}@example.com'}
+                             for u in range(1, dataset['n_users'] + 1)))
+    _insert(Movie.__table__, ({
+        'movieID': m,
+        'title': f'Benchmark Movie {m}',
+        'tmdb_id': m,
+        'overview': ' '.join(rng.choice(genre_words[dataset['movie_genre'][m - 1]], size=4)),
+        'average_rating': None
+    } for m in range(1, dataset['n_movies'] + 1)))
+
+    train = dataset['train']
+    users, movies = dataset['watch_user'][train], dataset['watch_movie'][train]
+    times = dataset['watch_time'][train]
+    _insert(WatchHistory.__table__, ({
+        'userID': int(u), 'movieID': int(m),
+        'watched_date': datetime.fromtimestamp(t, timezone.utc).replace(tzinfo=None)
+    } for u, m, t in zip(users, movies, times)))
+
+    reviewed = rng.random(len(users)) < review_fraction
+    liked = (dataset['user_genres'][users - 1] == dataset['movie_genre'][movies - 1][:, None]).any(axis=1)
+    ratings = np.where(liked, rng.integers(4, 6, size=len(users)), rng.integers(1, 4, size=len(users)))
+    _insert(Review.__table__, ({
+        'UserId': int(u), 'movieID': int(m), 'Rating': float(r), 'Comment': None,
+        'CreatedAt': datetime.fromtimestamp(t, timezone.utc).replace(tzinfo=None)
+    } for u, m, r, t in zip(users[reviewed], movies[reviewed], ratings[reviewed], times[reviewed])))
+
+
+def _insert(table, rows: Iterable[Dict[str, Any]]) -> None:
+    """Core executemany in chunks; bypasses ORM events so caches are not triggered."""
+    chunk: List[Dict[str, Any]] = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= INSERT_CHUNK:
+            db.session.execute(table.insert(), chunk)
+            chunk = []
+    if chunk:
+        db.session.execute(table.insert(), chunk)
+    db.session.commit()
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Linear-interpolated percentile (q in 0..100) of a list of values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def precision_recall_at_k(recommended: List[int], relevant: set, k: int) -> tuple:
+    """Precision@k and recall@k of one recommendation list."""
+    if k <= 0 or not relevant:
+        return 0.0, 0.0
+    hits = len(set(recommended[:k]) & relevant)
+    return hits / k, hits / len(relevant)
+
+
+@register_engine('service')
+def _service_engine(dataset: Dict[str, Any]):
+    """RecommendationService, called the way the recommendations route calls it."""
+    from ..services.recommendation_service import RecommendationService
+    service = RecommendationService()
+
+    def recommend(user_id: int, k: int) -> List[int]:
+        user = db.session.get(User, user_id)
+        return [r['movie_id'] for r in service.get_recommendations(user)[:k]]
+    return recommend
+
+
+@register_engine('popularity')
+def _popularity_engine(dataset: Dict[str, Any]):
+    """Most-watched movies the user has not seen; the baseline every engine should beat."""
+    ranked = [movie_id for movie_id, in db.session.execute(
+        db.select(WatchHistory.movieID).group_by(WatchHistory.movieID)
+        .order_by(func.count().desc(), WatchHistory.movieID)
+    )]
+
+    def recommend(user_id: int, k: int) -> List[int]:
+        seen = set(db.session.execute(
+            db.select(WatchHistory.movieID).where(WatchHistory.userID == user_id)
+        ).scalars())
+        picks = []
+        for movie_id in ranked:
+            if movie_id not in seen:
+                picks.append(movie_id)
+                if len(picks) == k:
+                    break
+        return picks
+    return recommend
+
+
+@register_engine('cross_media')
+def _cross_media_engine(dataset: Dict[str, Any]):
+    """Personalized PageRank over the co-engagement graph."""
+    from ..services.cross_media_service import CrossMediaService
+    service = CrossMediaService()
+    service.build_graph()
+
+    def recommend(user_id: int, k: int) -> List[int]:
+        return [m['movie_id'] for m in service.suggest(user_id, limit=k)['movies']]
+    return recommend
+
+
+@register_engine('similarity')
+def _similarity_engine(dataset: Dict[str, Any]):
+    """Text similarity of overviews, summed over the user's recent watches."""
+    from ..services.similarity_index import SimilarityIndex
+    index = SimilarityIndex()
+    index.rebuild(tempfile.mkdtemp(prefix='benchmark_similarity_'))
+
+    def recommend(user_id: int, k: int) -> List[int]:
+        recent = db.session.execute(
+            db.select(WatchHistory.movieID).where(WatchHistory.userID == user_id)
+            .order_by(WatchHistory.watched_date.desc()).limit(5)
+        ).scalars().all()
+        scores: Dict[int, float] = {}
+        for movie_id in recent:
+            for match in index.more_like_this('movie', movie_id, k=k * 2, kinds=['movie']):
+                scores[match['id']] = scores.get(match['id'], 0.0) + match['score']
+        seen = set(recent)
+        ranked = sorted((m for m in scores if m not in seen), key=lambda m: scores[m], reverse=True)
+        return ranked[:k]
+    return recommend
+
+
+def evaluate_engine(name: str, dataset: Dict[str, Any], relevant: Dict[int, set],
+                    sample: List[int], k: int) -> Dict[str, Any]:
+    """
+    Benchmark one engine.
+
+    Setup and the quality pass run under tracemalloc for peak memory; latency is
+    measured in a second, untraced pass over the same users.
+    """
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        recommend = ENGINES[name](dataset)
+        setup_seconds = time.perf_counter() - started
+
+        precision, recall, covered = [], [], 0
+        for user_id in sample:
+            picks = recommend(user_id, k)
+            db.session.remove()
+            covered += bool(picks)
+            p, r = precision_recall_at_k(picks, relevant[user_id], k)
+            precision.append(p)
+            recall.append(r)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    latencies = []
+    for user_id in sample:
+        started = time.perf_counter()
+        recommend(user_id, k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        db.session.remove()
+
+    n = len(sample)
+    return {
+        'users_evaluated': n,
+        'setup_seconds': round(setup_seconds, 3),
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50), 3),
+            'p95': round(percentile(latencies, 95), 3),
+            'mean': round(sum(latencies) / n, 3) if n else 0.0,
+            'max': round(max(latencies), 3) if n else 0.0
+        },
+        'peak_memory_mb': round(peak / (1024 * 1024), 3),
+        f'precision_at_{k}': round(sum(precision) / n, 5) if n else 0.0,
+        f'recall_at_{k}': round(sum(recall) / n, 5) if n else 0.0,
+        'coverage': round(covered / n, 5) if n else 0.0
+    }
+
+
+def run_benchmark(interactions: int = 10000, users: Optional[int] = None, movies: Optional[int] = None,
+                  engines: Optional[List[str]] = None, k: int = 10, sample_users: int = 200,
+                  seed: int = 42, output: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Generate, load and benchmark every requested engine.
+
+    Must be called inside an application context bound to the benchmark database;
+    its contents are dropped and replaced.
+
+    Returns:
+        The report, also written to output as JSON when a path is given
+    """
+    engines = engines or list(ENGINES)
+    unknown = [name for name in engines if name not in ENGINES]
+    if unknown:
+        raise ValueError(f"Unknown recommendation engines: {', '.join(unknown)}")
+
+    started = time.perf_counter()
+    dataset = generate_dataset(interactions, users, movies, seed=seed)
+    load_dataset(dataset)
+    load_seconds = time.perf_counter() - started
+
+    relevant = held_out(dataset)
+    rng = np.random.default_rng(seed + 2)
+    candidates = np.array(sorted(relevant), dtype=np.int64)
+    sample = sorted(rng.choice(candidates, size=min(sample_users, len(candidates)), replace=False).tolist()) \
+        if len(candidates) else []
+
+    report = {
+        'meta': {
+            'commit': _git_commit(),
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'k': k
+        },
+        'dataset': {
+            'interactions': int(len(dataset['watch_user'])),
+            'train_interactions': int(dataset['train'].sum()),
+            'users': dataset['n_users'],
+            'movies': dataset['n_movies'],
+            'genres': dataset['n_genres'],
+            'seed': seed,
+            'load_seconds': round(load_seconds, 3)
+        },
+        'engines': {name: evaluate_engine(name, dataset, relevant, sample, k) for name in engines}
+    }
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any]) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """
+    Compare two benchmark reports engine by engine.
+
+    Returns:
+        engine -> metric -> {'baseline', 'current', 'change_pct'} for engines in both reports
+    """
+    def flatten(metrics: Dict[str, Any]) -> Dict[str, float]:
+        flat = {}
+        for key, value in metrics.items():
+            if isinstance(value, dict):
+                flat.update({f'{key}.{sub}': v for sub, v in value.items()})
+            else:
+                flat[key] = value
+        return flat
+
+    comparison = {}
+    for name, metrics in current.get('engines', {}).items():
+        if name not in baseline.get('engines', {}):
+            continue
+        before, after = flatten(baseline['engines'][name]), flatten(metrics)
+        comparison[name] = {
+            key: {
+                'baseline': before[key],
+                'current': after[key],
+                'change_pct': round((after[key] - before[key]) / before[key] * 100, 2) if before[key] else 0.0
+            }
+            for key in after if key in before
+        }
+    return comparison
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except Exception:
+        return None
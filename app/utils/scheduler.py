@@ -1,17 +1,88 @@
 """
 Scheduler utility for automating tasks like database backups and performance monitoring.
+
+create_app() calls start_scheduler() in every server process. Jobs that flush a
+process's in-memory counters or refresh its in-memory indexes run everywhere; the
+rest run only in the process holding an exclusive lock on instance/scheduler.lock.
+The others retry the lock every LEADER_RETRY_SECONDS, so those jobs move to another
+process when the holder exits. With several hosts sharing a database, set
+SCHEDULER_ENABLED=true on only one of them, or run the jobs from cron with
+`python cli_tool.py run_job --job <id>`. The daily backup also needs BACKUP_ENABLED,
+and imports the Azure client only when it runs.
 """
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from contextlib import nullcontext
 from datetime import datetime
 import logging
-from .backup import run_daily_backup
+import os
+import threading
 from ..services.analytics_service import AnalyticsService
+from ..services.similarity_index import SimilarityIndex
+from ..services.cross_media_service import CrossMediaService
+from ..services.batch_recommendations import run_batch
+from ..services.trending_service import TrendingService
+from ..services.activity_sketches import ActivitySketches
+from ..services.notification_service import NotificationService
 from flask import current_app
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+LOCK_FILE_NAME = 'scheduler.lock'
+LEADER_RETRY_SECONDS = 60
+# Jobs that flush or refresh state held in each process's memory, so every process runs
+# them. The nightly similarity rebuild is shared: it writes the segment every process
+# remaps on its next lookup (see SimilarityIndex.RELOAD_CHECK_SECONDS).
+PROCESS_LOCAL_JOBS = ('trending_checkpoint', 'activity_sketch_flush',
+                      'similarity_index_refresh', 'cross_media_graph_rebuild')
+
+
+def _try_lock(handle) -> bool:
+    """Take an exclusive, non-blocking lock on an open file; False if another process holds it."""
+    try:
+        if os.name == 'nt':
+            import msvcrt
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+def start_scheduler(app) -> threading.Thread:
+    """
+    Start the scheduler, running the shared jobs only while this process holds the lock.
+
+    Jobs in PROCESS_LOCAL_JOBS persist this process's in-memory state and run in every
+    process. The others are paused until a daemon thread takes the scheduler lock; it
+    keeps the lock file open, and so the lock held, for the life of the process.
+    """
+    scheduler = TaskScheduler()
+    scheduler.init_app(app)
+    scheduler.start()
+    shared = [job.id for job in scheduler.scheduler.get_jobs() if job.id not in PROCESS_LOCAL_JOBS]
+    for job_id in shared:
+        scheduler.scheduler.pause_job(job_id)
+    path = os.path.join(app.instance_path, LOCK_FILE_NAME)
+
+    def elect():
+        handle = open(path, 'a+')
+        while not _try_lock(handle):
+            threading.Event().wait(LEADER_RETRY_SECONDS)
+        logger.info(f"Process {os.getpid()} holds the scheduler lock")
+        for job_id in shared:
+            scheduler.scheduler.resume_job(job_id)
+        # Never returns, so the handle and with it the lock live as long as the process
+        threading.Event().wait()
+
+    thread = threading.Thread(target=elect, name='scheduler-election', daemon=True)
+    thread.start()
+    return thread
+
+
 class TaskScheduler:
     _instance = None
     
@@ -19,6 +90,7 @@ class TaskScheduler:
         if cls._instance is None:
             cls._instance = super(TaskScheduler, cls).__new__(cls)
             cls._instance.scheduler = BackgroundScheduler()
+            cls._instance.app = None
             cls._instance.analytics_service = AnalyticsService()
             cls._instance._initialize_jobs()
         return cls._instance
@@ -27,7 +99,7 @@ class TaskScheduler:
         """Initialize all scheduled jobs."""
         # Schedule daily backup at 2 AM
         self.scheduler.add_job(
-            run_daily_backup,
+            self._run_daily_backup,
             trigger=CronTrigger(hour=2),
             id='daily_backup',
             name='Daily Database Backup',
@@ -51,6 +123,86 @@ class TaskScheduler:
             name='Weekly Analytics Report',
             replace_existing=True
         )
+        
+        # Schedule incremental similarity index refresh every 15 minutes
+        self.scheduler.add_job(
+            self._refresh_similarity_index,
+            trigger=CronTrigger(minute='*/15'),
+            id='similarity_index_refresh',
+            name='Similarity Index Refresh',
+            replace_existing=True
+        )
+        
+        # Schedule nightly similarity index rebuild at 3 AM
+        self.scheduler.add_job(
+            self._rebuild_similarity_index,
+            trigger=CronTrigger(hour=3),
+            id='similarity_index_rebuild',
+            name='Nightly Similarity Index Rebuild',
+            replace_existing=True
+        )
+    
+        # Schedule cross-media suggestion refresh for stale users every 5 minutes
+        self.scheduler.add_job(
+            self._refresh_cross_media,
+            trigger=CronTrigger(minute='*/5'),
+            id='cross_media_refresh',
+            name='Cross-Media Suggestion Refresh',
+            replace_existing=True
+        )
+        
+        # Schedule nightly cross-media graph rebuild at 3:30 AM
+        self.scheduler.add_job(
+            self._rebuild_cross_media_graph,
+            trigger=CronTrigger(hour=3, minute=30),
+            id='cross_media_graph_rebuild',
+            name='Nightly Cross-Media Graph Rebuild',
+            replace_existing=True
+        )
+    
+        # Schedule nightly recommendation precompute for all users at 1 AM
+        self.scheduler.add_job(
+            self._precompute_recommendations,
+            trigger=CronTrigger(hour=1),
+            id='recommendation_precompute',
+            name='Nightly Recommendation Precompute',
+            replace_existing=True
+        )
+    
+        # Schedule trending counter checkpoint every 5 minutes
+        self.scheduler.add_job(
+            self._checkpoint_trending,
+            trigger=CronTrigger(minute='*/5'),
+            id='trending_checkpoint',
+            name='Trending Counter Checkpoint',
+            replace_existing=True
+        )
+    
+        # Schedule distinct-user sketch flush every 5 minutes
+        self.scheduler.add_job(
+            self._flush_activity_sketches,
+            trigger=CronTrigger(minute='*/5'),
+            id='activity_sketch_flush',
+            name='Activity Sketch Flush',
+            replace_existing=True
+        )
+    
+        # Schedule nightly pruning of expired notifications at 4 AM
+        self.scheduler.add_job(
+            self._prune_notifications,
+            trigger=CronTrigger(hour=4),
+            id='notification_prune',
+            name='Nightly Notification Pruning',
+            replace_existing=True
+        )
+    
+    def init_app(self, app):
+        """Bind the scheduler to an application so jobs can use the database."""
+        self.app = app
+    
+    def _app_context(self):
+        """Application context for job execution, if an application is bound."""
+        return self.app.app_context() if self.app is not None else nullcontext()
     
     def start(self):
         """Start the scheduler."""
@@ -62,6 +214,13 @@ class TaskScheduler:
             logger.error(f"Failed to start scheduler: {str(e)}")
             raise
     
+    def run_job(self, job_id: str) -> None:
+        """Run one scheduled job now, in this process; for cron-driven deployments."""
+        job = self.scheduler.get_job(job_id)
+        if job is None:
+            raise ValueError(f"Unknown job: {job_id}")
+        job.func()
+    
     def shutdown(self):
         """Shutdown the scheduler."""
         try:
@@ -72,6 +231,18 @@ class TaskScheduler:
             logger.error(f"Failed to shutdown scheduler: {str(e)}")
             raise
     
+    def _run_daily_backup(self):
+        """Back up the database, if backups are enabled for the bound application."""
+        if self.app is None or not self.app.config.get('BACKUP_ENABLED'):
+            logger.info("Daily backup skipped: BACKUP_ENABLED is off")
+            return
+        try:
+            # The Azure SDK is an optional dependency, only needed where backups run
+            from .backup import run_daily_backup
+            run_daily_backup()
+        except Exception as e:
+            logger.error(f"Failed to run daily backup: {str(e)}")
+    
     def _collect_performance_metrics(self):
         """Collect and store performance metrics."""
         try:
@@ -87,3 +258,75 @@ class TaskScheduler:
             logger.info("Weekly analytics report generated successfully")
         except Exception as e:
             logger.error(f"Failed to generate weekly report: {str(e)}")
+    
+    def _refresh_similarity_index(self):
+        """Index new, edited and deleted movies, books and adaptations since the last refresh."""
+        try:
+            with self._app_context():
+                updated = SimilarityIndex().refresh()
+            logger.info(f"Similarity index refreshed: {updated} documents updated")
+        except Exception as e:
+            logger.error(f"Failed to refresh similarity index: {str(e)}")
+    
+    def _rebuild_similarity_index(self):
+        """Rebuild the persisted similarity index, folding in the delta segment."""
+        try:
+            with self._app_context():
+                meta = SimilarityIndex().rebuild()
+            logger.info(f"Similarity index rebuilt with {meta['n_docs']} documents")
+        except Exception as e:
+            logger.error(f"Failed to rebuild similarity index: {str(e)}")
+    
+    def _refresh_cross_media(self):
+        """Recompute cross-media suggestions for users whose history changed."""
+        try:
+            with self._app_context():
+                refreshed = CrossMediaService().refresh_stale()
+            logger.info(f"Cross-media suggestions refreshed for {refreshed} users")
+        except Exception as e:
+            logger.error(f"Failed to refresh cross-media suggestions: {str(e)}")
+    
+    def _rebuild_cross_media_graph(self):
+        """Rebuild the cross-media graph with the latest co-read/co-watch edges."""
+        try:
+            with self._app_context():
+                graph = CrossMediaService().build_graph()
+            logger.info(f"Cross-media graph rebuilt with {len(graph)} nodes")
+        except Exception as e:
+            logger.error(f"Failed to rebuild cross-media graph: {str(e)}")
+    
+    def _precompute_recommendations(self):
+        """Recompute every user's recommendations with the process-pool batch."""
+        try:
+            with self._app_context():
+                report = run_batch()
+            logger.info(f"Recommendations precomputed: {report}")
+        except Exception as e:
+            logger.error(f"Failed to precompute recommendations: {str(e)}")
+    
+    def _checkpoint_trending(self):
+        """Persist and merge in-memory trending counters."""
+        try:
+            with self._app_context():
+                written = TrendingService().checkpoint()
+            logger.info(f"Trending counters checkpointed: {written} rows")
+        except Exception as e:
+            logger.error(f"Failed to checkpoint trending counters: {str(e)}")
+    
+    def _flush_activity_sketches(self):
+        """Persist and merge in-memory distinct-user sketches."""
+        try:
+            with self._app_context():
+                written = ActivitySketches().flush()
+            logger.info(f"Activity sketches flushed: {written} rows")
+        except Exception as e:
+            logger.error(f"Failed to flush activity sketches: {str(e)}")
+    
+    def _prune_notifications(self):
+        """Delete notifications past the retention window."""
+        try:
+            with self._app_context():
+                deleted = NotificationService().prune()
+            logger.info(f"Notifications pruned: {deleted} rows")
+        except Exception as e:
+            logger.error(f"Failed to prune notifications: {str(e)}")
@@ -0,0 +1,45 @@
+"""
+SQL Dates: Portable date-bucketing expressions for database-side aggregation.
+
+Production runs on SQL Server while development and tests use SQLite, and the two
+disagree on how to truncate a DATETIME to a day. day_of compiles to CAST(... AS DATE)
+on SQL Server/PostgreSQL/MySQL and to date(...) on SQLite, so GROUP BY queries can
+bucket by day without loading rows into Python.
+"""
+from datetime import date, datetime
+from typing import Union
+
+from sqlalchemy import Date, extract
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+
+class day_of(FunctionElement):
+    """Calendar day of a DATETIME column."""
+    type = Date()
+    inherit_cache = True
+    name = 'day_of'
+
+
+@compiles(day_of)
+def _compile_day_of(element, compiler, **kw):
+    return f"CAST({compiler.process(element.clauses, **kw)} AS DATE)"
+
+
+@compiles(day_of, 'sqlite')
+def _compile_day_of_sqlite(element, compiler, **kw):
+    return f"date({compiler.process(element.clauses, **kw)})"
+
+
+def hour_of(column):
+    """Hour of day (0-23) of a DATETIME column."""
+    return extract('hour', column)
+
+
+def as_date(value: Union[date, datetime, str, None]) -> Union[date, None]:
+    """Normalize a day bucket returned by the driver (date, datetime or ISO string) to a date."""
+    if value is None or type(value) is date:
+        return value
+    if isinstance(value, datetime):
+        return value.date()
+    return date.fromisoformat(str(value)[:10])
@@ -1,9 +1,21 @@
 import argparse
+import json
 import sys
 from app import create_app, db
 from app.models import Movie, Book
 from app.tmdb_client import TMDBClient
 from app.google_books_client import GoogleBooksClient
+from app.services.similarity_index import SimilarityIndex
+from app.services.batch_recommendations import run_batch
+from app.services.analytics_rollup import AnalyticsRollup
+from app.services.activity_sketches import ActivitySketches
+from app.services.notification_subscriptions import SubscriptionIndex
+from app.utils.activity_export import (TABLES as EXPORT_TABLES, FORMATS as EXPORT_FORMATS,
+                                       DEFAULT_CHUNK_SIZE as EXPORT_CHUNK_SIZE, export_activity)
+from app.utils.recommendation_benchmark import ENGINES, run_benchmark, compare_results
+from app.utils.lazy_import import import_timings
+from app.utils.user_export import (FORMATS as USER_EXPORT_FORMATS, DEFAULT_CHUNK_SIZE as USER_EXPORT_CHUNK_SIZE,
+                                   iter_user_export, export_filename)
 
 
 def run_tests():
@@ -41,10 +53,184 @@ def test_google_books_search():
         print("No book found.")
 
 
+def build_similarity_index():
+    """Rebuild the persisted similarity index from the database."""
+    app = create_app()
+    with app.app_context():
+        meta = SimilarityIndex().rebuild()
+        print(f"Similarity index built with {meta['n_docs']} documents.")
+
+
+def precompute_recommendations(workers=None):
+    """Precompute recommendations for every user across a process pool."""
+    app = create_app()
+    with app.app_context():
+        report = run_batch(workers=workers)
+    print(f"Precomputed recommendations for {report['users']} users "
+          f"({report['failed_users']} failed) with {report['workers']} workers.")
+    print(f"Wall time: {report['wall_time_seconds']}s, "
+          f"throughput: {report['users_per_second']} users/sec")
+
+
+def backfill_analytics_rollups():
+    """Rebuild the per-user daily analytics rollups from raw history."""
+    app = create_app()
+    with app.app_context():
+        report = AnalyticsRollup().backfill()
+    print(f"Backfilled analytics rollups for {report['users']} users: "
+          f"{report['daily_rows']} daily rows, {report['hourly_rows']} hourly rows.")
+
+
+def backfill_activity_sketches():
+    """Rebuild the per-day distinct-user sketches from raw history."""
+    app = create_app()
+    with app.app_context():
+        report = ActivitySketches().backfill()
+    print(f"Backfilled activity sketches for {report['users']} users: {report['rows']} sketches.")
+
+
+def rebuild_notification_subscriptions():
+    """Rebuild the genre/book -> user notification subscription index."""
+    app = create_app()
+    with app.app_context():
+        report = SubscriptionIndex().rebuild()
+    print(f"Rebuilt notification subscriptions: {report['genre']} genre rows, {report['book']} book rows.")
+
+
+def run_scheduled_job(args):
+    """Run one scheduled job once, e.g. from cron when the in-process scheduler is disabled."""
+    from app.utils.scheduler import TaskScheduler
+    if not args.job:
+        print("run_job needs --job.")
+        sys.exit(1)
+    app = create_app()
+    scheduler = TaskScheduler()
+    scheduler.init_app(app)
+    scheduler.run_job(args.job)
+    print(f"Ran scheduled job {args.job}.")
+
+
+def export_activity_tables(args):
+    """Stream activity tables to partitioned Parquet/Arrow files since the last watermark."""
+    app = create_app()
+    with app.app_context():
+        report = export_activity(args.export_dir, tables=args.tables, fmt=args.format or 'parquet',
+                                 full=args.full, chunk_size=args.chunk_size or EXPORT_CHUNK_SIZE)
+    for name, stats in report['tables'].items():
+        print(f"{name}: {stats['rows']} rows ({stats['late_rows']} committed late) in {stats['files']} files "
+              f"(watermark {stats['watermark']})")
+    print(f"Exported {report['rows']} rows to {args.export_dir} in {report['wall_time_seconds']}s "
+          f"({report['rows_per_second']} rows/sec)")
+
+
+def export_user_data(args):
+    """Stream one user's history, reviews and lists to a CSV or JSONL file."""
+    if args.user_id is None:
+        print("export_user needs --user-id.")
+        sys.exit(1)
+    fmt = args.format or 'csv'
+    if fmt not in USER_EXPORT_FORMATS:
+        print(f"export_user supports --format {' or '.join(USER_EXPORT_FORMATS)}.")
+        sys.exit(1)
+    output = args.output or export_filename(args.user_id, fmt, args.gzip)
+    app = create_app()
+    written = 0
+    with app.app_context(), open(output, 'wb') as f:
+        for data in iter_user_export(args.user_id, fmt, gzip=args.gzip,
+                                     chunk_size=args.chunk_size or USER_EXPORT_CHUNK_SIZE):
+            f.write(data)
+            written += len(data)
+    print(f"Exported user {args.user_id} to {output} ({written} bytes).")
+
+
+def benchmark_recommendations(args):
+    """Benchmark recommendation engines on a synthetic dataset in the benchmark database."""
+    app = create_app('benchmark')
+    with app.app_context():
+        report = run_benchmark(interactions=args.interactions, users=args.users, movies=args.movies,
+                               engines=args.engines, k=args.k, sample_users=args.sample_users,
+                               output=args.output)
+    dataset = report['dataset']
+    print(f"Dataset: {dataset['interactions']} interactions, {dataset['users']} users, "
+          f"{dataset['movies']} movies (loaded in {dataset['load_seconds']}s)")
+    k = report['meta']['k']
+    for name, metrics in report['engines'].items():
+        print(f"{name}: p50 {metrics['latency_ms']['p50']}ms, p95 {metrics['latency_ms']['p95']}ms, "
+              f"peak {metrics['peak_memory_mb']}MB, precision@{k} {metrics[f'precision_at_{k}']}, "
+              f"recall@{k} {metrics[f'recall_at_{k}']}")
+    if args.output:
+        print(f"Results saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {args.compare} (commit {baseline['meta'].get('commit')}):")
+        for name, metrics in compare_results(baseline, report).items():
+            for key, values in metrics.items():
+                print(f"  {name} {key}: {values['baseline']} -> {values['current']} ({values['change_pct']:+}%)")
+
+
+STARTUP_TARGETS = {
+    'cli': 'import cli_tool',
+    'app': 'from app import create_app; create_app()',
+}
+HEAVY_MODULES = ('numpy', 'pandas', 'pyarrow', 'scipy', 'sklearn')
+
+
+def startup_report(args):
+    """Report per-module import times for a cold start of the CLI or the application."""
+    report = import_timings(STARTUP_TARGETS[args.target])
+    modules = report['modules']
+    print(f"Cold start ({args.target}): {report['total_us'] / 1000:.1f}ms importing {len(modules)} modules")
+    print(f"{'cumulative':>12} {'self':>10}  module")
+    top_level = [m for m in modules if m['depth'] <= 1]
+    for module in sorted(top_level, key=lambda m: m['cumulative_us'], reverse=True)[:args.top]:
+        print(f"{module['cumulative_us'] / 1000:>10.1f}ms {module['self_us'] / 1000:>8.1f}ms  "
+              f"{'  ' * module['depth']}{module['name']}")
+    loaded = {m['name'].split('.')[0] for m in modules}
+    heavy = [name for name in HEAVY_MODULES if name in loaded]
+    print(f"Heavy modules imported at startup: {', '.join(heavy) if heavy else 'none'}")
+
+
 def main():
     parser = argparse.ArgumentParser(description="CLI tool for testing application features.")
-    parser.add_argument('command', choices=['run_tests', 'reset_db', 'test_tmdb', 'test_books'],
+    parser.add_argument('command', choices=['run_tests', 'reset_db', 'test_tmdb', 'test_books', 'build_index',
+                                            'precompute_recs', 'benchmark', 'backfill_rollups',
+                                            'backfill_sketches', 'rebuild_subscriptions', 'export', 'export_user',
+                                            'startup_report', 'run_job'],
                         help="Command to run.")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Worker processes for precompute_recs (default: CPU count).")
+
+    parser.add_argument('--interactions', type=int, default=10000,
+                        help="Synthetic watches to generate for benchmark.")
+    parser.add_argument('--users', type=int, default=None, help="Synthetic users for benchmark.")
+    parser.add_argument('--movies', type=int, default=None, help="Synthetic movies for benchmark.")
+    parser.add_argument('--engines', nargs='+', choices=sorted(ENGINES), default=None,
+                        help="Engines to benchmark (default: all).")
+    parser.add_argument('--k', type=int, default=10, help="Cut-off for precision@k and recall@k.")
+    parser.add_argument('--sample-users', type=int, default=200,
+                        help="Users with held-out watches to evaluate per engine.")
+    parser.add_argument('--output', help="Benchmark results JSON file, or the export_user output file.")
+    parser.add_argument('--compare', help="Earlier benchmark JSON file to compare against.")
+
+    parser.add_argument('--export-dir', default='exports', help="Output directory for export.")
+    parser.add_argument('--tables', nargs='+', choices=sorted(EXPORT_TABLES), default=None,
+                        help="Activity tables to export (default: all).")
+    parser.add_argument('--format', choices=EXPORT_FORMATS + USER_EXPORT_FORMATS, default=None,
+                        help="parquet/arrow for export (default parquet); csv/jsonl for export_user (default csv).")
+    parser.add_argument('--full', action='store_true',
+                        help="Re-export the selected tables from scratch instead of since the last watermark.")
+    parser.add_argument('--chunk-size', type=int, default=None,
+                        help="Rows fetched per chunk (default 100000 for export, 1000 for export_user).")
+    parser.add_argument('--user-id', type=int, help="User to export with export_user.")
+    parser.add_argument('--gzip', action='store_true', help="Gzip the export_user output.")
+
+    parser.add_argument('--job', help="Scheduled job id for run_job, e.g. notification_prune.")
+
+    parser.add_argument('--target', choices=sorted(STARTUP_TARGETS), default='cli',
+                        help="What startup_report measures: importing the CLI or creating the app.")
+    parser.add_argument('--top', type=int, default=20, help="Modules listed by startup_report.")
 
     args = parser.parse_args()
 
@@ -56,6 +242,26 @@ def main():
         test_tmdb_search()
     elif args.command == 'test_books':
         test_google_books_search()
+    elif args.command == 'build_index':
+        build_similarity_index()
+    elif args.command == 'precompute_recs':
+        precompute_recommendations(args.workers)
+    elif args.command == 'backfill_rollups':
+        backfill_analytics_rollups()
+    elif args.command == 'backfill_sketches':
+        backfill_activity_sketches()
+    elif args.command == 'rebuild_subscriptions':
+        rebuild_notification_subscriptions()
+    elif args.command == 'export':
+        export_activity_tables(args)
+    elif args.command == 'export_user':
+        export_user_data(args)
+    elif args.command == 'startup_report':
+        startup_report(args)
+    elif args.command == 'run_job':
+        run_scheduled_job(args)
+    elif args.command == 'benchmark':
+        benchmark_recommendations(args)
     else:
         print("Unknown command.")
         sys.exit(1)
@@ -0,0 +1,24 @@
+"""Index watchlist on (movieID, userID) for watcher fan-out
+
+Revision ID: 1a7d5e3b9c48
+Revises: 6e4c2a9f8b31
+Create Date: 2026-10-19 19:41:52.117093
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1a7d5e3b9c48'
+down_revision = '6e4c2a9f8b31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_watchlist_movieID_userID', 'watchlist', ['movieID', 'userID'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_watchlist_movieID_userID', table_name='watchlist')
@@ -0,0 +1,40 @@
+"""Add denormalized latest adaptation and adaptation count to Books
+
+Revision ID: 2c9e4b7a1d63
+Revises: f5b2d8c1a7e4
+Create Date: 2026-10-19 21:46:10.384529
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2c9e4b7a1d63'
+down_revision = 'f5b2d8c1a7e4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('Books', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('LatestAdaptationId', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('AdaptationCount', sa.Integer(), nullable=False, server_default='0'))
+
+    books = sa.table('Books', sa.column('BookId', sa.Integer), sa.column('LatestAdaptationId', sa.Integer),
+                     sa.column('AdaptationCount', sa.Integer))
+    adaptations = sa.table('MovieAdaptations', sa.column('MovieAdaptationId', sa.Integer),
+                           sa.column('BookId', sa.Integer))
+    of_book = adaptations.c.BookId == books.c.BookId
+    op.execute(
+        books.update().values(
+            AdaptationCount=sa.select(sa.func.count()).select_from(adaptations).where(of_book).scalar_subquery(),
+            LatestAdaptationId=sa.select(sa.func.max(adaptations.c.MovieAdaptationId))
+            .where(of_book).scalar_subquery()
+        )
+    )
+
+def downgrade():
+    with op.batch_alter_table('Books', schema=None) as batch_op:
+        batch_op.drop_column('AdaptationCount')
+        batch_op.drop_column('LatestAdaptationId')
@@ -0,0 +1,32 @@
+"""Add user_rating_counts rollup and a (UserId, Rating, CreatedAt) index on Reviews
+
+Revision ID: 3a7c5e9b2d41
+Revises: 9d3f6a2c8b14
+Create Date: 2026-10-20 15:03:27.164090
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3a7c5e9b2d41'
+down_revision = '9d3f6a2c8b14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user_rating_counts',
+    sa.Column('UserId', sa.Integer(), nullable=False),
+    sa.Column('Rating', sa.Float(), nullable=False),
+    sa.Column('Reviews', sa.Integer(), nullable=False, server_default='0'),
+    sa.ForeignKeyConstraint(['UserId'], ['Users.UserId'], ),
+    sa.PrimaryKeyConstraint('UserId', 'Rating')
+    )
+    op.create_index('ix_Reviews_UserId_Rating_CreatedAt', 'Reviews', ['UserId', 'Rating', 'CreatedAt'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Reviews_UserId_Rating_CreatedAt', table_name='Reviews')
+    op.drop_table('user_rating_counts')
@@ -0,0 +1,32 @@
+"""Add user_recommendations cache table
+
+Revision ID: 3f9a1c2e7b40
+Revises: b52055a2ad96
+Create Date: 2026-10-19 09:12:44.201337
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9a1c2e7b40'
+down_revision = 'b52055a2ad96'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user_recommendations',
+    sa.Column('UserId', sa.Integer(), nullable=False),
+    sa.Column('Version', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('ComputedVersion', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('recommendations', sa.Text(), nullable=True),
+    sa.Column('ComputedAt', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['UserId'], ['Users.UserId'], ),
+    sa.PrimaryKeyConstraint('UserId')
+    )
+
+
+def downgrade():
+    op.drop_table('user_recommendations')
@@ -0,0 +1,26 @@
+"""Add genres to movie adaptations
+
+Revision ID: 4b8d2e6f1a37
+Revises: 7e1a9c4d2b58
+Create Date: 2026-10-20 09:58:03.771402
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b8d2e6f1a37'
+down_revision = '7e1a9c4d2b58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('MovieAdaptations', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('Genres', sa.String(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('MovieAdaptations', schema=None) as batch_op:
+        batch_op.drop_column('Genres')
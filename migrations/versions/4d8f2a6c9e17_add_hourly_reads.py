@@ -0,0 +1,30 @@
+"""Add Reads to user_hourly_activity and index its Day column
+
+Revision ID: 4d8f2a6c9e17
+Revises: c7a2e9d4b816
+Create Date: 2026-10-19 17:31:05.228614
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4d8f2a6c9e17'
+down_revision = 'c7a2e9d4b816'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing rows start with zero reads; run `cli_tool.py backfill_rollups` afterwards
+    with op.batch_alter_table('user_hourly_activity', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('Reads', sa.Integer(), nullable=False, server_default='0'))
+    # The global heatmap scans one day range across all users
+    op.create_index('ix_user_hourly_activity_Day', 'user_hourly_activity', ['Day'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_user_hourly_activity_Day', table_name='user_hourly_activity')
+    with op.batch_alter_table('user_hourly_activity', schema=None) as batch_op:
+        batch_op.drop_column('Reads')
@@ -0,0 +1,46 @@
+"""Add user_daily_activity and user_hourly_activity rollup tables
+
+Revision ID: 5b9e7c3d1f62
+Revises: a6e3d0f71c28
+Create Date: 2026-10-19 12:41:53.902114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b9e7c3d1f62'
+down_revision = 'a6e3d0f71c28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user_daily_activity',
+    sa.Column('UserId', sa.Integer(), nullable=False),
+    sa.Column('Day', sa.Date(), nullable=False),
+    sa.Column('Watches', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('Reads', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('Reviews', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('RatedReviews', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('RatingSum', sa.Float(), nullable=False, server_default='0'),
+    sa.ForeignKeyConstraint(['UserId'], ['Users.UserId'], ),
+    sa.PrimaryKeyConstraint('UserId', 'Day')
+    )
+    # Weekly reports scan one day range across all users
+    op.create_index('ix_user_daily_activity_Day', 'user_daily_activity', ['Day'], unique=False)
+    op.create_table('user_hourly_activity',
+    sa.Column('UserId', sa.Integer(), nullable=False),
+    sa.Column('Day', sa.Date(), nullable=False),
+    sa.Column('Hour', sa.Integer(), nullable=False),
+    sa.Column('Watches', sa.Integer(), nullable=False, server_default='0'),
+    sa.ForeignKeyConstraint(['UserId'], ['Users.UserId'], ),
+    sa.PrimaryKeyConstraint('UserId', 'Day', 'Hour')
+    )
+
+
+def downgrade():
+    op.drop_table('user_hourly_activity')
+    op.drop_index('ix_user_daily_activity_Day', table_name='user_daily_activity')
+    op.drop_table('user_daily_activity')
@@ -0,0 +1,26 @@
+"""Add GraphVersion to cross_media_recommendations
+
+Revision ID: 6b2f8d4a1e93
+Revises: 3a7c5e9b2d41
+Create Date: 2026-10-21 09:41:18.302615
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6b2f8d4a1e93'
+down_revision = '3a7c5e9b2d41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('cross_media_recommendations', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('GraphVersion', sa.BigInteger(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('cross_media_recommendations', schema=None) as batch_op:
+        batch_op.drop_column('GraphVersion')
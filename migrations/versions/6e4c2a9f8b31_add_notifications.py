@@ -0,0 +1,40 @@
+"""Add notifications table and Users.UnreadNotifications counter
+
+Revision ID: 6e4c2a9f8b31
+Revises: b3e6f1a8d205
+Create Date: 2026-10-19 19:04:17.386150
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6e4c2a9f8b31'
+down_revision = 'b3e6f1a8d205'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('notifications',
+    sa.Column('NotificationId', sa.Integer(), nullable=False),
+    sa.Column('UserId', sa.Integer(), nullable=False),
+    sa.Column('Kind', sa.String(length=30), nullable=False),
+    sa.Column('Title', sa.String(length=200), nullable=False),
+    sa.Column('Message', sa.Text(), nullable=True),
+    sa.Column('Read', sa.Boolean(), nullable=False),
+    sa.Column('CreatedAt', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['UserId'], ['Users.UserId'], ),
+    sa.PrimaryKeyConstraint('NotificationId')
+    )
+    op.create_index('ix_notifications_UserId_CreatedAt', 'notifications', ['UserId', 'CreatedAt'], unique=False)
+    with op.batch_alter_table('Users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('UnreadNotifications', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('Users', schema=None) as batch_op:
+        batch_op.drop_column('UnreadNotifications')
+    op.drop_index('ix_notifications_UserId_CreatedAt', table_name='notifications')
+    op.drop_table('notifications')
@@ -0,0 +1,26 @@
+"""Add genres to movies
+
+Revision ID: 7e1a9c4d2b58
+Revises: 2c9e4b7a1d63
+Create Date: 2026-10-20 09:12:40.218305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7e1a9c4d2b58'
+down_revision = '2c9e4b7a1d63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('movies', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('genres', sa.String(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('movies', schema=None) as batch_op:
+        batch_op.drop_column('genres')
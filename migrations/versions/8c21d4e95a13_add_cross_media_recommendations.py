@@ -0,0 +1,35 @@
+"""Add cross_media_recommendations table
+
+Revision ID: 8c21d4e95a13
+Revises: 3f9a1c2e7b40
+Create Date: 2026-10-19 10:02:17.448190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c21d4e95a13'
+down_revision = '3f9a1c2e7b40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('cross_media_recommendations',
+    sa.Column('UserId', sa.Integer(), nullable=False),
+    sa.Column('Version', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('ComputedVersion', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('suggestions', sa.Text(), nullable=True),
+    sa.Column('ComputedAt', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['UserId'], ['Users.UserId'], ),
+    sa.PrimaryKeyConstraint('UserId')
+    )
+    # Invalidation looks up readers of a book when an adaptation is added
+    op.create_index('ix_read_history_bookID', 'read_history', ['bookID'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_read_history_bookID', table_name='read_history')
+    op.drop_table('cross_media_recommendations')
@@ -0,0 +1,28 @@
+"""Add UpdatedAt to notifications for streaming merged changes
+
+Revision ID: 9d3f6a2c8b14
+Revises: 4b8d2e6f1a37
+Create Date: 2026-10-20 14:12:40.518227
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d3f6a2c8b14'
+down_revision = '4b8d2e6f1a37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('UpdatedAt', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_notifications_UpdatedAt', ['UpdatedAt'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.drop_index('ix_notifications_UpdatedAt')
+        batch_op.drop_column('UpdatedAt')
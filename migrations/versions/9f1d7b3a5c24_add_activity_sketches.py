@@ -0,0 +1,31 @@
+"""Add activity_sketches table for HyperLogLog distinct counts
+
+Revision ID: 9f1d7b3a5c24
+Revises: e2c8a4f6b913
+Create Date: 2026-10-19 15:22:40.561802
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9f1d7b3a5c24'
+down_revision = 'e2c8a4f6b913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('activity_sketches',
+    sa.Column('Kind', sa.String(length=10), nullable=False),
+    sa.Column('Key', sa.Integer(), nullable=False),
+    sa.Column('Day', sa.Date(), nullable=False),
+    sa.Column('Registers', sa.LargeBinary(), nullable=False),
+    sa.Column('UpdatedAt', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('Kind', 'Key', 'Day')
+    )
+
+
+def downgrade():
+    op.drop_table('activity_sketches')
@@ -0,0 +1,31 @@
+"""Add trending_counters table
+
+Revision ID: a6e3d0f71c28
+Revises: 8c21d4e95a13
+Create Date: 2026-10-19 11:24:05.310512
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6e3d0f71c28'
+down_revision = '8c21d4e95a13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('trending_counters',
+    sa.Column('Kind', sa.String(length=20), nullable=False),
+    sa.Column('ItemId', sa.Integer(), nullable=False),
+    sa.Column('Window', sa.String(length=10), nullable=False),
+    sa.Column('Score', sa.Float(), nullable=False, server_default='0'),
+    sa.Column('UpdatedAt', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('Kind', 'ItemId', 'Window')
+    )
+
+
+def downgrade():
+    op.drop_table('trending_counters')
@@ -0,0 +1,33 @@
+"""Add notification_subscriptions inverted index
+
+Revision ID: b3e6f1a8d205
+Revises: 4d8f2a6c9e17
+Create Date: 2026-10-19 18:12:44.903517
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3e6f1a8d205'
+down_revision = '4d8f2a6c9e17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Populate afterwards with `cli_tool.py rebuild_subscriptions`
+    op.create_table('notification_subscriptions',
+    sa.Column('Kind', sa.String(length=10), nullable=False),
+    sa.Column('Key', sa.String(length=100), nullable=False),
+    sa.Column('UserId', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['UserId'], ['Users.UserId'], ),
+    sa.PrimaryKeyConstraint('Kind', 'Key', 'UserId')
+    )
+    op.create_index('ix_notification_subscriptions_UserId', 'notification_subscriptions', ['UserId'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_notification_subscriptions_UserId', table_name='notification_subscriptions')
+    op.drop_table('notification_subscriptions')
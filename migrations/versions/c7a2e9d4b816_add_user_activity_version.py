@@ -0,0 +1,26 @@
+"""Add Users.ActivityVersion for the analytics cache
+
+Revision ID: c7a2e9d4b816
+Revises: 9f1d7b3a5c24
+Create Date: 2026-10-19 16:08:12.447903
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7a2e9d4b816'
+down_revision = '9f1d7b3a5c24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('Users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('ActivityVersion', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('Users', schema=None) as batch_op:
+        batch_op.drop_column('ActivityVersion')
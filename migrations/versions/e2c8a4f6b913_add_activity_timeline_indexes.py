@@ -0,0 +1,35 @@
+"""Add (user, timestamp) indexes for the activity timeline
+
+Revision ID: e2c8a4f6b913
+Revises: 5b9e7c3d1f62
+Create Date: 2026-10-19 14:05:27.318440
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2c8a4f6b913'
+down_revision = '5b9e7c3d1f62'
+branch_labels = None
+depends_on = None
+
+# Each timeline branch seeks one user's rows newest first
+INDEXES = [
+    ('ix_Reviews_UserId_CreatedAt', 'Reviews', ['UserId', 'CreatedAt']),
+    ('ix_watch_history_userID_watched_date', 'watch_history', ['userID', 'watched_date']),
+    ('ix_read_history_userID_read_date', 'read_history', ['userID', 'read_date']),
+    ('ix_watchlist_userID_added_date', 'watchlist', ['userID', 'added_date']),
+    ('ix_readinglist_userID_added_date', 'readinglist', ['userID', 'added_date']),
+]
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False)
+
+
+def downgrade():
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
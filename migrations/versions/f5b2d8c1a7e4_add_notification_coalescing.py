@@ -0,0 +1,32 @@
+"""Add subject, change count and fingerprint to notifications for coalescing
+
+Revision ID: f5b2d8c1a7e4
+Revises: 1a7d5e3b9c48
+Create Date: 2026-10-19 21:08:34.502187
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f5b2d8c1a7e4'
+down_revision = '1a7d5e3b9c48'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('SubjectKey', sa.String(length=50), nullable=True))
+        batch_op.add_column(sa.Column('ChangeCount', sa.Integer(), nullable=False, server_default='1'))
+        batch_op.add_column(sa.Column('Fingerprint', sa.String(length=16), nullable=True))
+        batch_op.create_index('ix_notifications_SubjectKey_CreatedAt', ['SubjectKey', 'CreatedAt'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.drop_index('ix_notifications_SubjectKey_CreatedAt')
+        batch_op.drop_column('Fingerprint')
+        batch_op.drop_column('ChangeCount')
+        batch_op.drop_column('SubjectKey')
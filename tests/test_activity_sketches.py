@@ -0,0 +1,107 @@
+import unittest
+import sys
+import os
+from datetime import date, datetime
+from unittest.mock import patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.models import User, Movie, Book, WatchHistory, ReadHistory, ActivitySketch
+from app.services.activity_sketches import ActivitySketches, HyperLogLog
+from tests.test_config import TestConfig
+
+
+class TestHyperLogLog(unittest.TestCase):
+    def test_estimate_within_target_error(self):
+        for n in (1000, 50000):
+            sketch = HyperLogLog()
+            for value in range(n):
+                sketch.add(value)
+            self.assertLess(abs(sketch.count() - n) / n, 0.02)
+
+    def test_merge_is_union(self):
+        left, right, union = HyperLogLog(), HyperLogLog(), HyperLogLog()
+        for value in range(3000):
+            left.add(value)
+            union.add(value)
+        for value in range(2000, 6000):
+            right.add(value)
+            union.add(value)
+        self.assertEqual(left.merge(right).registers, union.registers)
+
+    def test_round_trip_sparse_and_dense(self):
+        for n in (10, 20000):
+            sketch = HyperLogLog()
+            for value in range(n):
+                sketch.add(value)
+            data = sketch.to_bytes()
+            self.assertEqual(data[:1], b'S' if n == 10 else b'D')
+            self.assertEqual(HyperLogLog.from_bytes(data).registers, sketch.registers)
+
+
+class TestActivitySketches(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config.from_object(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        ActivitySketches().flush()
+
+        self.users = [User(Username=f'user{i}', Email=f'user{i}@example.com') for i in range(3)]
+        self.movie, book = Movie(title='Emma', tmdb_id=556574), Book(Title='Emma')
+        db.session.add_all(self.users + [self.movie, book])
+        db.session.commit()
+        first, second, third = (u.UserId for u in self.users)
+        db.session.add_all([
+            WatchHistory(userID=first, movieID=self.movie.movieID, watched_date=datetime(2024, 5, 1, 20)),
+            WatchHistory(userID=first, movieID=self.movie.movieID, watched_date=datetime(2024, 5, 2, 20)),
+            WatchHistory(userID=second, movieID=self.movie.movieID, watched_date=datetime(2024, 5, 2, 21)),
+            ReadHistory(userID=third, bookID=book.BookId, read_date=datetime(2024, 5, 9, 8)),
+        ])
+        db.session.commit()
+
+    def tearDown(self):
+        ActivitySketches().flush()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_committed_inserts_are_counted_before_and_after_flush(self):
+        sketches = ActivitySketches()
+        self.assertEqual(sketches.active_users(date(2024, 5, 1), date(2024, 5, 8)), 2)
+        sketches.flush()
+        self.assertEqual(db.session.execute(db.select(db.func.count()).select_from(ActivitySketch)).scalar(), 6)
+        self.assertEqual(sketches.active_users(date(2024, 5, 1), date(2024, 5, 10)), 3)
+        self.assertEqual(sketches.unique_viewers(self.movie.movieID, '2024-05-01', '2024-05-03'), 2)
+
+    def test_backfill_matches_incremental(self):
+        sketches = ActivitySketches()
+        sketches.flush()
+        before = sketches.active_users(date(2024, 5, 1), date(2024, 5, 10))
+        report = sketches.backfill()
+        self.assertEqual(report['users'], 3)
+        self.assertEqual(sketches.active_users(date(2024, 5, 1), date(2024, 5, 10)), before)
+
+    def test_full_buffer_flushes_in_the_background(self):
+        sketches = ActivitySketches()
+        sketches.flush()
+        with patch('app.services.activity_sketches.MAX_PENDING_SKETCHES', 1):
+            db.session.add(WatchHistory(userID=self.users[2].UserId, movieID=self.movie.movieID,
+                                        watched_date=datetime(2024, 5, 1, 9)))
+            db.session.commit()
+            sketches._flusher.join(timeout=10)
+        self.assertEqual(sketches._pending, {})
+        self.assertEqual(sketches.unique_viewers(self.movie.movieID, '2024-05-01', '2024-05-02'), 2)
+
+    def test_rolled_back_inserts_are_ignored(self):
+        db.session.add(WatchHistory(userID=self.users[2].UserId, movieID=self.movie.movieID,
+                                    watched_date=datetime(2024, 5, 1, 9)))
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(ActivitySketches().unique_viewers(self.movie.movieID, '2024-05-01', '2024-05-02'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+import sys
+import os
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.models import User, Movie, Book, WatchHistory, ReadHistory, Review, Watchlist, ReadingList
+from app.services.activity_timeline import ActivityTimeline
+from tests.test_config import TestConfig
+
+
+class TestActivityTimeline(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config.from_object(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.user, other = User(Username='reader', Email='reader@example.com'), User(Username='other', Email='other@example.com')
+        movie, book = Movie(title='Dune', tmdb_id=438631), Book(Title='Dune')
+        db.session.add_all([self.user, other, movie, book])
+        db.session.commit()
+        uid = self.user.UserId
+        same_time = datetime(2024, 6, 3, 12)
+        db.session.add_all([
+            WatchHistory(userID=uid, movieID=movie.movieID, watched_date=datetime(2024, 6, 1, 20)),
+            ReadHistory(userID=uid, bookID=book.BookId, read_date=datetime(2024, 6, 2, 8)),
+            # Rows from different tables sharing a timestamp (and id 1) must each appear once
+            Watchlist(userID=uid, movieID=movie.movieID, added_date=same_time),
+            ReadingList(userID=uid, bookID=book.BookId, added_date=same_time),
+            WatchHistory(userID=other.UserId, movieID=movie.movieID, watched_date=datetime(2024, 6, 5)),
+        ])
+        review = Review(UserId=uid, Rating=5, Comment='Spice', movieID=movie.movieID)
+        review.CreatedAt = datetime(2024, 6, 4, 9)
+        db.session.add(review)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_first_page_is_newest_first_with_titles(self):
+        page = ActivityTimeline().page(self.user.UserId, limit=10)
+        self.assertIsNone(page['next_cursor'])
+        self.assertEqual([item['type'] for item in page['items']],
+                         ['review', 'watchlist', 'readinglist', 'read', 'watch'])
+        self.assertTrue(all(item['title'] == 'Dune' for item in page['items']))
+        self.assertEqual(page['items'][0]['details'], {'rating': 5.0, 'comment': 'Spice'})
+
+    def test_cursor_pages_cover_every_item_once(self):
+        timeline, seen, cursor = ActivityTimeline(), [], None
+        while True:
+            page = timeline.page(self.user.UserId, limit=2, cursor=cursor)
+            seen.extend((item['type'], item['id']) for item in page['items'])
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        full = timeline.page(self.user.UserId, limit=10)['items']
+        self.assertEqual(seen, [(item['type'], item['id']) for item in full])
+
+    def test_since_bounds_the_window(self):
+        page = ActivityTimeline().page(self.user.UserId, since=datetime(2024, 6, 2))
+        self.assertNotIn('watch', [item['type'] for item in page['items']])
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            ActivityTimeline().page(self.user.UserId, cursor='not-a-cursor')
+
+
+if __name__ == '__main__':
+    unittest.main()
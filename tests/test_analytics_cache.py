@@ -0,0 +1,66 @@
+import unittest
+import sys
+import os
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.models import User, Movie, WatchHistory
+from app.services.analytics_cache import AnalyticsCache, etag_for
+from app.services.analytics_service import AnalyticsService
+from tests.test_config import TestConfig
+
+
+class TestAnalyticsCache(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config.from_object(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        AnalyticsCache().clear()
+
+        self.user, self.movie = User(Username='viewer', Email='viewer@example.com'), Movie(title='Emma', tmdb_id=556574)
+        db.session.add_all([self.user, self.movie])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _watch(self):
+        db.session.add(WatchHistory(userID=self.user.UserId, movieID=self.movie.movieID,
+                                    watched_date=datetime(2024, 5, 1, 20)))
+        db.session.commit()
+
+    def test_writes_bump_the_activity_version(self):
+        cache = AnalyticsCache()
+        self.assertEqual(cache.version(self.user.UserId), 0)
+        self._watch()
+        self.assertEqual(cache.version(self.user.UserId), 1)
+
+    def test_unchanged_user_is_a_hit_with_stable_etag(self):
+        cache, service = AnalyticsCache(), AnalyticsService()
+        self._watch()
+        etag, first = service.get_cached_user_analytics(self.user)
+        again, second = service.get_cached_user_analytics(self.user)
+        self.assertEqual(etag, again)
+        self.assertIs(first, second)
+        self.assertEqual(cache.get_metrics()['hits'], 1)
+
+    def test_new_activity_invalidates(self):
+        service = AnalyticsService()
+        self._watch()
+        etag, before = service.get_cached_user_analytics(self.user)
+        self._watch()
+        new_etag, after = service.get_cached_user_analytics(self.user)
+        self.assertNotEqual(etag, new_etag)
+        self.assertEqual(new_etag, etag_for(self.user.UserId, 2))
+        self.assertEqual(before['viewing_habits']['total_watched'], 1)
+        self.assertEqual(after['viewing_habits']['total_watched'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import unittest
+import sys
+import os
+from datetime import date, datetime
+from types import SimpleNamespace
+from unittest.mock import patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.models import User, Movie, Book, WatchHistory, ReadHistory, Review, UserDailyActivity
+from app.services.analytics_service import AnalyticsService
+from app.services.analytics_rollup import AnalyticsRollup, _increment
+from tests.test_config import TestConfig
+
+
+class TestViewingHabits(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config.from_object(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.user = User(Username='viewer', Email='viewer@example.com')
+        movie = Movie(title='Dune', tmdb_id=438631)
+        db.session.add_all([self.user, movie])
+        db.session.commit()
+        for watched in (datetime(2024, 1, 1, 20), datetime(2024, 1, 1, 21),
+                        datetime(2024, 1, 8, 20), datetime(2024, 1, 15, 9)):
+            db.session.add(WatchHistory(userID=self.user.UserId, movieID=movie.movieID, watched_date=watched))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_viewing_habits_from_rollups(self):
+        habits = AnalyticsService()._analyze_viewing_habits(self.user.UserId,
+                                                            AnalyticsRollup().daily(self.user.UserId))
+        self.assertEqual(habits['total_watched'], 4)
+        self.assertEqual(habits['average_per_week'], 2.0)
+        self.assertEqual(habits['peak_viewing_time'], '20:00')
+        self.assertEqual(habits['viewing_trend'], {'2024-01-01': 2, '2024-01-08': 1, '2024-01-15': 1})
+
+    def test_rollups_follow_deletes_and_match_backfill(self):
+        db.session.delete(WatchHistory.query.filter_by(userID=self.user.UserId).first())
+        db.session.commit()
+        incremental = [(r.Day, r.Watches) for r in AnalyticsRollup().daily(self.user.UserId)]
+        self.assertEqual(sum(watches for _, watches in incremental), 3)
+
+        AnalyticsRollup().backfill()
+        rebuilt = [(r.Day, r.Watches) for r in AnalyticsRollup().daily(self.user.UserId)]
+        self.assertEqual([row for row in incremental if row[1]], rebuilt)
+
+    def test_rating_changes_move_the_rating_sum(self):
+        review = Review(UserId=self.user.UserId, Rating=4, Comment='Great')
+        db.session.add(review)
+        db.session.commit()
+        review.Rating = 2
+        db.session.commit()
+        rows = AnalyticsRollup().daily(self.user.UserId)
+        self.assertEqual(sum(r.Reviews for r in rows), 1)
+        self.assertEqual(sum(r.RatingSum for r in rows), 2.0)
+
+    def test_rating_distribution_from_rollups(self):
+        reviews = [Review(UserId=self.user.UserId, Rating=rating, Comment='') for rating in (4, 4, 5)]
+        db.session.add_all(reviews)
+        db.session.commit()
+        reviews[0].Rating = 2
+        db.session.delete(reviews[2])
+        db.session.commit()
+
+        self.assertEqual(AnalyticsRollup().rating_counts(self.user.UserId), {2.0: 1, 4.0: 1})
+        AnalyticsRollup().backfill()
+        self.assertEqual(AnalyticsRollup().rating_counts(self.user.UserId), {2.0: 1, 4.0: 1})
+
+    def test_racing_first_write_updates_the_other_writers_row(self):
+        class RacingConnection:
+            """Answers the first UPDATE as if another writer had not committed its row yet."""
+            def __init__(self, connection):
+                self.connection, self.raced = connection, False
+
+            def execute(self, statement, *args):
+                if not self.raced:
+                    self.raced = True
+                    return SimpleNamespace(rowcount=0)
+                return self.connection.execute(statement, *args)
+
+            def begin_nested(self):
+                return self.connection.begin_nested()
+
+        key = {'UserId': self.user.UserId, 'Day': date(2024, 1, 1)}
+        _increment(RacingConnection(db.session.connection()), UserDailyActivity.__table__, key,
+                   {'Watches': 1}, ('Watches', 'Reads', 'Reviews', 'RatedReviews', 'RatingSum'))
+        db.session.commit()
+        self.assertEqual(db.session.get(UserDailyActivity, (self.user.UserId, date(2024, 1, 1))).Watches, 3)
+
+    def test_recent_activity_keeps_movie_title_and_returns_every_page(self):
+        movie_id = WatchHistory.query.first().movieID
+        for _ in range(3):
+            db.session.add(WatchHistory(userID=self.user.UserId, movieID=movie_id, watched_date=datetime.utcnow()))
+        db.session.commit()
+
+        with patch('app.services.analytics_service.MAX_LIMIT', 2):
+            activity = AnalyticsService()._get_recent_activity(self.user)
+        self.assertEqual(len(activity), 3)
+        self.assertEqual({item['movie_title'] for item in activity}, {'Dune'})
+
+    def test_heatmap_bins_by_weekday_and_hour(self):
+        book = Book(Title='Dune')
+        db.session.add(book)
+        db.session.commit()
+        db.session.add(ReadHistory(userID=self.user.UserId, bookID=book.BookId, read_date=datetime(2024, 1, 2, 3)))
+        db.session.commit()
+
+        heatmap = AnalyticsRollup().heatmap(self.user.UserId)
+        self.assertEqual(heatmap['watches'][0][20], 2)
+        self.assertEqual(sum(map(sum, heatmap['watches'])), 4)
+        self.assertEqual(heatmap['reads'][1][3], 1)
+
+        # 2024-01-02 03:00 UTC is Monday 22:00 in New York
+        local = AnalyticsRollup().heatmap(self.user.UserId, tz='America/New_York')
+        self.assertEqual(local['reads'][0][22], 1)
+        self.assertEqual(local['watches'][0][15], 2)
+
+        AnalyticsRollup().backfill()
+        self.assertEqual(AnalyticsRollup().heatmap(None, tz='America/New_York'), local)
+
+    def test_heatmap_rejects_unknown_time_zone(self):
+        with self.assertRaises(ValueError):
+            AnalyticsRollup().heatmap(self.user.UserId, tz='Mars/Olympus_Mons')
+
+    def test_no_history(self):
+        habits = AnalyticsService()._analyze_viewing_habits(self.user.UserId + 1, [])
+        self.assertEqual(habits['total_watched'], 0)
+        self.assertIsNone(habits['peak_viewing_time'])
+
+
+if __name__ == '__main__':
+    unittest.main()
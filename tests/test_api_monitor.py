@@ -0,0 +1,54 @@
+import unittest
+import sys
+import os
+import random
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.api_monitor import APIMonitor, LatencyHistogram
+
+NOW = 1700000000.0
+
+
+class TestAPIMonitor(unittest.TestCase):
+    def setUp(self):
+        self.monitor = APIMonitor()
+        self.monitor._initialize()
+
+    def test_requests_per_minute_slides_by_the_second(self):
+        for offset in range(90):
+            self.monitor.record(0.01, now=NOW + offset)
+        self.assertEqual(APIMonitor.get_requests_per_minute(now=NOW + 89), 60)
+        self.assertEqual(APIMonitor.get_requests_per_minute(now=NOW + 200), 0)
+
+    def test_error_rate_covers_the_whole_hour(self):
+        # Far more requests than the old 1000-entry history could hold
+        for offset in range(3000):
+            self.monitor.record(0.01, error=offset % 10 == 0, now=NOW + offset)
+        self.assertAlmostEqual(APIMonitor.get_error_rate(now=NOW + 2999), 10.0, places=1)
+        self.assertEqual(APIMonitor.get_error_rate(now=NOW + 3 * 3600), 0.0)
+
+    def test_percentiles_are_within_histogram_precision(self):
+        samples = [random.uniform(0.001, 2.0) for _ in range(5000)]
+        for sample in samples:
+            self.monitor.record(sample, now=NOW)
+        samples.sort()
+        percentiles = APIMonitor.get_latency_percentiles(now=NOW)
+        for name, quantile in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99)):
+            exact = samples[int(quantile * len(samples)) - 1]
+            self.assertAlmostEqual(percentiles[name], exact, delta=exact * 0.05)
+        self.assertAlmostEqual(APIMonitor.get_average_response_time(now=NOW), sum(samples) / len(samples))
+
+    def test_histograms_merge_by_adding_counts(self):
+        fast, slow = LatencyHistogram(), LatencyHistogram()
+        for _ in range(90):
+            fast.record(0.000010)
+        for _ in range(10):
+            slow.record(1.0)
+        p50, p99 = fast.merge(slow).percentiles((50, 99))
+        self.assertEqual((fast.count, p50), (100, 0.000010))
+        self.assertAlmostEqual(p99, 1.0, delta=0.03)
+
+
+if __name__ == '__main__':
+    unittest.main()
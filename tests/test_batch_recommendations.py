@@ -0,0 +1,111 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+from unittest.mock import patch
+
+import numpy as np
+
+# Add parent directory to path to import app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.models import User, Movie, WatchHistory, UserRecommendation
+from app.services.batch_recommendations import (export_movie_matrix, load_movie_matrix,
+                                                score_users, precompute_shard, run_batch)
+from tests.test_config import TestConfig
+
+
+class TestBatchRecommendations(unittest.TestCase):
+    def setUp(self):
+        # Movies 1-4 over genres [Action, Drama]; movie 4 has no genres
+        self.path = tempfile.mkdtemp()
+        matrix = np.array([[1, 0], [1, 1], [0, 1], [0, 0]], dtype=np.float32)
+        np.save(os.path.join(self.path, 'genre_matrix.npy'), matrix)
+        np.save(os.path.join(self.path, 'movie_ids.npy'), np.array([1, 2, 3, 4], dtype=np.int64))
+        np.save(os.path.join(self.path, 'average_rating.npy'),
+                np.array([7.0, np.nan, 6.5, 5.0], dtype=np.float32))
+        with open(os.path.join(self.path, 'meta.json'), 'w') as f:
+            f.write('{"n_movies": 4, "genres": ["Action", "Drama"]}')
+        self.data = load_movie_matrix(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def test_matrix_is_memory_mapped(self):
+        """Test workers open the shared matrix read-only via mmap"""
+        self.assertIsInstance(self.data['matrix'], np.memmap)
+        self.assertFalse(self.data['matrix'].flags.writeable)
+
+    def test_scores_follow_genre_preferences(self):
+        """Test scoring matches the genre-average approach of RecommendationService"""
+        results = score_users(self.data, {10: {1: 5.0}, 20: {3: 1.0}}, limit=10)
+
+        # Loves Action: movie 2 (Action+Drama) scores 5, movie 3 (Drama) scores 0
+        self.assertEqual([r['movie_id'] for r in results[10]], [2, 3])
+        self.assertEqual(results[10][0]['score'], 5.0)
+        self.assertEqual(results[10][0]['genres'], ['Action', 'Drama'])
+        self.assertIsNone(results[10][0]['average_rating'])
+
+        # Watched movies and movies without genres are never recommended
+        self.assertNotIn(3, [r['movie_id'] for r in results[20]])
+        self.assertNotIn(4, [r['movie_id'] for r in results[20]])
+
+    def test_users_without_history_are_skipped(self):
+        """Test cold-start users are left to the live trending fallback"""
+        self.assertEqual(score_users(self.data, {30: {}}), {})
+
+
+class TestPrecomputeShard(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config.from_object(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.path = tempfile.mkdtemp()
+        movies = [Movie(movieID=1, title='Heat', tmdb_id=949, genres=['Action']),
+                  Movie(movieID=2, title='Ronin', tmdb_id=8195, genres=['Action', 'Drama'])]
+        self.viewer = User(Username='viewer', Email='viewer@example.com')
+        self.newcomer = User(Username='newcomer', Email='newcomer@example.com')
+        db.session.add_all(movies + [self.viewer, self.newcomer])
+        db.session.commit()
+        db.session.add(WatchHistory(userID=self.viewer.UserId, movieID=1))
+        # Left over from history the newcomer has since deleted
+        db.session.add(UserRecommendation(UserId=self.newcomer.UserId, Version=0))
+        db.session.commit()
+        self.viewer_id, self.newcomer_id = self.viewer.UserId, self.newcomer.UserId
+
+        export_movie_matrix(self.path)
+        self.data = load_movie_matrix(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_cold_start_users_are_not_written(self):
+        """Test the batch writes history users and clears cold-start entries"""
+        written = precompute_shard(self.data, [self.viewer_id, self.newcomer_id])
+
+        self.assertEqual(written, 1)
+        db.session.expire_all()
+        entry = db.session.get(UserRecommendation, self.viewer_id)
+        self.assertEqual([r['title'] for r in entry.recommendations], ['Ronin'])
+        self.assertIsNone(db.session.get(UserRecommendation, self.newcomer_id))
+
+    def test_workers_use_the_parent_configuration(self):
+        """Test spawned workers are created with the configuration of the calling app"""
+        self.app.config['CONFIG_NAME'] = 'testing'
+        with patch('app.services.batch_recommendations.ProcessPoolExecutor',
+                   side_effect=RuntimeError('no pool')) as pool:
+            with self.assertRaises(RuntimeError):
+                run_batch(workers=1)
+        self.assertEqual(pool.call_args.kwargs['initargs'][0], 'testing')
+
+
+if __name__ == '__main__':
+    unittest.main()
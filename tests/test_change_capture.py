@@ -0,0 +1,94 @@
+import unittest
+import sys
+import os
+from unittest.mock import patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.models import User, Movie, Book
+from app.services import change_capture
+from app.services.change_capture import ChangeCapture
+from tests.test_config import TestConfig
+
+
+class TestChangeCapture(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config.from_object(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.batches = []
+        ChangeCapture().subscribe(self.batches.append, tables=('movies',))
+
+    def tearDown(self):
+        ChangeCapture().unsubscribe(self.batches.append)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_one_merged_batch_per_transaction(self):
+        movie, doomed = Movie(title='Emma', tmdb_id=556574), Movie(title='Draft', tmdb_id=1)
+        db.session.add_all([movie, doomed, Book(Title='Emma')])
+        db.session.flush()
+        movie.overview = 'Handsome, clever, and rich.'
+        db.session.delete(doomed)
+        db.session.commit()
+
+        # Insert + update of one row folds into the insert; insert + delete cancels out;
+        # the Books insert is filtered out by the subscription
+        self.assertEqual(len(self.batches), 1)
+        [record] = self.batches[0]
+        self.assertEqual((record['table'], record['pk'], record['op']), ('movies', movie.movieID, 'insert'))
+        self.assertIn('overview', record['columns'])
+
+    def test_updates_list_changed_columns_and_skip_no_ops(self):
+        movie = Movie(title='Emma', tmdb_id=556574)
+        db.session.add(movie)
+        db.session.commit()
+        self.batches.clear()
+
+        movie.update_details(title='Emma.', average_rating=7.1)
+        db.session.commit()
+        movie.update_details(title='Emma.')
+        db.session.commit()
+
+        [[record]] = self.batches
+        self.assertEqual({key: record[key] for key in ('table', 'pk', 'op', 'columns')},
+                         {'table': 'movies', 'pk': movie.movieID, 'op': 'update',
+                          'columns': ('title', 'average_rating')})
+
+    def test_digest_tells_edits_of_one_column_apart(self):
+        movie = Movie(title='Emma', tmdb_id=556574)
+        db.session.add(movie)
+        db.session.commit()
+        self.batches.clear()
+
+        for overview in ('First draft.', 'Second draft.', 'First draft.'):
+            movie.update_details(overview=overview)
+            db.session.commit()
+
+        digests = [batch[0]['digest'] for batch in self.batches]
+        self.assertEqual(len(digests), 3)
+        self.assertNotEqual(digests[0], digests[1])
+        self.assertEqual(digests[0], digests[2])
+
+    def test_rollback_discards_changes(self):
+        db.session.add(Movie(title='Emma', tmdb_id=556574))
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(self.batches, [])
+
+    def test_unwatched_tables_are_not_recorded(self):
+        self.assertNotIn('Users', ChangeCapture().tables)
+        with patch.object(change_capture, '_record', wraps=change_capture._record) as record:
+            db.session.add_all([User(Username='reader', Email='reader@example.com'),
+                                Movie(title='Emma', tmdb_id=556574)])
+            db.session.commit()
+        self.assertEqual([call.args[1].__tablename__ for call in record.call_args_list], ['movies'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import unittest
+import os
+import sys
+
+# Add parent directory to path to import app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.models import User, Book, Movie, MovieAdaptation, ReadHistory, CrossMediaRecommendation
+from app.services.cross_media_service import CrossMediaGraph, CrossMediaService
+from tests.test_config import TestConfig
+
+
+class TestCrossMediaGraph(unittest.TestCase):
+    def setUp(self):
+        self.graph = CrossMediaGraph()
+        # Book 1 was adapted into movie 10; book 2 into movie 20
+        self.graph.add_adaptation(1, 10)
+        self.graph.add_adaptation(2, 20)
+        # Someone read book 1 and book 2 together
+        self.graph.add_co_engagement([('book', 1), ('book', 2)])
+
+    def test_reader_reaches_adaptation_first(self):
+        """Test the direct adaptation outranks items reached through co-reads"""
+        ranked = self.graph.personalized_rank({('book', 1): 1.0})
+        candidates = {node: score for node, score in ranked.items() if node != ('book', 1)}
+        best = max(candidates, key=candidates.get)
+        self.assertEqual(best, ('movie', 10))
+        self.assertIn(('movie', 20), ranked)
+
+    def test_watcher_reaches_source_book(self):
+        """Test a watched movie leads back to its source book"""
+        ranked = self.graph.personalized_rank({('movie', 20): 1.0}, hops=1)
+        self.assertEqual(set(ranked), {('movie', 20), ('book', 2)})
+        self.assertEqual(self.graph.adaptations_of(('movie', 20)), {('book', 2)})
+
+    def test_incremental_edges_are_picked_up(self):
+        """Test edges added after a query are compiled into the next one"""
+        self.graph.personalized_rank({('book', 1): 1.0})
+        self.graph.add_adaptation(1, 30)
+        ranked = self.graph.personalized_rank({('book', 1): 1.0}, hops=1)
+        self.assertIn(('movie', 30), ranked)
+
+    def test_unknown_seed_returns_nothing(self):
+        """Test seeds that are not in the graph produce no scores"""
+        self.assertEqual(self.graph.personalized_rank({('book', 99): 1.0}), {})
+
+
+class TestCrossMediaService(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config.from_object(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        CrossMediaService().graph = None
+
+        self.reader = User(Username='reader', Email='reader@example.com')
+        self.book = Book(Title='Emma')
+        self.movie = Movie(title='Clueless', tmdb_id=9603)
+        db.session.add_all([self.reader, self.book, self.movie])
+        db.session.commit()
+        db.session.add(ReadHistory(userID=self.reader.UserId, bookID=self.book.BookId))
+        db.session.add(MovieAdaptation(Title='Clueless', BookId=self.book.BookId, movieID=self.movie.movieID))
+        db.session.commit()
+        self.reader_id, self.book_id, self.movie_id = self.reader.UserId, self.book.BookId, self.movie.movieID
+
+    def tearDown(self):
+        CrossMediaService().graph = None
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_first_request_builds_the_graph_in_the_background(self):
+        """Test a miss before the graph exists is served empty instead of building inline"""
+        service = CrossMediaService()
+        first = service.get(self.reader_id)
+        self.assertEqual(first['suggestions'], {'movies': [], 'books': []})
+        self.assertTrue(first['stale'])
+
+        service._builder.join(timeout=10)
+        self.assertIsNotNone(service.graph)
+        movies = service.get(self.reader_id)['suggestions']['movies']
+        self.assertEqual([m['movie_id'] for m in movies], [self.movie_id])
+
+    def test_adaptation_edges_wait_for_commit(self):
+        """Test a rolled-back adaptation leaves no edge in the shared graph"""
+        graph = CrossMediaService().build_graph()
+        sequel = Movie(title='Emma.', tmdb_id=556574)
+        db.session.add(sequel)
+        db.session.commit()
+        sequel_id = sequel.movieID
+
+        db.session.add(MovieAdaptation(Title='Emma.', BookId=self.book_id, movieID=sequel_id))
+        db.session.flush()
+        self.assertNotIn(('movie', sequel_id), graph.adaptations_of(('book', self.book_id)))
+        db.session.rollback()
+        self.assertNotIn(('movie', sequel_id), graph.adaptations_of(('book', self.book_id)))
+
+        db.session.add(MovieAdaptation(Title='Emma.', BookId=self.book_id, movieID=sequel_id))
+        db.session.commit()
+        self.assertIn(('movie', sequel_id), graph.adaptations_of(('book', self.book_id)))
+
+    def test_rebuild_makes_older_rows_stale(self):
+        """Test rows computed from an older graph are recomputed after a rebuild"""
+        service = CrossMediaService()
+        service.build_graph()
+        first = service.refresh_user(self.reader_id)
+        self.assertEqual(service.refresh_stale(), 0)
+
+        service.build_graph()
+        service.graph.version = first.GraphVersion + 1
+        self.assertEqual(service.refresh_stale(), 1)
+        self.assertEqual(db.session.get(CrossMediaRecommendation, self.reader_id).GraphVersion,
+                         service.graph.version)
+        self.assertEqual(service.refresh_stale(), 0)
+
+    def test_adaptations_committed_elsewhere_reach_the_refresh(self):
+        """Test refresh_stale adds edges committed by a process whose graph it cannot see"""
+        service = CrossMediaService()
+        graph = service.build_graph()
+        service.refresh_user(self.reader_id)
+        sequel = Movie(title='Emma.', tmdb_id=556574)
+        db.session.add(sequel)
+        db.session.commit()
+        sequel_id = sequel.movieID
+
+        # Another process commits the adaptation; its after_commit hook never reaches this graph
+        service.graph = None
+        db.session.add(MovieAdaptation(Title='Emma.', BookId=self.book_id, movieID=sequel_id))
+        db.session.commit()
+        service.graph = graph
+        self.assertNotIn(('movie', sequel_id), graph.adaptations_of(('book', self.book_id)))
+
+        self.assertEqual(service.refresh_stale(), 1)
+        movies = db.session.get(CrossMediaRecommendation, self.reader_id).suggestions['movies']
+        self.assertIn(sequel_id, [m['movie_id'] for m in movies])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.lazy_import import LazyModule, lazy_import, import_timings
+from app.services.cross_media_service import CrossMediaGraph
+import app.services.cross_media_service as cross_media_service
+
+
+class TestLazyImport(unittest.TestCase):
+    def test_module_is_imported_on_first_attribute_access(self):
+        module = LazyModule('colorsys')
+        self.assertEqual(module.rgb_to_hsv(1.0, 0.0, 0.0), (0.0, 1.0, 1.0))
+        self.assertIn('rgb_to_hsv', module.__dict__)
+
+    def test_already_imported_module_is_returned_as_is(self):
+        self.assertIs(lazy_import('os'), os)
+
+    def test_app_startup_does_not_import_numpy(self):
+        statement = "import sys; import app.main.routes; assert 'numpy' not in sys.modules"
+        report = import_timings(statement, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.assertTrue(any(m['name'] == 'app.main.routes' for m in report['modules']))
+
+
+class TestCrossMediaGraphFallback(unittest.TestCase):
+    def _graph(self):
+        graph = CrossMediaGraph()
+        graph.add_adaptation(1, 2)
+        graph.add_co_engagement([('book', 1), ('movie', 3), ('movie', 2), ('book', 4)])
+        return graph
+
+    def test_pure_python_and_numpy_walks_agree(self):
+        small = self._graph().personalized_rank({('book', 1): 1.0})
+        limit = cross_media_service.PURE_PYTHON_MAX_EDGES
+        cross_media_service.PURE_PYTHON_MAX_EDGES = 0
+        try:
+            vectorized = self._graph().personalized_rank({('book', 1): 1.0})
+        finally:
+            cross_media_service.PURE_PYTHON_MAX_EDGES = limit
+        self.assertEqual(small.keys(), vectorized.keys())
+        for node, score in small.items():
+            self.assertAlmostEqual(score, vectorized[node])
+
+
+if __name__ == '__main__':
+    unittest.main()
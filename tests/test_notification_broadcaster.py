@@ -0,0 +1,160 @@
+import unittest
+import sys
+import os
+import json
+from datetime import datetime
+from unittest.mock import patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.models import User, Notification
+from app.services.notification_broadcaster import NotificationBroadcaster
+from app.services.notification_service import NotificationService, WATCHLIST_UPDATE
+from tests.test_config import TestConfig
+
+
+class TestNotificationBroadcaster(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config.from_object(TestConfig)
+        self.app.config['NOTIFICATION_STREAM_HEARTBEAT_SECONDS'] = 0.2
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        users = [User(Username='listener', Email='listener@example.com'),
+                 User(Username='other', Email='other@example.com')]
+        db.session.add_all(users)
+        db.session.commit()
+        self.user_id, self.other_id = users[0].UserId, users[1].UserId
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _notify(self, user_id, title):
+        NotificationService().create_notifications([user_id], WATCHLIST_UPDATE, title, 'details')
+
+    @staticmethod
+    def _next_event(stream, attempts=50):
+        """The next notification event, skipping heartbeats."""
+        for _ in range(attempts):
+            chunk = next(stream)
+            if chunk.startswith('id: '):
+                lines = chunk.strip().split('\n')
+                return int(lines[0][4:]), json.loads(lines[2][6:])
+        raise AssertionError('No event arrived')
+
+    def test_resume_replays_missed_notifications_then_streams_live(self):
+        self._notify(self.user_id, 'Seen')
+        self._notify(self.user_id, 'Missed')
+        self._notify(self.other_id, 'Not mine')
+        seen = NotificationService().get_user_notifications(db.session.get(User, self.user_id))
+        seen_id = seen['notifications'][-1]['id']
+
+        stream = NotificationBroadcaster().stream(self.user_id, last_event_id=seen_id)
+        try:
+            self.assertTrue(next(stream).startswith('retry:'))
+            event_id, item = self._next_event(stream)
+            self.assertEqual(item['title'], 'Missed')
+            self.assertGreater(event_id, seen_id)
+
+            self._notify(self.other_id, 'Still not mine')
+            self._notify(self.user_id, 'Live')
+            NotificationBroadcaster().wake()
+            self.assertEqual(self._next_event(stream)[1]['title'], 'Live')
+            self.assertEqual(NotificationBroadcaster().get_metrics()['connected_clients'], 1)
+        finally:
+            stream.close()
+        self.assertEqual(NotificationBroadcaster().get_metrics()['connected_clients'], 0)
+
+    def _insert(self, notification_id, title):
+        """A row with a chosen id, as if its transaction committed out of order."""
+        db.session.add(Notification(NotificationId=notification_id, UserId=self.user_id, Kind=WATCHLIST_UPDATE,
+                                    Title=title, CreatedAt=datetime.utcnow()))
+        db.session.commit()
+
+    def test_late_commit_below_the_cursor_is_still_pushed(self):
+        self._notify(self.user_id, 'Before')
+        stream = NotificationBroadcaster().stream(self.user_id)
+        try:
+            next(stream)
+            base = NotificationBroadcaster().get_metrics()['cursor']
+            self._insert(base + 5, 'Committed first')
+            NotificationBroadcaster().wake()
+            self.assertEqual(self._next_event(stream)[0], base + 5)
+
+            self._insert(base + 2, 'Committed late')
+            NotificationBroadcaster().wake()
+            event_id, item = self._next_event(stream)
+            self.assertEqual((event_id, item['title']), (base + 2, 'Committed late'))
+        finally:
+            stream.close()
+
+    def test_resume_pages_through_everything_missed(self):
+        for index in range(5):
+            self._notify(self.user_id, f'Missed {index}')
+        with patch('app.services.notification_broadcaster.REPLAY_LIMIT', 2):
+            stream = NotificationBroadcaster().stream(self.user_id, last_event_id=0)
+            try:
+                next(stream)
+                titles = [self._next_event(stream)[1]['title'] for _ in range(5)]
+            finally:
+                stream.close()
+        self.assertEqual(titles, [f'Missed {index}' for index in range(5)])
+
+    @staticmethod
+    def _next_update(stream, attempts=50):
+        """The next notification-updated event, skipping heartbeats."""
+        for _ in range(attempts):
+            chunk = next(stream)
+            if chunk.startswith('event: notification-updated'):
+                return json.loads(chunk.strip().split('\n')[1][6:])
+        raise AssertionError('No update arrived')
+
+    def _notify_about(self, subject, message):
+        NotificationService().create_notifications([self.user_id], WATCHLIST_UPDATE, 'Update', message,
+                                                   subject=subject)
+
+    def test_merge_is_pushed_as_an_update(self):
+        self._notify_about('movie:1', 'First change')
+        stream = NotificationBroadcaster().stream(self.user_id)
+        try:
+            next(stream)
+            self._notify_about('movie:1', 'Second change')
+            NotificationBroadcaster().wake()
+            item = self._next_update(stream)
+        finally:
+            stream.close()
+        self.assertEqual((item['count'], item['message']), (2, 'Second change'))
+        self.assertIsNotNone(item['updated_at'])
+
+    def test_resume_sends_merges_into_rows_before_last_event_id(self):
+        self._notify_about('movie:1', 'First change')
+        self._notify(self.user_id, 'Seen')
+        seen_id = NotificationService().get_user_notifications(
+            db.session.get(User, self.user_id))['notifications'][0]['id']
+        self._notify_about('movie:1', 'Second change')
+
+        stream = NotificationBroadcaster().stream(self.user_id, last_event_id=seen_id)
+        try:
+            next(stream)
+            item = self._next_update(stream)
+        finally:
+            stream.close()
+        self.assertLess(item['id'], seen_id)
+        self.assertEqual((item['count'], item['message']), (2, 'Second change'))
+
+    def test_idle_stream_sends_heartbeats(self):
+        stream = NotificationBroadcaster().stream(self.user_id)
+        try:
+            next(stream)
+            self.assertEqual(next(stream), ': heartbeat\n\n')
+        finally:
+            stream.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+import sys
+import os
+import queue
+import time
+from unittest.mock import patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.models import User, Movie, Watchlist, Notification
+from app.services.notification_queue import NotificationQueue
+from app.services.notification_service import NotificationService, watchlist_update_job
+from tests.test_config import TestConfig
+
+
+class TestNotificationQueue(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config.from_object(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.users = [User(Username=f'watcher{i}', Email=f'watcher{i}@example.com') for i in range(3)]
+        self.movie = Movie(title='Sense and Sensibility', tmdb_id=4584)
+        db.session.add_all(self.users + [self.movie])
+        db.session.commit()
+        self.entries = [Watchlist(userID=user.UserId, movieID=self.movie.movieID) for user in self.users]
+        db.session.add_all(self.entries)
+        db.session.commit()
+
+    def tearDown(self):
+        NotificationQueue().wait_idle(timeout=5)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _notified_users(self):
+        return sorted(db.session.execute(db.select(Notification.UserId)).scalars())
+
+    def test_committed_update_enqueues_and_workers_deliver(self):
+        notification_queue = NotificationQueue()
+        before = notification_queue.get_metrics()
+        self.movie.update_details(overview='Two sisters in reduced circumstances.')
+        db.session.commit()
+        self.assertTrue(notification_queue.wait_idle(timeout=10))
+
+        self.assertEqual(self._notified_users(), [user.UserId for user in self.users])
+        metrics = notification_queue.get_metrics()
+        self.assertEqual(metrics['enqueued'] - before['enqueued'], 1)
+        self.assertEqual(metrics['delivered_jobs'] - before['delivered_jobs'], 1)
+        self.assertEqual(metrics['queue_depth'], 0)
+
+    def test_rolled_back_update_notifies_nobody(self):
+        self.movie.update_details(overview='Never saved.')
+        db.session.flush()
+        db.session.rollback()
+        self.assertTrue(NotificationQueue().wait_idle(timeout=10))
+        self.assertEqual(self._notified_users(), [])
+
+    def test_deliver_coalesces_a_batch_in_one_transaction(self):
+        created = NotificationService().deliver([
+            watchlist_update_job(self.movie.movieID, columns=['overview']),
+            watchlist_update_job(self.movie.movieID, columns=['release_date'])
+        ])
+        self.assertEqual(created, 3)
+        self.assertEqual(NotificationService().unread_count(self.users[0].UserId), 1)
+        counts = db.session.execute(db.select(Notification.ChangeCount)).scalars().all()
+        self.assertEqual(counts, [2, 2, 2])
+
+    def test_failed_batch_is_retried_job_by_job(self):
+        notification_queue = NotificationQueue()
+        before = notification_queue.get_metrics()
+        notification_queue.enqueue({'kind': 'unknown'})
+        notification_queue.enqueue(watchlist_update_job(self.movie.movieID, columns=['overview']))
+        self.assertTrue(notification_queue.wait_idle(timeout=10))
+
+        # The bad job is dropped on its own; the good one still reaches every watcher
+        self.assertEqual(self._notified_users(), [user.UserId for user in self.users])
+        metrics = notification_queue.get_metrics()
+        self.assertEqual(metrics['errors'] - before['errors'], 1)
+        self.assertEqual(metrics['retried_batches'] - before['retried_batches'], 1)
+
+    def test_full_queue_drops_without_blocking(self):
+        notification_queue = NotificationQueue()
+        before = notification_queue.get_metrics()
+        started = time.monotonic()
+        with patch.object(notification_queue._queue, 'put_nowait', side_effect=queue.Full):
+            queued = notification_queue.enqueue(watchlist_update_job(self.movie.movieID, columns=['overview']))
+        self.assertFalse(queued)
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(notification_queue.get_metrics()['dropped'] - before['dropped'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
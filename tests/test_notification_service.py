@@ -0,0 +1,154 @@
+import unittest
+import sys
+import os
+import threading
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from sqlalchemy import event
+
+from app.models import User, Movie, Watchlist, Notification
+from app.services.notification_service import NotificationService, WATCHLIST_UPDATE, watchlist_update_job
+from tests.test_config import TestConfig
+
+
+class TestNotificationService(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config.from_object(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.users = [User(Username=f'user{i}', Email=f'user{i}@example.com') for i in range(3)]
+        db.session.add_all(self.users)
+        db.session.commit()
+        self.user_ids = [user.UserId for user in self.users]
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _notify(self, user_ids, title='Update'):
+        return NotificationService().create_notifications(user_ids, WATCHLIST_UPDATE, title, 'details')
+
+    def test_bulk_create_bumps_unread_counters(self):
+        service = NotificationService()
+        self.assertEqual(self._notify(self.user_ids + [self.user_ids[0]]), 3)
+        self._notify(self.user_ids[:1])
+        self.assertEqual(service.unread_count(self.user_ids[0]), 2)
+        self.assertEqual(service.unread_count(self.user_ids[1]), 1)
+
+    def test_pages_follow_the_cursor_newest_first(self):
+        service = NotificationService()
+        for i in range(5):
+            self._notify(self.user_ids[:1], title=f'Update {i}')
+
+        first = service.get_user_notifications(self.users[0], limit=3)
+        self.assertEqual([n['title'] for n in first['notifications']], ['Update 4', 'Update 3', 'Update 2'])
+        self.assertEqual(first['unread_count'], 5)
+        second = service.get_user_notifications(self.users[0], limit=3, cursor=first['next_cursor'])
+        self.assertEqual([n['title'] for n in second['notifications']], ['Update 1', 'Update 0'])
+        self.assertIsNone(second['next_cursor'])
+        with self.assertRaises(ValueError):
+            service.get_user_notifications(self.users[0], cursor='not-a-cursor')
+
+    def test_mark_read_lowers_the_counter(self):
+        service = NotificationService()
+        self._notify(self.user_ids[:1])
+        self._notify(self.user_ids[:1])
+        newest = service.get_user_notifications(self.users[0], limit=1)['notifications'][0]
+
+        self.assertEqual(service.mark_read(self.user_ids[0], [newest['id']]), 1)
+        self.assertEqual(service.mark_read(self.user_ids[0], [newest['id']]), 0)
+        self.assertEqual(service.unread_count(self.user_ids[0]), 1)
+        self.assertEqual(service.mark_read(self.user_ids[0]), 1)
+        self.assertEqual(service.unread_count(self.user_ids[0]), 0)
+
+    def test_prune_removes_expired_rows_and_their_unread_counts(self):
+        service = NotificationService()
+        self._notify(self.user_ids)
+        db.session.execute(Notification.__table__.update().values(CreatedAt=datetime.utcnow() - timedelta(days=100)))
+        db.session.commit()
+        self._notify(self.user_ids[:1])
+
+        self.assertEqual(service.prune(retention_days=90), 3)
+        self.assertEqual(db.session.execute(db.select(db.func.count(Notification.NotificationId))).scalar(), 1)
+        self.assertEqual([service.unread_count(user_id) for user_id in self.user_ids], [1, 0, 0])
+
+    def test_watchlist_fan_out_is_two_selects_and_one_insert(self):
+        movie = Movie(title='Mansfield Park', tmdb_id=10399)
+        db.session.add(movie)
+        db.session.commit()
+        # A duplicate entry must not produce a second notification
+        db.session.add_all([Watchlist(userID=user_id, movieID=movie.movieID)
+                            for user_id in self.user_ids + self.user_ids[:1]])
+        db.session.commit()
+
+        job = watchlist_update_job(movie.movieID, movie.title)
+        # Only this thread's statements; background refreshers share the engine
+        statements, thread = [], threading.get_ident()
+
+        def listener(conn, cursor, statement, *args):
+            if threading.get_ident() == thread:
+                statements.append(statement.split()[0].upper())
+
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            created = NotificationService().deliver([job])
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+
+        self.assertEqual(created, 3)
+        # Recipients, then the coalescing window lookup
+        self.assertEqual(statements.count('SELECT'), 2)
+        self.assertEqual(statements.count('INSERT'), 1)
+        self.assertEqual(statements.count('UPDATE'), 1)
+
+    def test_changes_to_one_subject_merge_into_the_unread_notification(self):
+        service = NotificationService()
+        user_id = self.user_ids[0]
+        self.assertEqual(service.create_notifications([user_id], WATCHLIST_UPDATE, 'Update', 'v1', 'movie:1'), 1)
+        self.assertEqual(service.create_notifications([user_id], WATCHLIST_UPDATE, 'Update', 'v2', 'movie:1'), 0)
+        # An identical change is a duplicate and leaves the count alone
+        service.create_notifications([user_id], WATCHLIST_UPDATE, 'Update', 'v2', 'movie:1')
+
+        rows = db.session.execute(db.select(Notification).where(Notification.UserId == user_id)).scalars().all()
+        self.assertEqual([(row.Message, row.ChangeCount) for row in rows], [('v2', 2)])
+        self.assertEqual(service.unread_count(user_id), 1)
+        self.assertEqual(service.get_user_notifications(self.users[0])['notifications'][0]['count'], 2)
+
+    def test_edits_of_the_same_column_each_count(self):
+        movie = Movie(title='Emma', tmdb_id=556574)
+        db.session.add(movie)
+        db.session.commit()
+        db.session.add(Watchlist(userID=self.user_ids[0], movieID=movie.movieID))
+        db.session.commit()
+
+        service = NotificationService()
+        service.deliver([watchlist_update_job(movie.movieID, columns=['overview'], digest='a'),
+                         watchlist_update_job(movie.movieID, columns=['overview'], digest='b')])
+        # The same edit delivered twice is still one change
+        service.deliver([watchlist_update_job(movie.movieID, columns=['overview'], digest='c'),
+                         watchlist_update_job(movie.movieID, columns=['overview'], digest='c')])
+
+        counts = db.session.execute(db.select(Notification.ChangeCount)).scalars().all()
+        self.assertEqual(counts, [3])
+
+    def test_read_notification_or_closed_window_starts_a_new_one(self):
+        service = NotificationService()
+        user_id = self.user_ids[0]
+        service.create_notifications([user_id], WATCHLIST_UPDATE, 'Update', 'v1', 'movie:1')
+        service.mark_read(user_id)
+        self.assertEqual(service.create_notifications([user_id], WATCHLIST_UPDATE, 'Update', 'v2', 'movie:1'), 1)
+
+        self.app.config['NOTIFICATION_COALESCE_SECONDS'] = 0
+        self.assertEqual(service.create_notifications([user_id], WATCHLIST_UPDATE, 'Update', 'v3', 'movie:1'), 1)
+        self.assertEqual(service.unread_count(user_id), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
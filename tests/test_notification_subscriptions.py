@@ -0,0 +1,135 @@
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from sqlalchemy import event
+from app.models import User, Movie, Book, MovieAdaptation, ReadingList, Notification, NotificationSubscription
+from app.services.notification_subscriptions import SubscriptionIndex
+from app.services.notification_service import NotificationService, book_adaptation_job
+from tests.test_config import TestConfig
+
+
+class TestNotificationSubscriptions(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config.from_object(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.drama_fan = User(Username='drama', Email='drama@example.com')
+        self.drama_fan.preferences = {'preferred_genres': ['Drama', 'Romance']}
+        self.reader = User(Username='reader', Email='reader@example.com')
+        self.bystander = User(Username='bystander', Email='bystander@example.com')
+        self.bystander.preferences = {'preferred_genres': ['Horror']}
+        self.book = Book(Title='Persuasion', Author='Jane Austen')
+        db.session.add_all([self.drama_fan, self.reader, self.bystander, self.book])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_preferences_are_indexed_and_reindexed(self):
+        index = SubscriptionIndex()
+        self.assertEqual(index.subscribers(['Drama']), {self.drama_fan.UserId})
+
+        self.drama_fan.preferences = {'preferred_genres': ['Horror']}
+        db.session.commit()
+        self.assertEqual(index.subscribers(['Drama']), set())
+        self.assertEqual(index.subscribers(['Horror']), {self.drama_fan.UserId, self.bystander.UserId})
+
+    def test_reading_list_subscribes_until_last_entry_removed(self):
+        index = SubscriptionIndex()
+        first = ReadingList(userID=self.reader.UserId, bookID=self.book.BookId)
+        second = ReadingList(userID=self.reader.UserId, bookID=self.book.BookId)
+        db.session.add_all([first, second])
+        db.session.commit()
+        self.assertEqual(index.subscribers(book_id=self.book.BookId), {self.reader.UserId})
+
+        db.session.delete(first)
+        db.session.commit()
+        self.assertEqual(index.subscribers(book_id=self.book.BookId), {self.reader.UserId})
+        db.session.delete(second)
+        db.session.commit()
+        self.assertEqual(index.subscribers(book_id=self.book.BookId), set())
+
+    def _recipients(self):
+        return set(db.session.execute(db.select(Notification.UserId)).scalars())
+
+    def test_new_adaptation_notifies_only_subscribers(self):
+        db.session.add(ReadingList(userID=self.reader.UserId, bookID=self.book.BookId))
+        db.session.add(MovieAdaptation(Title='Persuasion (2022)', BookId=self.book.BookId, genres=['Romance']))
+        db.session.commit()
+        # Resolve from the stored rows only, as the delivery workers do
+        db.session.expire_all()
+
+        service = NotificationService()
+        service.deliver([book_adaptation_job(self.book.BookId)])
+        self.assertEqual(self._recipients(), {self.drama_fan.UserId, self.reader.UserId})
+        page = service.get_user_notifications(self.reader)
+        self.assertIn("'Persuasion (2022)'", page['notifications'][0]['message'])
+        self.assertEqual(service.get_user_notifications(self.bystander)['notifications'], [])
+
+    def test_adaptation_without_genres_uses_its_movies(self):
+        movie = Movie(title='Persuasion', tmdb_id=1062722, genres=['Drama'])
+        db.session.add(movie)
+        db.session.flush()
+        db.session.add(MovieAdaptation(Title='Persuasion', BookId=self.book.BookId, movieID=movie.movieID))
+        db.session.commit()
+        db.session.expire_all()
+
+        NotificationService().deliver([book_adaptation_job(self.book.BookId)])
+        self.assertEqual(self._recipients(), {self.drama_fan.UserId})
+
+    def test_book_tracks_latest_adaptation_and_count(self):
+        first = MovieAdaptation(Title='Persuasion (1995)', BookId=self.book.BookId)
+        second = MovieAdaptation(Title='Persuasion (2022)', BookId=self.book.BookId)
+        db.session.add(first)
+        db.session.flush()
+        db.session.add(second)
+        db.session.commit()
+        self.assertEqual((self.book.AdaptationCount, self.book.LatestAdaptationId), (2, second.MovieAdaptationId))
+
+        db.session.delete(second)
+        db.session.commit()
+        self.assertEqual((self.book.AdaptationCount, self.book.LatestAdaptationId), (1, first.MovieAdaptationId))
+        other = Book(Title='Emma', Author='Jane Austen')
+        db.session.add(other)
+        db.session.flush()
+        first.BookId = other.BookId
+        db.session.commit()
+        self.assertEqual((self.book.AdaptationCount, self.book.LatestAdaptationId), (0, None))
+        self.assertEqual((other.AdaptationCount, other.LatestAdaptationId), (1, first.MovieAdaptationId))
+
+    def test_unadapted_book_resolves_without_an_adaptation_query(self):
+        statements = []
+
+        def listener(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            job = NotificationService()._latest_adaptation_job(self.book.BookId)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        self.assertIsNone(job)
+        self.assertFalse(any('MovieAdaptations' in statement for statement in statements))
+
+    def test_rebuild_matches_hook_maintained_index(self):
+        db.session.add(ReadingList(userID=self.reader.UserId, bookID=self.book.BookId))
+        db.session.commit()
+        before = set(db.session.execute(db.select(NotificationSubscription.__table__)).all())
+
+        report = SubscriptionIndex().rebuild()
+        after = set(db.session.execute(db.select(NotificationSubscription.__table__)).all())
+        self.assertEqual(before, after)
+        self.assertEqual(report, {'genre': 3, 'book': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
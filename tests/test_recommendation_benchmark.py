@@ -0,0 +1,53 @@
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from app.utils.recommendation_benchmark import (generate_dataset, held_out, percentile,
+                                                precision_recall_at_k, compare_results)
+
+
+class TestRecommendationBenchmark(unittest.TestCase):
+    def test_dataset_is_deterministic_and_deduplicated(self):
+        first = generate_dataset(5000, seed=7)
+        second = generate_dataset(5000, seed=7)
+        np.testing.assert_array_equal(first['watch_movie'], second['watch_movie'])
+        pairs = set(zip(first['watch_user'].tolist(), first['watch_movie'].tolist()))
+        self.assertEqual(len(pairs), 5000)
+        self.assertGreaterEqual(first['watch_movie'].min(), 1)
+        self.assertLessEqual(first['watch_movie'].max(), first['n_movies'])
+
+    def test_holdout_is_each_users_most_recent_watches(self):
+        dataset = generate_dataset(5000, seed=3)
+        for user_id in list(held_out(dataset))[:20]:
+            mine = dataset['watch_user'] == user_id
+            train_times = dataset['watch_time'][mine & dataset['train']]
+            test_times = dataset['watch_time'][mine & ~dataset['train']]
+            self.assertTrue(len(train_times) and len(test_times))
+            self.assertLess(train_times.max(), test_times.min())
+
+    def test_percentile(self):
+        values = [float(v) for v in range(1, 101)]
+        self.assertAlmostEqual(percentile(values, 50), 50.5)
+        self.assertAlmostEqual(percentile(values, 95), 95.05)
+        self.assertEqual(percentile([], 50), 0.0)
+
+    def test_precision_recall_at_k(self):
+        precision, recall = precision_recall_at_k([1, 2, 3, 4], {2, 4, 9}, k=4)
+        self.assertAlmostEqual(precision, 0.5)
+        self.assertAlmostEqual(recall, 2 / 3)
+
+    def test_compare_results(self):
+        baseline = {'engines': {'popularity': {'latency_ms': {'p50': 2.0}, 'precision_at_10': 0.1}}}
+        current = {'engines': {'popularity': {'latency_ms': {'p50': 1.0}, 'precision_at_10': 0.1},
+                               'new_engine': {'precision_at_10': 0.3}}}
+        comparison = compare_results(baseline, current)
+        self.assertEqual(list(comparison), ['popularity'])
+        self.assertEqual(comparison['popularity']['latency_ms.p50']['change_pct'], -50.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
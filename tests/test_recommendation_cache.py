@@ -0,0 +1,115 @@
+import unittest
+import sys
+import os
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.models import User, Movie, WatchHistory, UserRecommendation
+from app.services.recommendation_cache import RecommendationCache
+from app.services.recommendation_service import RecommendationService
+from app.services.trending_service import TrendingService
+from tests.test_config import TestConfig
+
+
+class TestRecommendationCache(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config.from_object(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        TrendingService._instance = None
+
+        self.user = User(Username='viewer', Email='viewer@example.com')
+        self.movies = [
+            Movie(title='Pride and Prejudice', tmdb_id=4348, genres=['Drama', 'Romance']),
+            Movie(title='Atonement', tmdb_id=4347, genres=['Drama', 'Romance']),
+            Movie(title='Little Women', tmdb_id=331482, genres=['Drama']),
+            Movie(title='Alien', tmdb_id=348, genres=['Horror', 'Science Fiction']),
+        ]
+        db.session.add_all([self.user] + self.movies)
+        db.session.commit()
+        self.user_id = self.user.UserId
+
+    def tearDown(self):
+        TrendingService._instance = None
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _watch(self, movie):
+        db.session.add(WatchHistory(userID=self.user_id, movieID=movie.movieID))
+        db.session.commit()
+
+    def _wait_fresh(self, timeout=10):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            db.session.expire_all()
+            entry = db.session.get(UserRecommendation, self.user_id)
+            if entry is not None and not entry.is_stale:
+                return entry
+            time.sleep(0.05)
+        raise AssertionError('Entry was not refreshed')
+
+    def test_genres_persist_and_drive_content_recommendations(self):
+        self._watch(self.movies[0])
+        db.session.expire_all()
+        titles = [r['title'] for r in RecommendationService().get_recommendations(db.session.get(User, self.user_id))]
+        self.assertEqual(titles[0], 'Atonement')
+        self.assertIn('Little Women', titles)
+
+    def test_miss_computes_then_hits(self):
+        self._watch(self.movies[0])
+        cache = RecommendationCache()
+        first = cache.get(self.user_id)
+        self.assertFalse(first['stale'])
+        self.assertEqual(first['recommendations'][0]['title'], 'Atonement')
+        self.assertFalse(cache.get(self.user_id)['stale'])
+
+    def test_history_write_invalidates_and_refresher_recomputes(self):
+        self._watch(self.movies[0])
+        cache = RecommendationCache()
+        cache.get(self.user_id)
+
+        self._watch(self.movies[1])
+        self.assertTrue(cache.get(self.user_id)['stale'])
+        entry = self._wait_fresh()
+        self.assertNotIn('Atonement', [r['title'] for r in entry.recommendations])
+        self.assertFalse(cache.get(self.user_id)['stale'])
+
+    def test_cold_start_serves_trending_without_caching(self):
+        other = User(Username='other', Email='other@example.com')
+        db.session.add(other)
+        db.session.commit()
+        db.session.add(WatchHistory(userID=other.UserId, movieID=self.movies[3].movieID))
+        db.session.commit()
+
+        cache = RecommendationCache()
+        first = cache.get(self.user_id)
+        self.assertEqual([r['title'] for r in first['recommendations']], ['Alien'])
+        self.assertTrue(first['recommendations'][0]['trending'])
+        self.assertIsNone(db.session.get(UserRecommendation, self.user_id))
+
+        # Trending moves on; the cold-start user is not pinned to the first answer
+        for _ in range(2):
+            db.session.add(WatchHistory(userID=other.UserId, movieID=self.movies[2].movieID))
+            db.session.commit()
+        titles = [r['title'] for r in cache.get(self.user_id)['recommendations']]
+        self.assertEqual(titles, ['Little Women', 'Alien'])
+
+    def test_refresh_drops_entry_once_history_is_gone(self):
+        self._watch(self.movies[0])
+        cache = RecommendationCache()
+        cache.get(self.user_id)
+
+        WatchHistory.query.filter_by(userID=self.user_id).delete()
+        cache.invalidate(self.user_id)
+        db.session.commit()
+        self.assertIsNone(cache.refresh(self.user_id))
+        self.assertIsNone(db.session.get(UserRecommendation, self.user_id))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+import sys
+import os
+from datetime import date, datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.models import User, Movie, Book, WatchHistory, ReadHistory, Review
+from app.services.report_engine import ReportEngine
+from tests.test_config import TestConfig
+
+
+class TestReportEngine(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config.from_object(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        ReportEngine().clear()
+
+        self.users = [User(Username=f'user{i}', Email=f'user{i}@example.com') for i in range(3)]
+        movie, book = Movie(title='Emma', tmdb_id=556574), Book(Title='Emma')
+        db.session.add_all(self.users + [movie, book])
+        db.session.commit()
+        first, second, third = (u.UserId for u in self.users)
+        db.session.add_all([
+            WatchHistory(userID=first, movieID=movie.movieID, watched_date=datetime(2024, 5, 1, 20)),
+            WatchHistory(userID=first, movieID=movie.movieID, watched_date=datetime(2024, 5, 2, 20)),
+            ReadHistory(userID=first, bookID=book.BookId, read_date=datetime(2024, 5, 2, 8)),
+            ReadHistory(userID=second, bookID=book.BookId, read_date=datetime(2024, 5, 3, 8)),
+            WatchHistory(userID=third, movieID=movie.movieID, watched_date=datetime(2024, 5, 9, 20)),
+        ])
+        review = Review(UserId=second, Rating=4, Comment='Lovely', BookId=book.BookId)
+        review.CreatedAt = datetime(2024, 5, 3, 9)
+        db.session.add(review)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_distinct_users_across_activity_types(self):
+        report = ReportEngine().report(date(2024, 5, 1), date(2024, 5, 8))
+        self.assertEqual(report['period']['days'], 7)
+        self.assertEqual(report['user_metrics']['active_users'], 2)
+        self.assertEqual(report['user_metrics']['watchers'], 1)
+        self.assertEqual(report['user_metrics']['readers'], 2)
+        self.assertEqual(report['user_metrics']['reviewers'], 1)
+        self.assertEqual(report['activity_metrics']['watches'], 2)
+        self.assertEqual(report['activity_metrics']['reads'], 2)
+        self.assertEqual(report['activity_metrics']['average_rating'], 4.0)
+
+    def test_window_end_is_exclusive(self):
+        report = ReportEngine().report('2024-05-02', '2024-05-09')
+        self.assertEqual(report['activity_metrics']['watches'], 1)
+        self.assertEqual(report['user_metrics']['active_users'], 2)
+
+    def test_finished_windows_are_cached(self):
+        engine = ReportEngine()
+        first = engine.report(date(2024, 5, 1), date(2024, 5, 10))
+        hits = engine.get_metrics()['hits']
+        self.assertIs(engine.report(datetime(2024, 5, 1, 12), date(2024, 5, 10)), first)
+        self.assertEqual(engine.get_metrics()['hits'], hits + 1)
+
+    def test_empty_window_is_rejected(self):
+        with self.assertRaises(ValueError):
+            ReportEngine().report(date(2024, 5, 2), date(2024, 5, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
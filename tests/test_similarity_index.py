@@ -0,0 +1,179 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+import time
+from unittest.mock import patch
+
+# Add parent directory to path to import app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.models import Movie
+from app.services.similarity_index import SimilarityIndex, tokenize
+from tests.test_config import TestConfig
+
+MOVIES = [
+    (1, "Dune A young duke fights for control of the desert planet Arrakis and its spice"),
+    (2, "Arrival A linguist works to communicate with alien visitors"),
+    (3, "Blade Runner A detective hunts rogue replicants in a dystopian city"),
+]
+BOOKS = [
+    (1, "Dune Paul Atreides and the desert planet Arrakis, source of the spice melange"),
+    (2, "Do Androids Dream of Electric Sheep A bounty hunter retires rogue androids"),
+]
+
+
+def fake_rows(movies, books):
+    def rows_since(high_water):
+        for kind, rows in (('movie', movies), ('book', books), ('adaptation', [])):
+            yield kind, [(ref, text) for ref, text in rows if ref > high_water.get(kind, 0)]
+    return rows_since
+
+
+def fake_ids(movies, books):
+    def existing_ids():
+        for kind, rows in (('movie', movies), ('book', books), ('adaptation', [])):
+            yield kind, {ref for ref, _ in rows}
+    return existing_ids
+
+
+class TestSimilarityIndex(unittest.TestCase):
+    def setUp(self):
+        SimilarityIndex._instance = None
+        self.index = SimilarityIndex()
+        self.index.n_features = 2 ** 12
+        self.path = os.path.join(tempfile.mkdtemp(), 'index')
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.path), ignore_errors=True)
+        SimilarityIndex._instance = None
+
+    def test_tokenize_adds_bigrams_and_drops_stopwords(self):
+        """Test tokenization of overview text"""
+        self.assertEqual(tokenize("The Desert Planet"), ['desert', 'planet', 'desert planet'])
+        self.assertEqual(tokenize(None), [])
+
+    def test_rebuild_persists_and_memory_maps(self):
+        """Test the base segment is written to disk and reopened via mmap"""
+        with patch.object(SimilarityIndex, '_rows_since', staticmethod(fake_rows(MOVIES, BOOKS))):
+            meta = self.index.rebuild(self.path)
+        self.assertEqual(meta['n_docs'], 5)
+        self.assertTrue(os.path.exists(os.path.join(self.path, 'postings_doc.npy')))
+
+        SimilarityIndex._instance = None
+        reloaded = SimilarityIndex()
+        reloaded.load(self.path)
+        self.assertEqual(reloaded.size, 5)
+        results = reloaded.more_like_this('movie', 1, k=2)
+        self.assertEqual((results[0]['kind'], results[0]['id']), ('book', 1))
+
+    def test_more_like_this_respects_kinds_and_excludes_self(self):
+        """Test cosine top-k queries filtered by document kind"""
+        with patch.object(SimilarityIndex, '_rows_since', staticmethod(fake_rows(MOVIES, BOOKS))):
+            self.index.rebuild(self.path)
+        results = self.index.more_like_this('book', 2, k=5, kinds=['movie'])
+        self.assertTrue(results)
+        self.assertTrue(all(r['kind'] == 'movie' for r in results))
+        self.assertEqual(results[0]['id'], 3)
+        self.assertNotIn(('book', 2), [(r['kind'], r['id']) for r in results])
+
+    def test_refresh_adds_new_rows_to_delta(self):
+        """Test incremental refresh picks up rows above the high-water mark"""
+        with patch.object(SimilarityIndex, '_rows_since', staticmethod(fake_rows(MOVIES, BOOKS))):
+            self.index.rebuild(self.path)
+        new_movies = MOVIES + [(4, "Dune Part Two Paul unites with the Fremen on the desert planet Arrakis")]
+        with patch.object(SimilarityIndex, '_rows_since', staticmethod(fake_rows(new_movies, BOOKS))), \
+                patch.object(SimilarityIndex, '_existing_ids', staticmethod(fake_ids(new_movies, BOOKS))):
+            self.assertEqual(self.index.refresh(), 1)
+            self.assertEqual(self.index.refresh(), 0)
+        self.assertEqual(self.index.size, 6)
+        ids = [(r['kind'], r['id']) for r in self.index.more_like_this('movie', 4, k=2)]
+        self.assertIn(('movie', 1), ids)
+
+    def test_rebuild_by_another_process_is_remapped(self):
+        """Test a process picks up a segment rebuilt elsewhere on its next lookup"""
+        with patch.object(SimilarityIndex, '_rows_since', staticmethod(fake_rows(MOVIES, BOOKS))):
+            self.index.rebuild(self.path)
+        self.assertEqual(self.index.size, 5)
+
+        # Stands in for the scheduler leader, which rebuilds the shared files
+        leader = object.__new__(SimilarityIndex)
+        leader._initialize()
+        leader.n_features = self.index.n_features
+        new_movies = MOVIES + [(4, "Dune Part Two Paul unites with the Fremen on the desert planet Arrakis")]
+        with patch.object(SimilarityIndex, '_rows_since', staticmethod(fake_rows(new_movies, BOOKS))):
+            leader.rebuild(self.path)
+
+        self.assertEqual(self.index.size, 5)
+        self.index._next_reload_check = 0.0
+        self.assertEqual(self.index.size, 6)
+        self.assertEqual(self.index._high_water['movie'], 4)
+
+    def test_query_latency(self):
+        """Test a similarity lookup stays well under 10 ms"""
+        movies = [(i, f"movie {i} about topic{i % 50} and theme{i % 7} in place{i % 13}")
+                  for i in range(1, 5001)]
+        with patch.object(SimilarityIndex, '_rows_since', staticmethod(fake_rows(movies, []))):
+            self.index.rebuild(self.path)
+        start = time.perf_counter()
+        for ref in range(1, 101):
+            self.index.more_like_this('movie', ref, k=10)
+        self.assertLess((time.perf_counter() - start) / 100, 0.01)
+
+
+class TestSimilarityIndexRefresh(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config.from_object(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        SimilarityIndex._instance = None
+        self.index = SimilarityIndex()
+        self.index.n_features = 2 ** 12
+        self.path = os.path.join(tempfile.mkdtemp(), 'index')
+
+        self.movies = [Movie(title=text.split(' A ')[0], tmdb_id=ref, overview=text) for ref, text in MOVIES]
+        db.session.add_all(self.movies)
+        db.session.commit()
+        self.ids = [movie.movieID for movie in self.movies]
+        self.index.rebuild(self.path)
+
+    def tearDown(self):
+        SimilarityIndex._instance = None
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(os.path.dirname(self.path), ignore_errors=True)
+
+    def test_edited_rows_are_reindexed(self):
+        """Test a committed overview edit replaces the document at the next refresh"""
+        arrival, blade_runner = self.ids[1], self.ids[2]
+        self.assertNotIn(blade_runner, [r['id'] for r in self.index.more_like_this('movie', arrival)])
+
+        db.session.get(Movie, arrival).overview = "A detective hunts rogue replicants through the city"
+        db.session.commit()
+        self.assertEqual(self.index.refresh(), 1)
+
+        results = self.index.more_like_this('movie', arrival)
+        self.assertEqual(results[0]['id'], blade_runner)
+        self.assertEqual(self.index.size, 3)
+
+    def test_deleted_rows_are_tombstoned(self):
+        """Test a deleted movie stops matching and is no longer counted"""
+        dune, blade_runner = self.ids[0], self.ids[2]
+        db.session.delete(db.session.get(Movie, blade_runner))
+        db.session.commit()
+
+        self.assertEqual(self.index.refresh(), 1)
+        self.assertEqual(self.index.size, 2)
+        self.assertEqual(self.index.more_like_this('movie', blade_runner), [])
+        self.assertNotIn(blade_runner, [r['id'] for r in self.index.search_text('replicants city')])
+        self.assertEqual(self.index.refresh(), 0)
+        self.assertNotIn(blade_runner, [r['id'] for r in self.index.more_like_this('movie', dune)])
+
+
+if __name__ == '__main__':
+    unittest.main()
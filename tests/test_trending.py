@@ -0,0 +1,109 @@
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from unittest.mock import patch
+
+from sqlalchemy.exc import IntegrityError
+
+from app import create_app, db
+from app.models import Movie, MovieAdaptation, TrendingCounter
+from app.services.trending_service import DecayedTopK, TrendingService
+from tests.test_config import TestConfig
+
+
+class TestDecayedTopK(unittest.TestCase):
+    def test_top_orders_by_score(self):
+        counter = DecayedTopK(half_life=3600, landmark=0.0)
+        counter.add(1, 1.0, 0.0)
+        counter.add(2, 3.0, 0.0)
+        counter.add(3, 2.0, 0.0)
+        counter.add(1, 5.0, 0.0)
+        self.assertEqual([key for key, _ in counter.top(2, 0.0)], [1, 2])
+
+    def test_scores_halve_after_one_half_life(self):
+        counter = DecayedTopK(half_life=3600, landmark=0.0)
+        counter.add(1, 4.0, 0.0)
+        self.assertAlmostEqual(counter.score(1, 3600.0), 2.0)
+
+    def test_recent_activity_outranks_older_activity(self):
+        counter = DecayedTopK(half_life=3600, landmark=0.0)
+        counter.add(1, 3.0, 0.0)
+        counter.add(2, 2.0, 7200.0)
+        self.assertEqual(counter.top(1, 7200.0)[0][0], 2)
+
+    def test_rescale_keeps_scores_and_order(self):
+        counter = DecayedTopK(half_life=60, landmark=0.0)
+        counter.add(1, 1.0, 0.0)
+        counter.add(2, 2.0, 30.0)
+        before = counter.top(2, 120.0)
+        counter.rescale(90.0)
+        after = counter.top(2, 120.0)
+        self.assertEqual([k for k, _ in before], [k for k, _ in after])
+        for (_, a), (_, b) in zip(before, after):
+            self.assertAlmostEqual(a, b)
+
+
+class TestTrendingService(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config.from_object(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        TrendingService._instance = None
+
+        self.movie = Movie(title='Dune', tmdb_id=438631)
+        db.session.add(self.movie)
+        db.session.commit()
+
+    def tearDown(self):
+        TrendingService._instance = None
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _stored_score(self):
+        db.session.expire_all()
+        return db.session.get(TrendingCounter, ('movie', self.movie.movieID, 'day')).Score
+
+    def test_checkpoints_from_two_processes_add_up(self):
+        TrendingService().record('movie', self.movie.movieID, 3.0)
+        TrendingService().checkpoint()
+
+        # A second process starts from the table and merges its own increments
+        TrendingService._instance = None
+        TrendingService().record('movie', self.movie.movieID, 2.0)
+        TrendingService().checkpoint()
+
+        self.assertAlmostEqual(self._stored_score(), 5.0, places=2)
+        self.assertAlmostEqual(TrendingService().top('movie')[0]['score'], 5.0, places=2)
+
+    def test_failed_checkpoint_keeps_increments(self):
+        service = TrendingService()
+        service.record('movie', self.movie.movieID, 3.0)
+        with patch.object(TrendingService, '_merge_once', side_effect=IntegrityError('insert', {}, None)):
+            with self.assertRaises(IntegrityError):
+                service.checkpoint()
+
+        self.assertEqual(service.checkpoint(), 2)
+        self.assertAlmostEqual(self._stored_score(), 3.0, places=2)
+
+    def test_adaptation_links_wait_for_commit(self):
+        movie_id = self.movie.movieID
+        db.session.add(MovieAdaptation(Title='Dune', movieID=movie_id))
+        db.session.flush()
+        self.assertEqual(TrendingService()._movie_adaptations.get(movie_id), None)
+        db.session.rollback()
+        self.assertEqual(TrendingService()._movie_adaptations.get(movie_id), None)
+
+        adaptation = MovieAdaptation(Title='Dune', movieID=movie_id)
+        db.session.add(adaptation)
+        db.session.commit()
+        self.assertEqual(TrendingService()._movie_adaptations[movie_id], [adaptation.MovieAdaptationId])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+import sys
+import os
+import csv
+import gzip
+import io
+import json
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.models import User, Movie, Book, WatchHistory, ReadHistory, Review, Watchlist
+from app.utils.user_export import COLUMNS, iter_user_export
+from tests.test_config import TestConfig
+
+
+class TestUserExport(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config.from_object(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.user = User(Username='reader', Email='reader@example.com')
+        movie, book = Movie(title='Dune', tmdb_id=438631), Book(Title='Dune, the novel')
+        db.session.add_all([self.user, movie, book])
+        db.session.commit()
+        uid = self.user.UserId
+        db.session.add_all(
+            [WatchHistory(userID=uid, movieID=movie.movieID, watched_date=datetime(2024, 6, 1, day % 24))
+             for day in range(25)]
+            + [ReadHistory(userID=uid, bookID=book.BookId, read_date=datetime(2024, 6, 2)),
+               Watchlist(userID=uid, movieID=movie.movieID, added_date=datetime(2024, 6, 3))]
+        )
+        db.session.add(Review(UserId=uid, Rating=4, Comment='Sand, "lots" of it', movieID=movie.movieID))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_csv_streams_every_row_in_chunks(self):
+        pieces = list(iter_user_export(self.user.UserId, 'csv', chunk_size=10))
+        rows = list(csv.reader(io.StringIO(b''.join(pieces).decode())))
+        self.assertEqual(tuple(rows[0]), COLUMNS)
+        self.assertEqual(len(rows) - 1, 28)
+        self.assertGreater(len(pieces), 4)
+        review = next(row for row in rows if row[0] == 'review')
+        self.assertEqual(review[6], 'Dune')
+        self.assertEqual(review[8], 'Sand, "lots" of it')
+        self.assertEqual(next(row for row in rows if row[0] == 'read')[6], 'Dune, the novel')
+
+    def test_gzipped_jsonl(self):
+        data = b''.join(iter_user_export(self.user.UserId, 'jsonl', gzip=True, chunk_size=7))
+        records = [json.loads(line) for line in gzip.decompress(data).decode().splitlines()]
+        self.assertEqual(len(records), 28)
+        self.assertEqual({r['type'] for r in records}, {'watch', 'read', 'review', 'watchlist'})
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            iter_user_export(self.user.UserId, 'xml')
+
+
+if __name__ == '__main__':
+    unittest.main()